@@ -78,18 +78,30 @@ def loadShowsFromDB():
     Populates the showList with shows from the database
     """
 
+    startTime = time.time()
+
     myDB = db.DBConnection()
     sqlResults = myDB.select("SELECT * FROM tv_shows")
 
+    # the shows are built straight from their rows, nothing needs to be looked up or saved again
+    loadedShows = set([x.tvdbid for x in sickbeard.showList])
+
     for sqlShow in sqlResults:
+        tvdb_id = int(sqlShow["tvdb_id"])
+
+        if tvdb_id in loadedShows:
+            logger.log(u"Show " + str(tvdb_id) + " is in the database more than once, skipping it", logger.WARNING)
+            continue
+
         try:
-            curShow = TVShow(int(sqlShow["tvdb_id"]))
+            curShow = TVShow(tvdb_id, dbResult=sqlShow)
             sickbeard.showList.append(curShow)
+            loadedShows.add(tvdb_id)
         except Exception, e:
             logger.log(u"There was an error creating the show in " + sqlShow["location"] + ": " + str(e).decode('utf-8'), logger.ERROR)
             logger.log(traceback.format_exc(), logger.DEBUG)
 
-        # TODO: update the existing shows if the showlist has something in it
+    logger.log(u"Loaded " + str(len(sickbeard.showList)) + " shows in " + str(round(time.time() - startTime, 2)) + " seconds")
 
 
 def daemonize():
@@ -130,6 +142,8 @@ def main():
     TV for me
     """
 
+    startTime = time.time()
+
     # do some preliminary stuff
     sickbeard.MY_FULLNAME = os.path.normpath(os.path.abspath(__file__))
     sickbeard.MY_NAME = os.path.basename(sickbeard.MY_FULLNAME)
@@ -336,6 +350,8 @@ def main():
     # Fire up all our threads
     sickbeard.start()
 
+    logger.log(u"Sick Beard started in " + str(round(time.time() - startTime, 2)) + " seconds")
+
     # Launch browser if we're supposed to
     if sickbeard.LAUNCH_BROWSER and not noLaunch and not sickbeard.DAEMON:
         sickbeard.launchBrowser(startPort)
@@ -38,6 +38,8 @@ from sickbeard import searchCurrent, searchBacklog, showUpdater, versionChecker,
 from sickbeard import helpers, db, exceptions, show_queue, search_queue, scheduler
 from sickbeard import logger
 from sickbeard import naming
+from sickbeard import scene_numbering
+from sickbeard import db_maintenance
 
 from common import SD, SKIPPED, NAMING_REPEAT
 
@@ -78,6 +80,8 @@ searchQueueScheduler = None
 properFinderScheduler = None
 autoPostProcesserScheduler = None
 torrentProcessScheduler = None
+xemRefreshScheduler = None
+dbMaintenanceScheduler = None
 
 showList = None
 loadingShowList = None
@@ -158,6 +162,27 @@ BACKLOG_SEARCH_FREQUENCY = 21
 MIN_SEARCH_FREQUENCY = 10
 DEFAULT_SEARCH_FREQUENCY = 60
 
+# how long after startup (in seconds) the searches and the version/scene exception check which would
+# run straight away wait, so they don't slow down loading the shows and the first pages
+STARTUP_DELAY = 60
+
+# how often (in minutes) the backlog hands the next part of its planned searches to the search queue
+BACKLOG_DISPATCH_FREQUENCY = 60
+
+# requests per hour allowed to each provider (0 is unlimited) and per provider overrides, see request_budget
+PROVIDER_REQUESTS_PER_HOUR = 0
+PROVIDER_BUDGETS = ''
+
+# minutes provider search results are cached for (0 turns the cache off) and the most memory the cache can use in MB
+QUERY_CACHE_TTL = 10
+QUERY_CACHE_SIZE = 5
+
+# most episode objects kept in memory across all the shows (0 is unlimited), see episode_cache
+EPISODE_CACHE_SIZE = 20000
+
+# DB statements taking at least this many milliseconds go in the slow query log (0 turns it off), see instrumentation
+DB_SLOW_QUERY_MS = 250
+
 USE_LIBTORRENT = False
 LIBTORRENT_AVAILABLE = False
 LIBTORRENT_WORKING_DIR = None
@@ -366,12 +391,13 @@ def initialize(consoleLogging=True):
                 PLEX_SERVER_HOST, PLEX_HOST, PLEX_USERNAME, PLEX_PASSWORD, \
                 showUpdateScheduler, __INITIALIZED__, LAUNCH_BROWSER, showList, loadingShowList, \
                 USE_LIBTORRENT, LIBTORRENT_AVAILABLE, LIBTORRENT_WORKING_DIR, LIBTORRENT_SEED_TO_RATIO, \
-                LIBTORRENT_MAX_DL_SPEED, LIBTORRENT_MAX_UL_SPEED, torrentProcessScheduler, PREFER_MAGNETS, \
+                LIBTORRENT_MAX_DL_SPEED, LIBTORRENT_MAX_UL_SPEED, torrentProcessScheduler, xemRefreshScheduler, dbMaintenanceScheduler, PREFER_MAGNETS, \
                 LIBTORRENT_PORT_MIN, LIBTORRENT_PORT_MAX, \
                 SHOWRSS, KAT, PUBLICHD, \
                 NZBS, NZBS_UID, NZBS_HASH, EZRSS, TVTORRENTS, TVTORRENTS_DIGEST, TVTORRENTS_HASH, BTN, BTN_API_KEY, TORRENTLEECH, TORRENTLEECH_KEY, \
                 TORRENT_DIR, USENET_RETENTION, SOCKET_TIMEOUT, \
-                SEARCH_FREQUENCY, DEFAULT_SEARCH_FREQUENCY, BACKLOG_SEARCH_FREQUENCY, \
+                SEARCH_FREQUENCY, DEFAULT_SEARCH_FREQUENCY, BACKLOG_SEARCH_FREQUENCY, BACKLOG_DISPATCH_FREQUENCY, \
+                PROVIDER_REQUESTS_PER_HOUR, PROVIDER_BUDGETS, QUERY_CACHE_TTL, QUERY_CACHE_SIZE, EPISODE_CACHE_SIZE, DB_SLOW_QUERY_MS, \
                 QUALITY_DEFAULT, FLATTEN_FOLDERS_DEFAULT, STATUS_DEFAULT, \
                 GROWL_NOTIFY_ONSNATCH, GROWL_NOTIFY_ONDOWNLOAD, TWITTER_NOTIFY_ONSNATCH, TWITTER_NOTIFY_ONDOWNLOAD, \
                 USE_GROWL, GROWL_HOST, GROWL_PASSWORD, USE_PROWL, PROWL_NOTIFY_ONSNATCH, PROWL_NOTIFY_ONDOWNLOAD, PROWL_API, PROWL_PRIORITY, PROG_DIR, NZBMATRIX, NZBMATRIX_USERNAME, \
@@ -496,6 +522,13 @@ def initialize(consoleLogging=True):
         if SEARCH_FREQUENCY < MIN_SEARCH_FREQUENCY:
             SEARCH_FREQUENCY = MIN_SEARCH_FREQUENCY
 
+        PROVIDER_REQUESTS_PER_HOUR = check_setting_int(CFG, 'General', 'provider_requests_per_hour', 0)
+        PROVIDER_BUDGETS = check_setting_str(CFG, 'General', 'provider_budgets', '')
+        QUERY_CACHE_TTL = check_setting_int(CFG, 'General', 'query_cache_ttl', 10)
+        QUERY_CACHE_SIZE = check_setting_int(CFG, 'General', 'query_cache_size', 5)
+        EPISODE_CACHE_SIZE = check_setting_int(CFG, 'General', 'episode_cache_size', 20000)
+        DB_SLOW_QUERY_MS = check_setting_int(CFG, 'General', 'db_slow_query_ms', 250)
+
         TV_DOWNLOAD_DIR = check_setting_str(CFG, 'General', 'tv_download_dir', '')
         PROCESS_AUTOMATICALLY = check_setting_int(CFG, 'General', 'process_automatically', 0)
         RENAME_EPISODES = check_setting_int(CFG, 'General', 'rename_episodes', 1)
@@ -855,11 +888,13 @@ def initialize(consoleLogging=True):
         if not PROCESS_AUTOMATICALLY:
             autoPostProcesserScheduler.silent = True
 
+        # the backlog is planned every get_backlog_cycle_time() minutes and dispatched bit by bit in between
         backlogSearchScheduler = searchBacklog.BacklogSearchScheduler(searchBacklog.BacklogSearcher(),
-                                                                      cycleTime=datetime.timedelta(minutes=get_backlog_cycle_time()),
+                                                                      cycleTime=datetime.timedelta(minutes=BACKLOG_DISPATCH_FREQUENCY),
                                                                       threadName="BACKLOG",
                                                                       runImmediately=True)
         backlogSearchScheduler.action.cycleTime = BACKLOG_SEARCH_FREQUENCY
+        backlogSearchScheduler.action.planFrequency = datetime.timedelta(minutes=get_backlog_cycle_time())
         
         torrentProcessScheduler = scheduler.Scheduler(downloader.TorrentProcessHandler(),
                                                      cycleTime=datetime.timedelta(seconds=5),
@@ -867,6 +902,18 @@ def initialize(consoleLogging=True):
                                                      runImmediately=False,
                                                      silent=True)
 
+        xemRefreshScheduler = scheduler.Scheduler(scene_numbering.XEMRefresher(),
+                                                  cycleTime=datetime.timedelta(minutes=scene_numbering.XEM_REFRESH_FREQUENCY),
+                                                  threadName="XEMREFRESHER",
+                                                  runImmediately=True,
+                                                  silent=True)
+
+        dbMaintenanceScheduler = scheduler.Scheduler(db_maintenance.DBMaintainer(),
+                                                     cycleTime=datetime.timedelta(hours=db_maintenance.DB_MAINTENANCE_FREQUENCY),
+                                                     threadName="DBMAINTENANCE",
+                                                     runImmediately=False,
+                                                     silent=True)
+
         showList = []
         loadingShowList = {}
 
@@ -879,13 +926,18 @@ def start():
     global __INITIALIZED__, currentSearchScheduler, backlogSearchScheduler, \
             showUpdateScheduler, versionCheckScheduler, showQueueScheduler, \
             properFinderScheduler, autoPostProcesserScheduler, searchQueueScheduler, \
-            torrentProcessScheduler, \
+            torrentProcessScheduler, xemRefreshScheduler, dbMaintenanceScheduler, \
             started
 
     with INIT_LOCK:
 
         if __INITIALIZED__:
 
+            # the network heavy jobs which are due straight away can wait until the UI is up
+            for curScheduler in (currentSearchScheduler, backlogSearchScheduler, versionCheckScheduler, xemRefreshScheduler):
+                if curScheduler.timeLeft() <= datetime.timedelta(seconds=STARTUP_DELAY):
+                    curScheduler.delayRun(datetime.timedelta(seconds=STARTUP_DELAY))
+
             # start the search scheduler
             currentSearchScheduler.thread.start()
 
@@ -913,6 +965,12 @@ def start():
             # thread for controlling running torrents
             torrentProcessScheduler.thread.start()
 
+            # start the xem numbering refresher
+            xemRefreshScheduler.thread.start()
+
+            # start the database maintenance
+            dbMaintenanceScheduler.thread.start()
+
             started = True
 
 
@@ -920,7 +978,7 @@ def halt():
 
     global __INITIALIZED__, currentSearchScheduler, backlogSearchScheduler, showUpdateScheduler, \
             showQueueScheduler, properFinderScheduler, autoPostProcesserScheduler, searchQueueScheduler, \
-            torrentProcessScheduler, \
+            torrentProcessScheduler, xemRefreshScheduler, dbMaintenanceScheduler, \
             started
 
     with INIT_LOCK:
@@ -992,6 +1050,20 @@ def halt():
             except:
                 pass
             
+            xemRefreshScheduler.abort = True
+            logger.log(u"Waiting for the XEMREFRESHER thread to exit")
+            try:
+                xemRefreshScheduler.thread.join(10)
+            except:
+                pass
+
+            dbMaintenanceScheduler.abort = True
+            logger.log(u"Waiting for the DBMAINTENANCE thread to exit")
+            try:
+                dbMaintenanceScheduler.thread.join(10)
+            except:
+                pass
+
             torrentProcessScheduler.abort = True
             logger.log(u"Waiting for the %s thread to exit" % (torrentProcessScheduler.threadName))
             try:
@@ -1120,6 +1192,12 @@ def save_config():
     new_config['General']['nzb_method'] = NZB_METHOD
     new_config['General']['usenet_retention'] = int(USENET_RETENTION)
     new_config['General']['search_frequency'] = int(SEARCH_FREQUENCY)
+    new_config['General']['provider_requests_per_hour'] = int(PROVIDER_REQUESTS_PER_HOUR)
+    new_config['General']['provider_budgets'] = PROVIDER_BUDGETS
+    new_config['General']['query_cache_ttl'] = int(QUERY_CACHE_TTL)
+    new_config['General']['query_cache_size'] = int(QUERY_CACHE_SIZE)
+    new_config['General']['episode_cache_size'] = int(EPISODE_CACHE_SIZE)
+    new_config['General']['db_slow_query_ms'] = int(DB_SLOW_QUERY_MS)
     new_config['General']['download_propers'] = int(DOWNLOAD_PROPERS)
     new_config['General']['quality_default'] = int(QUALITY_DEFAULT)
     new_config['General']['status_default'] = int(STATUS_DEFAULT)
@@ -1408,7 +1486,7 @@ def getEpList(epIDs, showid=None):
 
     for curEp in sqlResults:
         curShowObj = helpers.findCertainShow(showList, int(curEp["showid"]))
-        curEpObj = curShowObj.getEpisode(int(curEp["season"]), int(curEp["episode"]))
+        curEpObj = curShowObj.getEpisode(int(curEp["season"]), int(curEp["episode"]), dbResult=curEp)
         epList.append(curEpObj)
 
     return epList
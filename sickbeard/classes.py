@@ -111,10 +111,27 @@ class NZBSearchResult(SearchResult):
 
 class NZBDataSearchResult(SearchResult):
     """
-    NZB result where the actual NZB XML data is stored in the extraInfo
+    NZB result where the actual NZB XML data is stored in the extraInfo, either as a string or
+    as a file-like object (the NZB splitter spools big NZBs to temporary files)
     """
     resultType = "nzbdata"
 
+    def getNZBData(self):
+        nzbData = self.extraInfo[0]
+
+        if hasattr(nzbData, 'read'):
+            nzbData.seek(0)
+            return nzbData.read()
+
+        return nzbData
+
+    def __str__(self):
+
+        if self.provider == None:
+            return "Invalid provider, unable to print self"
+
+        return self.provider.name + " @ " + self.url + "\n" + "NZB data for " + self.name + "\n"
+
 class TorrentSearchResult(SearchResult):
     """
     Torrent result with an URL to the torrent
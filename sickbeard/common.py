@@ -133,6 +133,31 @@ class Quality:
 
         return (sorted(anyQualities), sorted(bestQualities))
 
+    @staticmethod
+    def isFinalQuality(quality, showQuality):
+        """
+        Returns True if quality is the highest one in both the any/best quality lists of showQuality,
+        which means nothing better would ever be wanted.
+        """
+
+        anyQualities, bestQualities = Quality.splitQuality(showQuality)
+
+        # if there is a redownload that's higher than this then we definitely need to keep looking
+        if bestQualities and quality < max(bestQualities):
+            return False
+
+        # if there's no redownload that's higher (above) and this is the highest initial download then we're good
+        elif anyQualities and quality == max(anyQualities):
+            return True
+
+        # if this is the best redownload then we're done unless we have a higher initial download
+        elif bestQualities and quality == max(bestQualities):
+            return not (anyQualities and quality < max(anyQualities))
+
+        # if we got here than it's either not on the lists, they're empty, or it's lower than the highest required
+        else:
+            return False
+
     @staticmethod
     def nameQuality(name):
         name = os.path.basename(name)
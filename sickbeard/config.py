@@ -156,7 +156,7 @@ def change_SEARCH_FREQUENCY(freq):
     sickbeard.SEARCH_FREQUENCY = freq
 
     sickbeard.currentSearchScheduler.cycleTime = datetime.timedelta(minutes=sickbeard.SEARCH_FREQUENCY)
-    sickbeard.backlogSearchScheduler.cycleTime = datetime.timedelta(minutes=sickbeard.get_backlog_cycle_time())
+    sickbeard.backlogSearchScheduler.action.planFrequency = datetime.timedelta(minutes=sickbeard.get_backlog_cycle_time())
 
 
 def change_VERSION_NOTIFY(version_notify):
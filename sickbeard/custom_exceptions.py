@@ -12,6 +12,8 @@ def _check_for_schema():
     if not _schema_created:
         myDB = db.DBConnection()
         myDB.action('CREATE TABLE if not exists custom_exceptions (exception_id INTEGER PRIMARY KEY, tvdb_id INTEGER KEY, show_name TEXT)')
+        myDB.action('CREATE INDEX if not exists idx_custom_exceptions_tvdb_id ON custom_exceptions (tvdb_id)')
+        myDB.action('CREATE INDEX if not exists idx_custom_exceptions_show_name ON custom_exceptions (show_name COLLATE NOCASE)')
         _schema_created = True
  
 # fast dynamic cache (held in memory only)       
@@ -48,7 +50,7 @@ def get_custom_exception_by_name(show_name):
     _check_for_schema()
     
     # try the obvious case first
-    exception_result = myDB.select("SELECT tvdb_id FROM custom_exceptions WHERE LOWER(show_name) = ?", [show_name.lower()])
+    exception_result = myDB.select("SELECT tvdb_id FROM custom_exceptions WHERE show_name = ? COLLATE NOCASE", [show_name])
     if exception_result:
         return int(exception_result[0]["tvdb_id"])
 
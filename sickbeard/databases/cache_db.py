@@ -18,6 +18,12 @@
 
 from sickbeard import db
 
+def addProviderIndex(connection, providerName):
+    """
+    Indexes a provider's cache table on the show and season its results are looked up by
+    """
+    connection.action("CREATE INDEX IF NOT EXISTS idx_" + providerName + "_tvdbid_season ON " + providerName + " (tvdbid, season)")
+
 # Add new migrations at the bottom of the list; subclass the previous migration.
 class InitialSchema (db.SchemaUpgrade):
     def test(self):
@@ -48,4 +54,22 @@ class AddSceneNameCache(AddSceneExceptions):
         return self.hasTable("scene_names")
 
     def execute(self):
-        self.connection.action("CREATE TABLE scene_names (tvdb_id INTEGER, name TEXT)")
\ No newline at end of file
+        self.connection.action("CREATE TABLE scene_names (tvdb_id INTEGER, name TEXT)")
+
+class AddLookupIndexes(AddSceneNameCache):
+    def test(self):
+        return self.hasIndex("idx_scene_names_name")
+
+    def execute(self):
+        self.connection.action("CREATE INDEX IF NOT EXISTS idx_scene_names_name ON scene_names(name)")
+        self.connection.action("CREATE INDEX IF NOT EXISTS idx_scene_names_tvdb_id ON scene_names(tvdb_id)")
+        self.connection.action("CREATE INDEX IF NOT EXISTS idx_scene_exceptions_tvdb_id ON scene_exceptions(tvdb_id)")
+        self.connection.action("CREATE INDEX IF NOT EXISTS idx_scene_exceptions_show_name ON scene_exceptions(show_name COLLATE NOCASE)")
+
+        # the provider tables are made the first time they're used, along with their index, so only the existing ones need it
+        for curTable in self.connection.select("SELECT name FROM sqlite_master WHERE type = 'table'"):
+            curColumns = self.connection.tableInfo(curTable["name"])
+            if "tvdbid" in curColumns and "episodes" in curColumns:
+                addProviderIndex(self.connection, curTable["name"])
+
+        self.connection.action("ANALYZE")
\ No newline at end of file
@@ -19,13 +19,13 @@
 import sickbeard
 import os.path
 
-from sickbeard import db, common, helpers, logger
+from sickbeard import db, common, helpers, logger, history
 from sickbeard.providers.generic import GenericProvider
 
 from sickbeard import encodingKludge as ek
 from sickbeard.name_parser.parser import NameParser, InvalidNameException
 
-MAX_DB_VERSION = 12
+MAX_DB_VERSION = 17
 
 
 class MainSanityCheck(db.DBSanityCheck):
@@ -677,3 +677,90 @@ class Add1080pAndRawHDQualities(RenameSeasonFolders):
         # cleanup and reduce db if any previous data was removed
         logger.log(u"Performing a vacuum on the database.", logger.DEBUG)
         self.connection.action("VACUUM")
+
+
+class AddHistoryResourceKey(Add1080pAndRawHDQualities):
+    """ Adds a normalized release name column and indexes to the history so lookups don't have to scan it """
+
+    def test(self):
+        return self.checkDBVersion() >= 13
+
+    def execute(self):
+        backupDatabase(13)
+
+        if not self.hasColumn("history", "resource_key"):
+            self.addColumn("history", "resource_key", "TEXT", "")
+
+        logger.log(u"Adding the release keys to the history, please be patient", logger.MESSAGE)
+        ql = []
+        historyResults = self.connection.select("SELECT rowid, resource FROM history")
+        for cur_entry in historyResults:
+            ql.append(["UPDATE history SET resource_key = ? WHERE rowid = ?", [history.resourceKey(cur_entry["resource"]), cur_entry["rowid"]]])
+        self.connection.mass_action(ql)
+
+        self.connection.action("CREATE INDEX IF NOT EXISTS idx_history_resource_key ON history(resource_key);")
+        self.connection.action("CREATE INDEX IF NOT EXISTS idx_history_date ON history(date);")
+        self.connection.action("CREATE INDEX IF NOT EXISTS idx_history_showid_season_episode ON history(showid,season,episode);")
+
+        self.incDBVersion()
+
+
+class AddBacklogProgress(AddHistoryResourceKey):
+    """ Adds a table for the planned backlog searches which haven't been done yet """
+
+    def test(self):
+        return self.checkDBVersion() >= 14
+
+    def execute(self):
+        if not self.hasTable("backlog_progress"):
+            self.connection.action("CREATE TABLE backlog_progress (showid NUMERIC, segment TEXT, last_airdate NUMERIC, cost NUMERIC, PRIMARY KEY (showid, segment));")
+
+        self.incDBVersion()
+
+
+class AddEpisodeLastModified(AddBacklogProgress):
+    """ Adds the time each episode was last saved so API clients can get just the ones that changed """
+
+    def test(self):
+        return self.checkDBVersion() >= 15
+
+    def execute(self):
+        if not self.hasColumn("tv_episodes", "last_modified"):
+            self.addColumn("tv_episodes", "last_modified")
+        self.connection.action("UPDATE tv_episodes SET last_modified = 0 WHERE last_modified IS NULL;")
+
+        self.connection.action("CREATE INDEX IF NOT EXISTS idx_tv_episodes_last_modified ON tv_episodes(last_modified);")
+
+        self.incDBVersion()
+
+
+class AddLookupIndexes(AddEpisodeLastModified):
+    """ Adds indexes for the episode and custom exception lookups and gathers statistics for the query planner """
+
+    def test(self):
+        return self.checkDBVersion() >= 16
+
+    def execute(self):
+        self.connection.action("CREATE INDEX IF NOT EXISTS idx_tv_episodes_showid_season_episode ON tv_episodes(showid,season,episode);")
+
+        # this table is made the first time it's used, along with its indexes, so it might not be here yet
+        if self.hasTable("custom_exceptions"):
+            self.connection.action("CREATE INDEX IF NOT EXISTS idx_custom_exceptions_tvdb_id ON custom_exceptions(tvdb_id);")
+            self.connection.action("CREATE INDEX IF NOT EXISTS idx_custom_exceptions_show_name ON custom_exceptions(show_name COLLATE NOCASE);")
+
+        self.connection.action("ANALYZE;")
+
+        self.incDBVersion()
+
+
+class AddBacklogProviders(AddLookupIndexes):
+    """ Adds the providers each planned backlog search still has to be done with """
+
+    def test(self):
+        return self.checkDBVersion() >= 17
+
+    def execute(self):
+        if not self.hasColumn("backlog_progress", "providers"):
+            self.addColumn("backlog_progress", "providers", "TEXT", "")
+
+        self.incDBVersion()
@@ -23,15 +23,21 @@ import re
 import sqlite3
 import time
 import threading
+import traceback
 
 import sickbeard
 
 from sickbeard import encodingKludge as ek
+from sickbeard import instrumentation
 from sickbeard import logger
 from sickbeard.exceptions import ex
 
 db_lock = threading.Lock()
 
+# how many times each database has been changed since startup, see dataVersion
+_data_versions = {}
+_data_version_start = int(time.time())
+
 def dbFilename(filename="sickbeard.db", suffix=None):
     """
     @param filename: The sqlite database filename to use. If not specified,
@@ -44,6 +50,25 @@ def dbFilename(filename="sickbeard.db", suffix=None):
         filename = "%s.%s" % (filename, suffix)
     return ek.ek(os.path.join, sickbeard.DATA_DIR, filename)
 
+def _caller():
+    """
+    Returns where the query being run came from: the first function on the stack outside this module
+    """
+
+    for filename, line, function, text in reversed(traceback.extract_stack()): #@UnusedVariable
+        if os.path.basename(filename) not in ("db.py", "db.pyc"):
+            return "%s:%d %s()" % (os.path.basename(filename), line, function)
+
+    return None
+
+def dataVersion(filename="sickbeard.db"):
+    """
+    Returns a string that changes every time the database is written to (and every restart), so
+    anything made from what's in it only has to be made again when this is different.
+    """
+
+    return "%d.%d" % (_data_version_start, _data_versions.get(dbFilename(filename), 0))
+
 class DBConnection:
     def __init__(self, filename="sickbeard.db", suffix=None, row_type=None):
 
@@ -75,10 +100,14 @@ class DBConnection:
 
             sqlResult = []
             attempt = 0
+            changesBefore = self.connection.total_changes
+            logTransaction = logTransaction and logger.isEnabledFor(logger.DEBUG)
 
             while attempt < 5:
                 try:
+                    timings = []
                     for qu in querylist:
+                        startTime = time.time()
                         if len(qu) == 1:
                             if logTransaction:
                                 logger.log(qu[0], logger.DEBUG)
@@ -87,7 +116,13 @@ class DBConnection:
                             if logTransaction:
                                 logger.log(qu[0] + " with args " + str(qu[1]), logger.DEBUG)
                             sqlResult.append(self.connection.execute(qu[0], qu[1]))
+                        timings.append((qu, time.time() - startTime, sqlResult[-1].rowcount))
+                    startTime = time.time()
                     self.connection.commit()
+                    self._noteChanges(changesBefore)
+                    for qu, seconds, rows in timings:
+                        self._noteQuery(qu[0], qu[1:] and qu[1] or None, seconds, rows)
+                    self._noteQuery("COMMIT", None, time.time() - startTime, -1)
                     logger.log(u"Transaction with " + str(len(querylist)) + u" query's executed", logger.DEBUG)
                     return sqlResult
                 except sqlite3.OperationalError, e:
@@ -112,6 +147,14 @@ class DBConnection:
 
     def action(self, query, args=None):
 
+        return self._action(query, args)
+
+    def _action(self, query, args=None, fetch=False):
+        """
+        Runs a query, timing it for the query stats. If fetch is True the rows are fetched (and timed)
+        and returned instead of the cursor.
+        """
+
         with db_lock:
 
             if query == None:
@@ -119,16 +162,26 @@ class DBConnection:
     
             sqlResult = None
             attempt = 0
+            changesBefore = self.connection.total_changes
     
             while attempt < 5:
                 try:
+                    startTime = time.time()
                     if args == None:
-                        logger.log(self.filename+": "+query, logger.DEBUG)
+                        if logger.isEnabledFor(logger.DEBUG):
+                            logger.log(self.filename+": "+query, logger.DEBUG)
                         sqlResult = self.connection.execute(query)
                     else:
-                        logger.log(self.filename+": "+query+" with args "+str(args), logger.DEBUG)
+                        if logger.isEnabledFor(logger.DEBUG):
+                            logger.log(self.filename+": "+query+" with args "+str(args), logger.DEBUG)
                         sqlResult = self.connection.execute(query, args)
+                    rows = sqlResult.rowcount
+                    if fetch:
+                        sqlResult = sqlResult.fetchall()
+                        rows = len(sqlResult)
                     self.connection.commit()
+                    self._noteChanges(changesBefore)
+                    self._noteQuery(query, args, time.time() - startTime, rows)
                     # get out of the connection attempt loop since we were successful
                     break
                 except sqlite3.OperationalError, e:
@@ -146,9 +199,45 @@ class DBConnection:
             return sqlResult
 
 
+    def _noteChanges(self, changesBefore):
+        if self.connection.total_changes != changesBefore:
+            key = dbFilename(self.filename)
+            _data_versions[key] = _data_versions.get(key, 0) + 1
+
+    def _noteQuery(self, query, args, seconds, rows):
+        """
+        Adds a statement's time to the query stats, and to the slow query log (with sqlite's plan for it) if it was slow
+        """
+
+        filename = os.path.basename(self.filename)
+        instrumentation.noteQuery(filename, query, seconds, rows)
+
+        if sickbeard.DB_SLOW_QUERY_MS and seconds * 1000 >= sickbeard.DB_SLOW_QUERY_MS:
+            plan = self._explain(query, args)
+            instrumentation.noteSlowQuery(filename, query, args, seconds, rows, _caller(), plan)
+            logger.log(u"Slow query (" + str(int(seconds * 1000)) + "ms) on " + filename + ": " + query, logger.DEBUG)
+
+    def _explain(self, query, args):
+        """
+        Returns sqlite's plan for running a query as a list of strings
+        """
+
+        if not query.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "REPLACE")):
+            return []
+
+        try:
+            if args == None:
+                planResults = self.connection.execute("EXPLAIN QUERY PLAN " + query).fetchall()
+            else:
+                planResults = self.connection.execute("EXPLAIN QUERY PLAN " + query, args).fetchall()
+        except sqlite3.Error, e:
+            return [u"Unable to explain the query: " + ex(e)]
+
+        return [unicode(x["detail"]) for x in planResults]
+
     def select(self, query, args=None):
 
-        sqlResults = self.action(query, args).fetchall()
+        sqlResults = self._action(query, args, fetch=True)
 
         if sqlResults == None:
             return []
@@ -185,6 +274,23 @@ class DBConnection:
             d[col[0]] = row[idx]
         return d
     
+def upsertQueries(tableName, valueDict, keyDict):
+    """
+    Returns the queries for DBConnection.upsert as a list for mass_action, the insert only
+    happens if there's no row matching keyDict yet.
+    """
+
+    genParams = lambda myDict : [x + " = ?" for x in myDict.keys()]
+
+    updateQuery = "UPDATE "+tableName+" SET " + ", ".join(genParams(valueDict)) + " WHERE " + " AND ".join(genParams(keyDict))
+
+    insertQuery = "INSERT INTO "+tableName+" (" + ", ".join(valueDict.keys() + keyDict.keys()) + ")" + \
+                  " SELECT " + ", ".join(["?"] * len(valueDict.keys() + keyDict.keys())) + \
+                  " WHERE NOT EXISTS (SELECT 1 FROM "+tableName+" WHERE " + " AND ".join(genParams(keyDict)) + ")"
+
+    return [[updateQuery, valueDict.values() + keyDict.values()],
+            [insertQuery, valueDict.values() + keyDict.values() + keyDict.values()]]
+
 def sanityCheckDatabase(connection, sanity_check):
     sanity_check(connection).check()
 
@@ -231,6 +337,9 @@ class SchemaUpgrade (object):
     def hasTable(self, tableName):
         return len(self.connection.action("SELECT 1 FROM sqlite_master WHERE name = ?;", (tableName, )).fetchall()) > 0
 
+    def hasIndex(self, indexName):
+        return len(self.connection.action("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?;", (indexName, )).fetchall()) > 0
+
     def hasColumn(self, tableName, column):
         return column in self.connection.tableInfo(tableName)
 
@@ -0,0 +1,107 @@
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+import sqlite3
+import time
+
+from sickbeard import db
+from sickbeard import logger
+from sickbeard.exceptions import ex
+
+# how often (in hours) DBMaintainer looks after the databases
+DB_MAINTENANCE_FREQUENCY = 24
+
+# the databases it looks after
+DB_FILES = ("sickbeard.db", "cache.db")
+
+# a database is only vacuumed once at least this much of it (in percent) is free pages
+VACUUM_FREE_PERCENT = 20
+
+# PRAGMA optimize needs sqlite 3.18, before that the statistics are rebuilt with ANALYZE
+HAS_OPTIMIZE = sqlite3.sqlite_version_info >= (3, 18, 0)
+
+
+def optimize(filename="sickbeard.db"):
+    """
+    Brings sqlite's statistics on the tables and indexes up to date so the query planner
+    picks the right index
+    """
+
+    myDB = db.DBConnection(filename)
+
+    if HAS_OPTIMIZE:
+        myDB.action("PRAGMA optimize")
+    else:
+        myDB.action("ANALYZE")
+
+def freePercent(filename="sickbeard.db"):
+    """
+    Returns how much of the database file (in percent) is unused pages left behind by deletes
+    """
+
+    myDB = db.DBConnection(filename)
+
+    pageCount = myDB.select("PRAGMA page_count")[0][0]
+    freeCount = myDB.select("PRAGMA freelist_count")[0][0]
+
+    if not pageCount:
+        return 0
+
+    return freeCount * 100 / pageCount
+
+def vacuum(filename="sickbeard.db", force=False):
+    """
+    Rebuilds the database file to get rid of its free pages, if there are enough of them to be
+    worth it (or force is set). Returns True if it was vacuumed.
+    """
+
+    curFree = freePercent(filename)
+    if not force and curFree < VACUUM_FREE_PERCENT:
+        logger.log(u"Not vacuuming " + filename + ", only " + str(curFree) + "% of it is free", logger.DEBUG)
+        return False
+
+    logger.log(u"Vacuuming " + filename + ", " + str(curFree) + "% of it is free")
+    db.DBConnection(filename).action("VACUUM")
+
+    return True
+
+
+class DBMaintainer():
+    """
+    Keeps the query planner's statistics up to date and vacuums the databases once they've
+    got a lot of free space in them
+    """
+
+    def __init__(self):
+        self.amActive = False
+
+    def run(self):
+        self.amActive = True
+
+        try:
+            for curFile in DB_FILES:
+                startTime = time.time()
+                try:
+                    optimize(curFile)
+                    vacuum(curFile)
+                except sqlite3.Error, e:
+                    logger.log(u"Unable to maintain " + curFile + ": " + ex(e), logger.WARNING)
+                    continue
+
+                logger.log(u"Maintenance of " + curFile + " took " + str(int((time.time() - startTime) * 1000)) + "ms", logger.DEBUG)
+        finally:
+            self.amActive = False
@@ -0,0 +1,251 @@
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import with_statement
+
+import heapq
+import itertools
+import threading
+import weakref
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = None
+
+import sickbeard
+
+from sickbeard import logger
+
+# once the cache is full this many episodes are dropped at a time so not every new one has to make room
+EVICT_BATCH = 100
+
+# the most entries looked at for each eviction, so one full of pinned or dirty episodes doesn't get scanned every time
+EVICT_SCAN = 1000
+
+
+class EpisodeCache(object):
+    """
+    Keeps track of the episode objects held in the shows' episodes dicts, across all the shows.
+
+    Once there are more than sickbeard.EPISODE_CACHE_SIZE of them the least recently used ones are
+    dropped from their show, as long as they have no unsaved changes and aren't pinned. They're loaded
+    again from the DB the next time they're needed, unless something else is still holding on to the
+    dropped object, then that one is put back so there's never two objects for the same episode in use.
+    """
+
+    def __init__(self):
+        # (show tvdbid, season, episode) -> show
+        self.entries = OrderedDict() if OrderedDict else {}
+
+        # without an OrderedDict the entries are ordered by when they were last used
+        self.lastUsed = {}
+        self.useCount = 0
+
+        # (show tvdbid, season, episode) -> episodes which were dropped but may still be in use somewhere
+        self.dropped = weakref.WeakValueDictionary()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.lock = threading.Lock()
+
+    def get(self, show, season, episode):
+        """
+        Returns the show's cached episode object or None if it doesn't have one
+        """
+
+        key = (show.tvdbid, season, episode)
+
+        with self.lock:
+            ep = show.episodes.get(season, {}).get(episode)
+
+            if ep is None:
+                # it was dropped but something still has it, use that one rather than loading another
+                ep = self.dropped.pop(key, None)
+                if ep is None:
+                    return None
+                show.episodes.setdefault(season, {})[episode] = ep
+
+            self._use(key, show)
+
+            self.hits += 1
+
+        return ep
+
+    def add(self, show, season, episode, ep):
+        """
+        Puts a new episode object in its show's episodes dict and makes room for it if the cache is full
+        """
+
+        with self.lock:
+            show.episodes.setdefault(season, {})[episode] = ep
+            self.misses += 1
+
+            key = (show.tvdbid, season, episode)
+            self.dropped.pop(key, None)
+            self._use(key, show)
+
+            if sickbeard.EPISODE_CACHE_SIZE and len(self.entries) > sickbeard.EPISODE_CACHE_SIZE:
+                self._evict(key)
+
+    def pin(self, ep):
+        """
+        Keeps the episode in the cache until it's unpinned, eg. while a search is working on it
+        """
+
+        with self.lock:
+            ep.pins += 1
+
+    def unpin(self, ep):
+        with self.lock:
+            if ep.pins:
+                ep.pins -= 1
+
+    def _use(self, key, show):
+        """
+        Marks the entry as the most recently used one
+        """
+
+        if OrderedDict:
+            self.entries.pop(key, None)
+        else:
+            self.useCount += 1
+            self.lastUsed[key] = self.useCount
+
+        self.entries[key] = show
+
+    def _forget(self, key):
+        del self.entries[key]
+        self.lastUsed.pop(key, None)
+
+    def _leastRecentlyUsed(self, count):
+        """
+        Returns an iterator over (up to count of) the entries, least recently used first
+        """
+
+        if OrderedDict:
+            return itertools.islice(self.entries, count)
+
+        return iter(heapq.nsmallest(count, self.entries, key=self.lastUsed.get))
+
+    def _evict(self, newKey):
+
+        # make some extra room so the next few adds don't have to evict as well
+        toDrop = len(self.entries) - sickbeard.EPISODE_CACHE_SIZE + min(EVICT_BATCH, sickbeard.EPISODE_CACHE_SIZE / 10)
+
+        inUse = []
+        dropped = []
+
+        for key in self._leastRecentlyUsed(EVICT_SCAN):
+            if len(dropped) >= toDrop:
+                break
+
+            if key == newKey:
+                continue
+
+            show = self.entries[key]
+            tvdbid, season, episode = key #@UnusedVariable
+
+            ep = show.episodes.get(season, {}).get(episode)
+
+            if ep is not None and (ep.dirty or ep.pins):
+                inUse.append(key)
+                continue
+
+            dropped.append((key, show, ep))
+
+        evicted = 0
+        for key, show, ep in dropped:
+            tvdbid, season, episode = key #@UnusedVariable
+
+            self._forget(key)
+            if ep is not None:
+                del show.episodes[season][episode]
+                self.dropped[key] = ep
+                evicted += 1
+
+        # the ones still in use go to the end so the next eviction doesn't have to look at them first
+        for key in inUse:
+            self._use(key, self.entries[key])
+
+        self.evictions += evicted
+
+        if evicted:
+            logger.log(u"Dropped " + str(evicted) + " episodes from the episode cache, " + str(len(self.entries)) + " left (" + str(len(inUse)) + " in use)", logger.DEBUG)
+
+    def remove(self, show, season, episode):
+        """
+        Takes an episode object out of its show's episodes dict
+        """
+
+        key = (show.tvdbid, season, episode)
+
+        with self.lock:
+            if key in self.entries:
+                self._forget(key)
+            self.dropped.pop(key, None)
+            if episode in show.episodes.get(season, {}):
+                del show.episodes[season][episode]
+
+    def removeShow(self, show):
+        """
+        Forgets all of a show's episodes, eg. when it's deleted or flushed
+        """
+
+        with self.lock:
+            for key in [x for x in self.entries if x[0] == show.tvdbid]:
+                self._forget(key)
+            for key in [x for x in self.dropped.keys() if x[0] == show.tvdbid]:
+                self.dropped.pop(key, None)
+
+            for curSeason in show.episodes:
+                show.episodes[curSeason] = {}
+
+    def stats(self):
+        with self.lock:
+            return {"episodes": len(self.entries),
+                    "shows": len(set([x[0] for x in self.entries])),
+                    "max_episodes": sickbeard.EPISODE_CACHE_SIZE,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions}
+
+
+episode_cache = EpisodeCache()
+
+def getEpisode(show, season, episode):
+    return episode_cache.get(show, season, episode)
+
+def addEpisode(show, season, episode, ep):
+    episode_cache.add(show, season, episode, ep)
+
+def pinEpisode(ep):
+    episode_cache.pin(ep)
+
+def unpinEpisode(ep):
+    episode_cache.unpin(ep)
+
+def removeEpisode(show, season, episode):
+    episode_cache.remove(show, season, episode)
+
+def removeShow(show):
+    episode_cache.removeShow(show)
+
+def cacheStats():
+    return episode_cache.stats()
@@ -0,0 +1,272 @@
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+import httplib
+import StringIO
+import zlib
+
+try:
+    import xml.etree.cElementTree as etree
+except ImportError:
+    import elementtree.ElementTree as etree
+
+from sickbeard import logger
+from sickbeard.exceptions import ex
+
+
+def localName(tag):
+    """
+    Returns the tag without its namespace, eg. {http://www.newznab.com/DTD/2010/feeds/attributes/}attr -> attr
+    """
+
+    if tag[:1] == '{':
+        return tag[tag.index('}') + 1:]
+
+    return tag
+
+
+class FeedItem(object):
+    """
+    The interesting parts of an RSS <item>, read once while the feed is parsed.
+
+    attrs holds the newznab/torznab attributes by name and the text of any other simple
+    elements in the item (category, description, ezrss's magnetURI/seeds/fileName etc) by
+    their name without namespace.
+
+    The find methods pass through to the <item> element so code that expects elements keeps
+    working, unless the reader was told not to keep them.
+    """
+
+    __slots__ = ('title', 'url', 'guid', 'size', 'pubdate', 'attrs', 'element')
+
+    def __init__(self, element, keepElement=True):
+
+        self.title = None
+        self.url = None
+        self.guid = None
+        self.size = None
+        self.pubdate = None
+        self.attrs = {}
+
+        enclosure = None
+
+        for curElement in element:
+            tag = curElement.tag
+
+            if tag == 'title':
+                self.title = (curElement.text or '').strip()
+            elif tag == 'link':
+                self.url = (curElement.text or '').strip()
+            elif tag == 'guid':
+                self.guid = (curElement.text or '').strip()
+            elif tag == 'pubDate':
+                self.pubdate = (curElement.text or '').strip()
+            elif tag == 'enclosure':
+                enclosure = curElement
+            elif tag[-5:] == '}attr':
+                self.attrs[curElement.get('name')] = curElement.get('value')
+            elif len(curElement):
+                # eg. ezrss's <torrent> which holds the magnetURI, fileName, etc
+                for curChild in curElement:
+                    self.attrs.setdefault(localName(curChild.tag), (curChild.text or '').strip())
+            else:
+                self.attrs.setdefault(localName(tag), (curElement.text or '').strip())
+
+        if enclosure is not None:
+            if not self.url:
+                self.url = enclosure.get('url')
+            size = enclosure.get('length')
+        else:
+            size = None
+
+        size = self.attrs.get('size', size)
+        if size:
+            try:
+                self.size = int(size)
+            except ValueError:
+                pass
+
+        if keepElement:
+            self.element = element
+        else:
+            self.element = None
+
+    def find(self, path):
+        if self.element is None:
+            return None
+        return self.element.find(path)
+
+    def findall(self, path):
+        if self.element is None:
+            return []
+        return self.element.findall(path)
+
+    def findtext(self, path, default=None):
+        if self.element is None:
+            return default
+        return self.element.findtext(path, default)
+
+
+class _PrefixedFile(object):
+    """
+    Reads prefix before the rest of the file
+    """
+
+    def __init__(self, prefix, fileObj):
+        self.prefix = prefix
+        self.fileObj = fileObj
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.fileObj.read(size)
+
+        if size < 0:
+            data, self.prefix = self.prefix + self.fileObj.read(), ''
+        else:
+            data, self.prefix = self.prefix[:size], self.prefix[size:]
+
+        return data
+
+
+class FeedReader(object):
+    """
+    Reads an RSS feed or newznab API response incrementally, yielding a FeedItem for each <item>
+    as soon as it's been read and then throwing its XML away so memory use doesn't depend on the
+    size of the feed.
+
+    source: the feed as a string or a file-like object (eg. from helpers.getURLStream)
+    defaultEncoding: if the feed has no <?xml ?> declaration assume it's in this encoding
+    keepElements: if False the items don't keep their elements around
+
+    Usage:
+        feed = FeedReader(data)
+        if feed.readHeader() and feed.tag == 'rss':
+            for item in feed:
+                ...
+
+    Once readHeader() has been called tag and attrib are the name (without namespace) and attributes
+    of the root element, channel holds the text of the simple channel elements seen before the first
+    item (and channelAttrib their attributes, eg. newznab:response's offset and total) and firstItem
+    is the first item in the feed (if there is one). This is enough to check newznab <error> responses
+    and auth messages without having the whole document.
+    """
+
+    def __init__(self, source, defaultEncoding=None, keepElements=True):
+
+        if isinstance(source, basestring):
+            if defaultEncoding and not source.startswith('<?xml'):
+                source = '<?xml version="1.0" encoding="' + defaultEncoding + '" ?>' + source
+            source = StringIO.StringIO(source)
+
+        elif defaultEncoding:
+            start = source.read(5)
+            if start != '<?xml':
+                start = '<?xml version="1.0" encoding="' + defaultEncoding + '" ?>' + start
+            source = _PrefixedFile(start, source)
+
+        self.source = source
+        self.keepElements = keepElements
+
+        self.tag = None
+        self.attrib = {}
+        self.channel = {}
+        self.channelAttrib = {}
+        self.firstItem = None
+
+        self.error = None
+
+        self._events = None
+        self._root = None
+        self._parents = []
+        self._depth = 0
+        self._done = False
+
+    def _nextItem(self):
+        """
+        Returns the next FeedItem or None once the end of the feed is reached
+        """
+
+        if self._done:
+            return None
+
+        try:
+            for event, curElement in self._events:
+
+                if event == 'start':
+                    self._depth += 1
+                    if self._depth <= 2:
+                        if self._root is None:
+                            self._root = curElement
+                            self.tag = localName(curElement.tag)
+                            self.attrib = dict(curElement.attrib)
+                        self._parents.append(curElement)
+                    continue
+
+                self._depth -= 1
+
+                if curElement.tag == 'item':
+                    item = FeedItem(curElement, self.keepElements)
+                    # get rid of everything read so far, the item keeps its own element if it needs it
+                    self._parents[-1].clear()
+                    return item
+
+                # simple elements of the <channel>
+                elif self._depth == 2 and not len(curElement):
+                    self.channel[localName(curElement.tag)] = (curElement.text or '').strip()
+                    if curElement.attrib:
+                        self.channelAttrib[localName(curElement.tag)] = dict(curElement.attrib)
+
+                elif self._depth < 2:
+                    self._parents.pop()
+
+        except (SyntaxError, EnvironmentError), e:
+            logger.log(u"Error trying to parse the feed XML: " + ex(e), logger.DEBUG)
+            self.error = e
+
+        # the feed is parsed as it downloads so a dropped connection or a broken gzip stream shows up here too
+        except (httplib.HTTPException, zlib.error), e:
+            logger.log(u"The feed stopped part way through, using what was read of it: " + ex(e), logger.WARNING)
+            self.error = e
+
+        self._done = True
+        return None
+
+    def readHeader(self):
+        """
+        Reads the feed up to the end of the first item.
+
+        Returns False if the feed couldn't be parsed as XML.
+        """
+
+        if self._events is None:
+            self._events = etree.iterparse(self.source, ('start', 'end'))
+            self.firstItem = self._nextItem()
+
+        return self._root is not None and not (self.error and self.firstItem is None)
+
+    def __iter__(self):
+
+        self.readHeader()
+
+        if self.firstItem is not None:
+            yield self.firstItem
+
+        while True:
+            item = self._nextItem()
+            if item is None:
+                break
+            yield item
@@ -18,7 +18,9 @@
 
 import datetime
 import threading
+import time
 
+from sickbeard import instrumentation
 from sickbeard import logger
 
 class QueuePriorities:
@@ -115,6 +117,9 @@ class QueueItem:
         
         self.added = None
 
+        self.started = None
+        self.started_thread = None
+
     def get_thread_name(self):
         if self.thread_name:
             return self.thread_name
@@ -126,9 +131,21 @@ class QueueItem:
 
         self.inProgress = True
 
+        self.started = time.time()
+        self.started_thread = threading.currentThread()
+        instrumentation.startQueryCount()
+
     def finish(self):
         """Implementing Classes should call this"""
 
         self.inProgress = False
 
+        # it's finished by the queue as well as by the item itself, only the first one counts
+        if self.started:
+            queries, queryTime = 0, 0.0
+            if threading.currentThread() is self.started_thread:
+                queries, queryTime = instrumentation.stopQueryCount()
+            instrumentation.record(instrumentation.QUEUE, self.name, time.time() - self.started, queries, queryTime)
+            self.started = None
+
 
@@ -143,9 +143,46 @@ def sanitizeFileName(name):
     return name
 
 
-def getURL(url, headers=[], timeout=None):
+URL_CHUNK_SIZE = 64 * 1024
+
+class DecompressingReader(object):
     """
-    Returns a byte-string retrieved from the url provider.
+    File-like wrapper around an url response that decompresses a gzip or deflate encoded body as it's read
+    instead of holding the whole compressed body in memory first.
+    """
+
+    def __init__(self, usock, encoding):
+        self.usock = usock
+
+        if encoding == 'deflate':
+            self.decompressor = zlib.decompressobj()
+        else:
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = self.usock.read(URL_CHUNK_SIZE)
+            if not chunk:
+                self.buffer += self.decompressor.flush()
+                break
+            self.buffer += self.decompressor.decompress(chunk)
+
+        if size < 0 or size >= len(self.buffer):
+            data, self.buffer = self.buffer, ''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+
+        return data
+
+    def close(self):
+        self.usock.close()
+
+
+def _openURL(url, headers=[], timeout=None):
+    """
+    Opens the url and returns a file-like object which gives the decoded body as it's read
     """
 
     opener = urllib2.build_opener()
@@ -153,55 +190,72 @@ def getURL(url, headers=[], timeout=None):
     for cur_header in headers:
         opener.addheaders.append(cur_header)
 
-    try:
-        if sys.version_info < (2, 6) or timeout is None:
-            usock = opener.open(url)
-        else:
-            usock = opener.open(url, timeout=timeout)
-        
-        url = usock.geturl()
-        encoding = usock.info().get("Content-Encoding")
-
-        if encoding in ('gzip', 'x-gzip', 'deflate'):
-            content = usock.read()
-            if encoding == 'deflate':
-                data = StringIO.StringIO(zlib.decompress(content))
-            else:
-                data = gzip.GzipFile('', 'rb', 9, StringIO.StringIO(content))
-            result = data.read()
+    if sys.version_info < (2, 6) or timeout is None:
+        usock = opener.open(url)
+    else:
+        usock = opener.open(url, timeout=timeout)
 
-        else:
-            result = usock.read()
+    encoding = usock.info().get("Content-Encoding")
 
-        usock.close()
+    if encoding in ('gzip', 'x-gzip', 'deflate'):
+        return DecompressingReader(usock, encoding)
+
+    return usock
+
+
+def _logURLError(url, e):
 
-    except urllib2.HTTPError, e:
+    if isinstance(e, urllib2.HTTPError):
         logger.log(u"HTTP error " + str(e.code) + " while loading URL " + url, logger.WARNING)
-        return None
 
-    except urllib2.URLError, e:
+    elif isinstance(e, urllib2.URLError):
         logger.log(u"URL error " + str(e.reason) + " while loading URL " + url, logger.WARNING)
-        return None
 
-    except BadStatusLine:
+    elif isinstance(e, BadStatusLine):
         logger.log(u"BadStatusLine error while loading URL " + url, logger.WARNING)
-        return None
 
-    except socket.timeout:
+    elif isinstance(e, socket.timeout):
         logger.log(u"Timed out while loading URL " + url, logger.WARNING)
-        return None
 
-    except ValueError:
+    elif isinstance(e, ValueError):
         logger.log(u"Unknown error while loading URL " + url, logger.WARNING)
-        return None
 
-    except Exception:
+    else:
         logger.log(u"Unknown exception while loading URL " + url + ": " + traceback.format_exc(), logger.WARNING)
+
+
+def getURL(url, headers=[], timeout=None):
+    """
+    Returns a byte-string retrieved from the url provider.
+    """
+
+    try:
+        usock = _openURL(url, headers, timeout)
+        result = usock.read()
+        usock.close()
+
+    except Exception, e:
+        _logURLError(url, e)
         return None
 
     return result
 
 
+def getURLStream(url, headers=[], timeout=None):
+    """
+    Returns a file-like object to read the body of the url from as it downloads, or None if it couldn't be opened.
+
+    Errors while reading are raised to the caller, who should close the object when done with it.
+    """
+
+    try:
+        return _openURL(url, headers, timeout)
+
+    except Exception, e:
+        _logURLError(url, e)
+        return None
+
+
 def findCertainShow(showList, tvdbid):
     results = filter(lambda x: x.tvdbid == tvdbid, showList)
     if len(results) == 0:
@@ -212,6 +266,39 @@ def findCertainShow(showList, tvdbid):
         return results[0]
 
 
+def _sortName(name):
+    """
+    Returns the show name without any leading "A " or "The ", for sorting by
+    """
+
+    if not name:
+        return name
+    if name.lower().startswith('a '):
+        name = name[2:]
+    elif name.lower().startswith('the '):
+        name = name[4:]
+    return name
+
+# the (tvdbid, name) of every show and the show list sorted by name, from the last sortedShowList()
+_sorted_show_list = (None, [])
+
+def sortedShowList():
+    """
+    Returns sickbeard.showList sorted by name (ignoring any leading "A " or "The "). It's only
+    sorted again after a show has been added, removed or renamed.
+    """
+
+    global _sorted_show_list
+
+    showList = sickbeard.showList
+    names = [(x.tvdbid, x.name) for x in showList]
+
+    if names != _sorted_show_list[0]:
+        _sorted_show_list = (names, sorted(showList, key=lambda x: _sortName(x.name)))
+
+    return _sorted_show_list[1]
+
+
 def findCertainTVRageShow(showList, tvrid):
 
     if tvrid == 0:
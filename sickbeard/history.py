@@ -18,21 +18,43 @@
 
 import db
 import datetime
+import re
 
 from sickbeard.common import SNATCHED, Quality
 
 dateFormat = "%Y%m%d%H%M%S"
 
-def _logHistoryItem(action, showid, season, episode, quality, resource, provider):
+def resourceKey(resource):
+    """
+    Returns the key a release or file name is looked up by in the history (the resource_key column):
+    the name in lower case with all dots, dashes, underscores and spaces turned into dots, so
+    "Show.Name-S01E01" and "show name_s01e01" both give "show.name.s01e01".
+    """
+
+    if not resource:
+        return ''
+
+    return re.sub("[\.\-\ _]", ".", resource.lower())
+
+def _historyItemQuery(action, showid, season, episode, quality, resource, provider):
 
     logDate = datetime.datetime.today().strftime(dateFormat)
 
+    return ["INSERT INTO history (action, date, showid, season, episode, quality, resource, provider, resource_key) VALUES (?,?,?,?,?,?,?,?,?)",
+            [action, logDate, showid, season, episode, quality, resource, provider, resourceKey(resource)]]
+
+def _logHistoryItem(action, showid, season, episode, quality, resource, provider):
+
     myDB = db.DBConnection()
-    myDB.action("INSERT INTO history (action, date, showid, season, episode, quality, resource, provider) VALUES (?,?,?,?,?,?,?,?)",
-                [action, logDate, showid, season, episode, quality, resource, provider])
+    myDB.action(*_historyItemQuery(action, showid, season, episode, quality, resource, provider))
 
 
-def logSnatch(searchResult):
+def snatchQueries(searchResult):
+    """
+    Returns the queries which log the snatch of searchResult, for running with other queries in one transaction
+    """
+
+    queries = []
 
     for curEpObj in searchResult.episodes:
 
@@ -51,7 +73,14 @@ def logSnatch(searchResult):
 
         resource = searchResult.name
 
-        _logHistoryItem(action, showid, season, episode, quality, resource, provider)
+        queries.append(_historyItemQuery(action, showid, season, episode, quality, resource, provider))
+
+    return queries
+
+def logSnatch(searchResult):
+
+    myDB = db.DBConnection()
+    myDB.mass_action(snatchQueries(searchResult))
 
 def logDownload(episode, filename, new_ep_quality, release_group=None):
 
@@ -0,0 +1,431 @@
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import with_statement
+
+import bisect
+import collections
+import cProfile
+import datetime
+import os
+import re
+import threading
+import time
+
+import cherrypy
+
+import sickbeard
+
+from sickbeard import logger
+from sickbeard import encodingKludge as ek
+from sickbeard.exceptions import ex
+
+# upper bounds (in seconds) of the latency histogram buckets, anything slower goes in one more at the end
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# the most names kept for each kind of timing, the rest are counted together under OTHER so
+# requests for made up urls can't use up memory
+MAX_NAMES = 200
+OTHER = "(other)"
+
+# the kinds of timings
+PAGE = "page"
+API = "api"
+QUEUE = "queue"
+SCHEDULER = "scheduler"
+
+# where profiles are saved in the data dir and how many are kept
+PROFILE_DIR = "profiles"
+MAX_PROFILES = 20
+
+# the most query shapes kept and how many recent timings of each are used for the 95th percentile
+MAX_QUERY_SHAPES = 500
+QUERY_HISTORY_SIZE = 200
+
+# how many slow queries are kept, and how much of each one's args
+SLOW_QUERY_LOG_SIZE = 50
+MAX_ARGS_LENGTH = 200
+
+_string_re = re.compile(r"'(?:[^']|'')*'")
+_number_re = re.compile(r"\b\d+(?:\.\d+)?\b")
+_in_list_re = re.compile(r"IN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+
+
+class Timing(object):
+    """
+    How long something took each time it ran (as a histogram over BUCKETS) and the DB queries it made.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+        self.queries = 0
+        self.query_time = 0.0
+
+    def add(self, seconds, queries=0, queryTime=0.0):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+        self.queries += queries
+        self.query_time += queryTime
+
+    def percentile(self, percent):
+        """
+        Estimates a percentile from the histogram, it's the upper bound of the bucket it falls in
+        """
+
+        if not self.count:
+            return None
+
+        wanted = self.count * percent / 100.0
+        seen = 0
+        for i in range(len(BUCKETS)):
+            seen += self.histogram[i]
+            if seen >= wanted:
+                return min(BUCKETS[i], self.max)
+
+        return self.max
+
+    def toDict(self):
+        return {"count": self.count,
+                "total": round(self.total, 3),
+                "avg": round(self.total / self.count, 4) if self.count else None,
+                "max": round(self.max, 4),
+                "p50": self.percentile(50),
+                "p95": self.percentile(95),
+                "histogram": list(self.histogram),
+                "queries": self.queries,
+                "query_time": round(self.query_time, 3)}
+
+
+class Instrumentation(object):
+    """
+    Timings of web requests, API calls, queue items and scheduled jobs, by kind and then name.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.started = datetime.datetime.now()
+
+        # every query made, whether or not it was part of something being timed
+        self.queries = 0
+        self.query_time = 0.0
+
+        self.lock = threading.Lock()
+
+    def record(self, kind, name, seconds, queries=0, queryTime=0.0):
+        with self.lock:
+            names = self.timings.setdefault(kind, {})
+            if name not in names and len(names) >= MAX_NAMES:
+                name = OTHER
+            if name not in names:
+                names[name] = Timing()
+            names[name].add(seconds, queries, queryTime)
+
+    def noteQueries(self, count, seconds):
+        with self.lock:
+            self.queries += count
+            self.query_time += seconds
+
+    def report(self):
+        with self.lock:
+            timings = {}
+            for kind in self.timings:
+                timings[kind] = dict([(name, timing.toDict()) for name, timing in self.timings[kind].items()])
+
+            return {"since": self.started.strftime("%Y-%m-%d %H:%M:%S"),
+                    "buckets": list(BUCKETS),
+                    "timings": timings,
+                    "db": {"queries": self.queries, "query_time": round(self.query_time, 3)}}
+
+    def clear(self):
+        with self.lock:
+            self.timings = {}
+            self.started = datetime.datetime.now()
+            self.queries = 0
+            self.query_time = 0.0
+
+
+def normalizeQuery(query):
+    """
+    Returns the shape of a query: literals replaced by ? and IN lists of any length made the same,
+    so all the runs of a query get counted together however it was put together.
+    """
+
+    query = _string_re.sub("?", query)
+    query = _number_re.sub("?", query)
+    query = _in_list_re.sub("IN (...)", query)
+
+    return " ".join(query.split())
+
+
+class QueryStats(object):
+    """
+    How often each shape of DB query runs and how long it takes, plus a log of the slowest runs.
+    """
+
+    def __init__(self):
+        # (db filename, shape) -> [count, total seconds, max seconds, rows, recent seconds]
+        self.shapes = {}
+        self.slow_queries = collections.deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+        # raw query -> shape, the same few hundred queries are run over and over
+        self.shape_cache = {}
+
+        self.lock = threading.Lock()
+
+    def add(self, filename, query, seconds, rows):
+        with self.lock:
+            shape = self.shape_cache.get(query)
+            if shape is None:
+                shape = normalizeQuery(query)
+                if len(self.shape_cache) < MAX_QUERY_SHAPES * 4:
+                    self.shape_cache[query] = shape
+
+            key = (filename, shape)
+            if key not in self.shapes:
+                if len(self.shapes) >= MAX_QUERY_SHAPES:
+                    key = (filename, OTHER)
+                if key not in self.shapes:
+                    self.shapes[key] = [0, 0.0, 0.0, 0, collections.deque(maxlen=QUERY_HISTORY_SIZE)]
+
+            stats = self.shapes[key]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3] += max(rows, 0)
+            stats[4].append(seconds)
+
+    def addSlow(self, filename, query, args, seconds, rows, caller, plan):
+        args = repr(args) if args else ""
+        if len(args) > MAX_ARGS_LENGTH:
+            args = args[:MAX_ARGS_LENGTH] + "..."
+
+        with self.lock:
+            self.slow_queries.appendleft({"time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                                          "db": filename,
+                                          "seconds": round(seconds, 4),
+                                          "rows": rows,
+                                          "query": query,
+                                          "args": args,
+                                          "caller": caller,
+                                          "plan": plan})
+
+    def report(self):
+        """
+        Returns a list of dicts with the stats of each query shape, the most time taken in total first
+        """
+
+        with self.lock:
+            results = []
+            for (filename, shape), (count, total, maxTime, rows, recent) in self.shapes.items():
+                recent = sorted(recent)
+                results.append({"db": filename,
+                                "query": shape,
+                                "count": count,
+                                "total": round(total, 4),
+                                "avg": round(total / count, 5),
+                                "max": round(maxTime, 4),
+                                "p95": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 5),
+                                "rows": rows})
+
+        results.sort(key=lambda x: x["total"], reverse=True)
+        return results
+
+    def slowQueries(self):
+        with self.lock:
+            return list(self.slow_queries)
+
+    def clear(self):
+        with self.lock:
+            self.shapes = {}
+            self.slow_queries.clear()
+
+
+instrumentation = Instrumentation()
+query_stats = QueryStats()
+
+# the DB queries made by whatever's being timed in this thread
+_local = threading.local()
+
+def record(kind, name, seconds, queries=0, queryTime=0.0):
+    instrumentation.record(kind, name, seconds, queries, queryTime)
+
+def report():
+    return instrumentation.report()
+
+def fullReport():
+    """
+    The report with the DB query stats and the slow query log as well
+    """
+
+    result = instrumentation.report()
+    result["db"]["shapes"] = query_stats.report()
+    result["db"]["slow_queries"] = query_stats.slowQueries()
+    result["db"]["slow_query_ms"] = sickbeard.DB_SLOW_QUERY_MS
+    return result
+
+def clear():
+    instrumentation.clear()
+    query_stats.clear()
+
+def startQueryCount():
+    """
+    Starts counting the DB queries made in this thread
+    """
+
+    _local.counting = True
+    _local.queries = 0
+    _local.query_time = 0.0
+
+def stopQueryCount():
+    """
+    Stops counting the DB queries made in this thread and returns (number of queries, seconds they took)
+    """
+
+    if not getattr(_local, "counting", False):
+        return 0, 0.0
+
+    _local.counting = False
+    return _local.queries, _local.query_time
+
+def noteQuery(filename, query, seconds, rows=-1):
+    """
+    Called by the DB layer after running each statement
+    """
+
+    instrumentation.noteQueries(1, seconds)
+    query_stats.add(filename, query, seconds, rows)
+
+    if getattr(_local, "counting", False):
+        _local.queries += 1
+        _local.query_time += seconds
+
+def noteSlowQuery(filename, query, args, seconds, rows, caller, plan):
+    query_stats.addSlow(filename, query, args, seconds, rows, caller, plan)
+
+def queryReport():
+    return query_stats.report()
+
+def slowQueries():
+    return query_stats.slowQueries()
+
+
+# profiles
+
+def profileDir():
+    return ek.ek(os.path.join, sickbeard.DATA_DIR, PROFILE_DIR)
+
+def profiles():
+    """
+    Returns a list of (filename, size, modified datetime) of the saved profiles, newest first
+    """
+
+    if not ek.ek(os.path.isdir, profileDir()):
+        return []
+
+    results = []
+    for cur_file in ek.ek(os.listdir, profileDir()):
+        if not cur_file.endswith(".prof"):
+            continue
+        cur_path = ek.ek(os.path.join, profileDir(), cur_file)
+        results.append((cur_file, ek.ek(os.path.getsize, cur_path), datetime.datetime.fromtimestamp(ek.ek(os.path.getmtime, cur_path))))
+
+    results.sort(key=lambda x: x[2], reverse=True)
+    return results
+
+def saveProfile(profiler, name):
+    """
+    Saves the stats of a cProfile.Profile to the profile dir, for opening with pstats or a viewer like snakeviz
+    """
+
+    try:
+        if not ek.ek(os.path.isdir, profileDir()):
+            ek.ek(os.makedirs, profileDir())
+
+        filename = re.sub(r"[^\w.-]+", "_", name).strip("_") + "-" + time.strftime("%Y%m%d-%H%M%S") + ".prof"
+        profiler.dump_stats(ek.ek(os.path.join, profileDir(), filename))
+        logger.log(u"Saved the profile of " + name + " to " + filename)
+
+        for cur_file in profiles()[MAX_PROFILES:]:
+            ek.ek(os.remove, ek.ek(os.path.join, profileDir(), cur_file[0]))
+
+    except (OSError, IOError), e:
+        logger.log(u"Unable to save the profile of " + name + ": " + ex(e), logger.ERROR)
+
+def profile(func, name):
+    """
+    Wraps func so calling it runs it under cProfile and saves the profile
+    """
+
+    def profiled(*args, **kwargs):
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            saveProfile(profiler, name)
+
+    return profiled
+
+
+# web requests, the tools.instrument cherrypy tool runs startRequest before the page handler
+
+def _requestName(request):
+    """
+    Returns (kind, name) to record a request under. API calls go by their cmd (never the api key in the url).
+    """
+
+    path = request.path_info.rstrip("/")
+
+    if path == "/api" or path.startswith("/api/"):
+        parts = path.split("/")
+        if len(parts) > 2 and parts[2] == "builder":
+            return PAGE, "/api/builder"
+        cmd = request.params.get("cmd") or (len(parts) > 3 and parts[3]) or "(none)"
+        return API, cmd
+
+    if path.endswith("/index"):
+        path = path[:-len("/index")]
+
+    return PAGE, path or "/"
+
+def startRequest():
+    request = cherrypy.serving.request
+
+    kind, name = _requestName(request)
+
+    # profile=1 on any page or api call saves a profile of it, as long as whoever asked is allowed in
+    if request.params.pop("profile", None):
+        if kind == API:
+            # the api has no basic auth, it only profiles the call once the key has been checked (see Api.default)
+            request.instrument_profile = kind + " " + name
+        elif request.login or not request.config.get("tools.auth_basic.on", False):
+            request.handler = profile(request.handler, kind + " " + name)
+
+    request.instrument_start = time.time()
+    startQueryCount()
+
+    request.hooks.attach("on_end_request", _endRequest, kind=kind, name=name)
+
+def _endRequest(kind, name):
+    queries, queryTime = stopQueryCount()
+    record(kind, name, time.time() - cherrypy.serving.request.instrument_start, queries, queryTime)
@@ -177,3 +177,9 @@ sb_log_instance = SBRotatingLogHandler('sickbeard.log', NUM_LOGS, LOG_SIZE)
 
 def log(toLog, logLevel=MESSAGE):
     sb_log_instance.log(toLog, logLevel)
+
+def isEnabledFor(logLevel):
+    """
+    Whether messages at logLevel go anywhere, so callers can skip building ones that don't
+    """
+    return logging.getLogger('sickbeard').isEnabledFor(logLevel)
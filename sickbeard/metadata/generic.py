@@ -17,6 +17,7 @@
 # along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
 
 import os.path
+import StringIO
 
 import xml.etree.cElementTree as etree
 
@@ -30,7 +31,7 @@ from sickbeard import logger
 from sickbeard import encodingKludge as ek
 from sickbeard.exceptions import ex
 
-from lib.tvdb_api import tvdb_api, tvdb_exceptions
+from lib.tvdb_api import tvdb_exceptions
 
 
 class GenericMetadata():
@@ -232,19 +233,9 @@ class GenericMetadata():
         """
         all_eps = [ep_obj] + ep_obj.relatedEps
 
-        tvdb_lang = ep_obj.show.lang
-    
         # get a TVDB object
         try:
-            # There's gotta be a better way of doing this but we don't wanna
-            # change the language value elsewhere
-            ltvdb_api_parms = sickbeard.TVDB_API_PARMS.copy()
-
-            if tvdb_lang and not tvdb_lang == 'en':
-                ltvdb_api_parms['language'] = tvdb_lang
-
-            t = tvdb_api.Tvdb(actors=True, **ltvdb_api_parms)
-            tvdb_show_obj = t[ep_obj.show.tvdbid]
+            tvdb_show_obj = metadata_helpers.getTVDBShow(ep_obj.show, actors=True)
         except tvdb_exceptions.tvdb_shownotfound, e:
             raise exceptions.ShowNotFoundException(e.message)
         except tvdb_exceptions.tvdb_error, e:
@@ -287,26 +278,10 @@ class GenericMetadata():
             return False
         
         nfo_file_path = self.get_show_file_path(show_obj)
-        nfo_file_dir = ek.ek(os.path.dirname, nfo_file_path)
 
-        try:
-            if not ek.ek(os.path.isdir, nfo_file_dir):
-                logger.log("Metadata dir didn't exist, creating it at "+nfo_file_dir, logger.DEBUG)
-                ek.ek(os.makedirs, nfo_file_dir)
-                helpers.chmodAsParent(nfo_file_dir)
-    
-            logger.log(u"Writing show nfo file to "+nfo_file_path)
-            
-            nfo_file = ek.ek(open, nfo_file_path, 'w')
-    
-            data.write(nfo_file, encoding="utf-8")
-            nfo_file.close()
-            helpers.chmodAsParent(nfo_file_path)
-        except IOError, e:
-            logger.log(u"Unable to write file to "+nfo_file_path+" - are you sure the folder is writable? "+ex(e), logger.ERROR)
-            return False
-        
-        return True
+        logger.log(u"Writing show nfo file to "+nfo_file_path)
+
+        return self._write_file(self._xml_to_string(data), nfo_file_path)
 
     def write_ep_file(self, ep_obj):
         """
@@ -331,25 +306,57 @@ class GenericMetadata():
             return False
         
         nfo_file_path = self.get_episode_file_path(ep_obj)
-        nfo_file_dir = ek.ek(os.path.dirname, nfo_file_path)
+
+        logger.log(u"Writing episode nfo file to "+nfo_file_path)
+
+        return self._write_file(self._xml_to_string(data), nfo_file_path)
+
+    def _xml_to_string(self, data):
+        """
+        Returns the utf-8 encoded contents of the ElementTree data, the same way they'd be
+        written to a file.
+        """
+
+        xml_string = StringIO.StringIO()
+        data.write(xml_string, encoding="utf-8")
+
+        return xml_string.getvalue()
+
+    def _write_file(self, file_data, file_path):
+        """
+        Writes file_data to file_path, creating the folder if needed. If the file already
+        has exactly that content it's left alone. Returns True/False to represent success
+        or failure.
         
+        file_data: the string to write to the file
+        file_path: file location to write it to
+        """
+
+        file_dir = ek.ek(os.path.dirname, file_path)
+
         try:
-            if not ek.ek(os.path.isdir, nfo_file_dir):
-                logger.log("Metadata dir didn't exist, creating it at "+nfo_file_dir, logger.DEBUG)
-                ek.ek(os.makedirs, nfo_file_dir)
-                helpers.chmodAsParent(nfo_file_dir)
-            
-            logger.log(u"Writing episode nfo file to "+nfo_file_path)
-            
-            nfo_file = ek.ek(open, nfo_file_path, 'w')
-    
-            data.write(nfo_file, encoding="utf-8")
-            nfo_file.close()
-            helpers.chmodAsParent(nfo_file_path)
-        except IOError, e:
-            logger.log(u"Unable to write file to "+nfo_file_path+" - are you sure the folder is writable? "+ex(e), logger.ERROR)
+            if ek.ek(os.path.isfile, file_path) and ek.ek(os.path.getsize, file_path) == len(file_data):
+                cur_file = ek.ek(open, file_path, 'rb')
+                cur_data = cur_file.read()
+                cur_file.close()
+
+                if cur_data == file_data:
+                    logger.log(u"File "+file_path+" is already up to date, not writing it", logger.DEBUG)
+                    return True
+
+            if not ek.ek(os.path.isdir, file_dir):
+                logger.log("Metadata dir didn't exist, creating it at "+file_dir, logger.DEBUG)
+                ek.ek(os.makedirs, file_dir)
+                helpers.chmodAsParent(file_dir)
+
+            out_file = ek.ek(open, file_path, 'wb')
+            out_file.write(file_data)
+            out_file.close()
+            helpers.chmodAsParent(file_path)
+        except (IOError, OSError), e:
+            logger.log(u"Unable to write file to "+file_path+" - are you sure the folder is writable? "+ex(e), logger.ERROR)
             return False
-        
+
         return True
 
     def save_thumbnail(self, ep_obj):
@@ -374,6 +381,7 @@ class GenericMetadata():
             logger.log("No thumb is available for this episode, not creating a thumb", logger.DEBUG)
             return False
 
+        # episode thumbs are only used once so they aren't kept in the shared show data
         thumb_data = metadata_helpers.getShowImage(thumb_url)
         
         result = self._write_image(thumb_data, file_path)
@@ -464,7 +472,7 @@ class GenericMetadata():
                 logger.log(u"Path for season "+str(cur_season)+" came back blank, skipping this season", logger.DEBUG)
                 continue
     
-            seasonData = metadata_helpers.getShowImage(season_url)
+            seasonData = metadata_helpers.getShowImage(season_url, show_obj=show_obj)
             
             if not seasonData:
                 logger.log(u"No season thumb data available, skipping this season", logger.DEBUG)
@@ -525,18 +533,8 @@ class GenericMetadata():
         Returns: the binary image data if available, or else None
         """
 
-        tvdb_lang = show_obj.lang
-
         try:
-            # There's gotta be a better way of doing this but we don't wanna
-            # change the language value elsewhere
-            ltvdb_api_parms = sickbeard.TVDB_API_PARMS.copy()
-
-            if tvdb_lang and not tvdb_lang == 'en':
-                ltvdb_api_parms['language'] = tvdb_lang
-
-            t = tvdb_api.Tvdb(banners=True, **ltvdb_api_parms)
-            tvdb_show_obj = t[show_obj.tvdbid]
+            tvdb_show_obj = metadata_helpers.getTVDBShow(show_obj, banners=True)
         except (tvdb_exceptions.tvdb_error, IOError), e:
             logger.log(u"Unable to look up show on TVDB, not downloading images: "+ex(e), logger.ERROR)
             return None
@@ -547,7 +545,7 @@ class GenericMetadata():
     
         image_url = tvdb_show_obj[image_type]
     
-        image_data = metadata_helpers.getShowImage(image_url, which)
+        image_data = metadata_helpers.getShowImage(image_url, which, show_obj)
 
         return image_data
     
@@ -562,18 +560,8 @@ class GenericMetadata():
         # This holds our resulting dictionary of season art
         result = {}
     
-        tvdb_lang = show_obj.lang
-
         try:
-            # There's gotta be a better way of doing this but we don't wanna
-            # change the language value elsewhere
-            ltvdb_api_parms = sickbeard.TVDB_API_PARMS.copy()
-
-            if tvdb_lang and not tvdb_lang == 'en':
-                ltvdb_api_parms['language'] = tvdb_lang
-
-            t = tvdb_api.Tvdb(banners=True, **ltvdb_api_parms)
-            tvdb_show_obj = t[show_obj.tvdbid]
+            tvdb_show_obj = metadata_helpers.getTVDBShow(show_obj, banners=True)
         except (tvdb_exceptions.tvdb_error, IOError), e:
             logger.log(u"Unable to look up show on TVDB, not downloading images: "+ex(e), logger.ERROR)
             return result
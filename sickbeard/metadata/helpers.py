@@ -16,8 +16,13 @@
 # You should have received a copy of the GNU General Public License
 # along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
 
+from __future__ import with_statement
+
 import os
 import urllib2
+import threading
+import traceback
+import Queue
 
 import sickbeard
 
@@ -77,7 +82,7 @@ def getTVDBIDFromNFO(dir):
 
     return tvdb_id
 
-def getShowImage(url, imgNum=None):
+def getShowImage(url, imgNum=None, show_obj=None):
 
     image_data = None
 
@@ -90,9 +95,18 @@ def getShowImage(url, imgNum=None):
     else:
         tempURL = url
 
-    logger.log(u"Getting show image at "+tempURL, logger.DEBUG)
+    # reuse the show's art if another provider already downloaded it
+    show_data = _getSharedShowData(show_obj)
+    if show_data:
+        return show_data.get_image(tempURL)
+
+    return _downloadShowImage(tempURL)
+
+def _downloadShowImage(url):
+
+    logger.log(u"Getting show image at "+url, logger.DEBUG)
 
-    image_data = helpers.getURL(tempURL)
+    image_data = helpers.getURL(url)
 
     if image_data is None:
         logger.log(u"There was an error trying to retrieve the image, aborting", logger.ERROR)
@@ -100,4 +114,178 @@ def getShowImage(url, imgNum=None):
 
     return image_data
 
+def _loadTVDBShow(show_obj, actors=False, banners=False):
+
+    # There's gotta be a better way of doing this but we don't wanna
+    # change the language value elsewhere
+    ltvdb_api_parms = sickbeard.TVDB_API_PARMS.copy()
+
+    if show_obj.lang and not show_obj.lang == 'en':
+        ltvdb_api_parms['language'] = show_obj.lang
+
+    t = tvdb_api.Tvdb(actors=actors, banners=banners, **ltvdb_api_parms)
+    return t[int(show_obj.tvdbid)]
+
+def getTVDBShow(show_obj, actors=False, banners=False):
+    """
+    Returns the TVDB show object for show_obj. While a shared data block is active for the
+    show (see sharedShowData) the same object is handed to every metadata provider, otherwise
+    a new one is loaded from TVDB.
+
+    Raises the same tvdb_exceptions as looking the show up on a tvdb_api.Tvdb instance.
+    """
+
+    show_data = _getSharedShowData(show_obj)
+    if show_data:
+        return show_data.get_tvdb_show()
+
+    return _loadTVDBShow(show_obj, actors, banners)
+
+
+class SharedShowData(object):
+    """
+    The TVDB data and show artwork (posters, fanart, banners and season images) fetched while
+    writing the metadata of one show. Every enabled metadata provider gets the same copy instead
+    of fetching its own.
+    """
+
+    def __init__(self, show_obj):
+        self.show = show_obj
+        self.refs = 0
+
+        # key -> [event set once it's loaded, result, exception]
+        self._loads = {}
+
+        self.lock = threading.Lock()
+
+    def _load(self, key, loader):
+        """
+        Returns what loader returns (or raises what it raised), it's only called once for each key. The
+        lock is only held to find the key so the loading itself doesn't hold up anything else, whoever
+        asks for the same key while it's loading waits for it and gets the same result.
+        """
+
+        with self.lock:
+            entry = self._loads.get(key)
+            loading = entry is None
+            if loading:
+                entry = self._loads[key] = [threading.Event(), None, None]
+
+        if loading:
+            try:
+                try:
+                    entry[1] = loader()
+                except Exception, e:
+                    entry[2] = e
+            finally:
+                entry[0].set()
+        else:
+            entry[0].wait()
+
+        # if it failed once don't make the other providers wait for it to fail again
+        if entry[2] is not None:
+            raise entry[2]
+
+        return entry[1]
+
+    def get_tvdb_show(self):
+        # load it with everything any provider could need so it only has to happen once
+        return self._load('tvdb', lambda: _loadTVDBShow(self.show, actors=True, banners=True))
+
+    def get_image(self, url):
+        return self._load(('image', url), lambda: _downloadShowImage(url))
+
+_shared_show_data = {}
+_shared_show_data_lock = threading.Lock()
+
+def _getSharedShowData(show_obj):
+    if show_obj is None:
+        return None
+
+    with _shared_show_data_lock:
+        return _shared_show_data.get(show_obj.tvdbid)
+
+class sharedShowData(object):
+    """
+    Makes all metadata providers share one SharedShowData for show_obj for the duration
+    of the with block. Blocks can be nested, the data is dropped when the outermost one exits.
+
+    with sharedShowData(show_obj):
+        ...
+    """
+
+    def __init__(self, show_obj):
+        self.show = show_obj
+
+    def __enter__(self):
+        with _shared_show_data_lock:
+            show_data = _shared_show_data.get(self.show.tvdbid)
+            if not show_data:
+                show_data = _shared_show_data[self.show.tvdbid] = SharedShowData(self.show)
+            show_data.refs += 1
+
+        return show_data
+
+    def __exit__(self, exc_type, exc_value, tb):
+        with _shared_show_data_lock:
+            show_data = _shared_show_data[self.show.tvdbid]
+            show_data.refs -= 1
+            if show_data.refs <= 0:
+                del _shared_show_data[self.show.tvdbid]
+
+        return False
+
+
+# number of threads writing metadata files in parallel
+METADATA_WRITE_THREADS = 4
+
+class MetadataWriterPool(object):
+    """
+    A fixed number of threads which run metadata jobs (building and writing NFOs, downloading
+    thumbnails). The job queue is bounded so whoever adds jobs waits for the workers instead
+    of piling up every episode of a show at once.
+    """
+
+    def __init__(self, num_threads=METADATA_WRITE_THREADS, name="METADATA"):
+
+        self._queue = Queue.Queue(num_threads * 2)
+        self._threads = []
+
+        for i in range(num_threads):
+            cur_thread = threading.Thread(None, self._run, name + "-" + str(i + 1))
+            cur_thread.setDaemon(True)
+            cur_thread.start()
+            self._threads.append(cur_thread)
+
+    def _run(self):
+
+        while True:
+            job = self._queue.get()
+
+            # None means there's nothing left to do
+            if job is None:
+                return
+
+            function, args = job
+
+            try:
+                function(*args)
+            except Exception, e:
+                logger.log(u"Exception generated while writing metadata: " + ex(e), logger.ERROR)
+                logger.log(traceback.format_exc(), logger.DEBUG)
+
+    def add_job(self, function, *args):
+        self._queue.put((function, args))
+
+    def finish(self):
+        """
+        Waits until all the queued jobs are done and stops the threads.
+        """
+
+        for cur_thread in self._threads:
+            self._queue.put(None)
+
+        for cur_thread in self._threads:
+            cur_thread.join()
+
 
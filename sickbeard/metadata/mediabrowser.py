@@ -26,8 +26,9 @@ import generic
 
 from sickbeard.common import XML_NSMAP
 from sickbeard import logger, exceptions, helpers
+from sickbeard.metadata import helpers as metadata_helpers
 from sickbeard import encodingKludge as ek
-from lib.tvdb_api import tvdb_api, tvdb_exceptions
+from lib.tvdb_api import tvdb_exceptions
 from sickbeard.exceptions import ex
 
 import xml.etree.cElementTree as etree
@@ -159,22 +160,12 @@ class MediaBrowserMetadata(generic.GenericMetadata):
         show_obj: a TVShow instance to create the NFO for
         """
 
-        tvdb_lang = show_obj.lang
-        # There's gotta be a better way of doing this but we don't wanna
-        # change the language value elsewhere
-        ltvdb_api_parms = sickbeard.TVDB_API_PARMS.copy()
-
-        if tvdb_lang and not tvdb_lang == 'en':
-            ltvdb_api_parms['language'] = tvdb_lang
-
-        t = tvdb_api.Tvdb(actors=True, **ltvdb_api_parms)
-    
         tv_node = etree.Element("Series")
         for ns in XML_NSMAP.keys():
             tv_node.set(ns, XML_NSMAP[ns])
     
         try:
-            myShow = t[int(show_obj.tvdbid)]
+            myShow = metadata_helpers.getTVDBShow(show_obj, actors=True)
         except tvdb_exceptions.tvdb_shownotfound:
             logger.log("Unable to find show with id " + str(show_obj.tvdbid) + " on tvdb, skipping it", logger.ERROR)
             raise
@@ -267,18 +258,8 @@ class MediaBrowserMetadata(generic.GenericMetadata):
         
         eps_to_write = [ep_obj] + ep_obj.relatedEps
         
-        tvdb_lang = ep_obj.show.lang
-    
         try:
-            # There's gotta be a better way of doing this but we don't wanna
-            # change the language value elsewhere
-            ltvdb_api_parms = sickbeard.TVDB_API_PARMS.copy()
-
-            if tvdb_lang and not tvdb_lang == 'en':
-                ltvdb_api_parms['language'] = tvdb_lang
-
-            t = tvdb_api.Tvdb(actors=True, **ltvdb_api_parms)
-            myShow = t[ep_obj.show.tvdbid]
+            myShow = metadata_helpers.getTVDBShow(ep_obj.show, actors=True)
         except tvdb_exceptions.tvdb_shownotfound, e:
             raise exceptions.ShowNotFoundException(e.message)
         except tvdb_exceptions.tvdb_error, e:
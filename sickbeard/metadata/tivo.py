@@ -24,11 +24,12 @@ import sickbeard
 
 #from sickbeard.common import *
 from sickbeard import logger, exceptions, helpers
+from sickbeard.metadata import helpers as metadata_helpers
 from sickbeard.metadata import generic
 from sickbeard import encodingKludge as ek
 from sickbeard import config
 
-from lib.tvdb_api import tvdb_api, tvdb_exceptions
+from lib.tvdb_api import tvdb_exceptions
 
 class TIVOMetadata(generic.GenericMetadata):
     """
@@ -130,18 +131,8 @@ class TIVOMetadata(generic.GenericMetadata):
                 
         eps_to_write = [ep_obj] + ep_obj.relatedEps
         
-        tvdb_lang = ep_obj.show.lang
-    
         try:
-            # There's gotta be a better way of doing this but we don't wanna
-            # change the language value elsewhere
-            ltvdb_api_parms = sickbeard.TVDB_API_PARMS.copy()
-
-            if tvdb_lang and not tvdb_lang == 'en':
-                ltvdb_api_parms['language'] = tvdb_lang
-
-            t = tvdb_api.Tvdb(actors=True, **ltvdb_api_parms)
-            myShow = t[ep_obj.show.tvdbid]
+            myShow = metadata_helpers.getTVDBShow(ep_obj.show, actors=True)
         except tvdb_exceptions.tvdb_shownotfound, e:
             raise exceptions.ShowNotFoundException(str(e))
         except tvdb_exceptions.tvdb_error, e:
@@ -293,27 +284,11 @@ class TIVOMetadata(generic.GenericMetadata):
             return False
         
         nfo_file_path = self.get_episode_file_path(ep_obj)
-        nfo_file_dir = ek.ek(os.path.dirname, nfo_file_path)
-        
-        try:
-            if not ek.ek(os.path.isdir, nfo_file_dir):
-                logger.log("Metadata dir didn't exist, creating it at "+nfo_file_dir, logger.DEBUG)
-                ek.ek(os.makedirs, nfo_file_dir)
-                helpers.chmodAsParent(nfo_file_dir)
-            
-            logger.log(u"Writing episode nfo file to "+nfo_file_path)
-            nfo_file = ek.ek(open, nfo_file_path, 'w')
-            
-            # Calling encode directly, b/c often descriptions have wonky characters.
-            nfo_file.write( data.encode( "utf-8" ) )
-            
-            nfo_file.close()
-            helpers.chmodAsParent(nfo_file_path)
-        except IOError, e:
-            logger.log(u"Unable to write file to "+nfo_file_path+" - are you sure the folder is writable? "+str(e).decode('utf-8'), logger.ERROR)
-            return False
-        
-        return True
+
+        logger.log(u"Writing episode nfo file to "+nfo_file_path)
+
+        # Calling encode directly, b/c often descriptions have wonky characters.
+        return self._write_file(data.encode("utf-8"), nfo_file_path)
 
 # present a standard "interface"
 metadata_class = TIVOMetadata
@@ -25,8 +25,9 @@ import sickbeard
 import generic
 
 from sickbeard import logger, exceptions, helpers
+from sickbeard.metadata import helpers as metadata_helpers
 from sickbeard import encodingKludge as ek
-from lib.tvdb_api import tvdb_api, tvdb_exceptions
+from lib.tvdb_api import tvdb_exceptions
 from sickbeard.exceptions import ex
 
 import xml.etree.cElementTree as etree
@@ -137,18 +138,8 @@ class WDTVMetadata(generic.GenericMetadata):
         
         eps_to_write = [ep_obj] + ep_obj.relatedEps
         
-        tvdb_lang = ep_obj.show.lang
-    
         try:
-            # There's gotta be a better way of doing this but we don't wanna
-            # change the language value elsewhere
-            ltvdb_api_parms = sickbeard.TVDB_API_PARMS.copy()
-
-            if tvdb_lang and not tvdb_lang == 'en':
-                ltvdb_api_parms['language'] = tvdb_lang
-
-            t = tvdb_api.Tvdb(actors=True, **ltvdb_api_parms)
-            myShow = t[ep_obj.show.tvdbid]
+            myShow = metadata_helpers.getTVDBShow(ep_obj.show, actors=True)
         except tvdb_exceptions.tvdb_shownotfound, e:
             raise exceptions.ShowNotFoundException(e.message)
         except tvdb_exceptions.tvdb_error, e:
@@ -16,112 +16,143 @@
 # You should have received a copy of the GNU General Public License
 # along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
 
-import urllib2
+import tempfile
+import httplib
+import zlib
 
 import xml.etree.cElementTree as etree
-import xml.etree
 import re
 
 from name_parser.parser import NameParser, InvalidNameException
 
 from sickbeard import logger, classes, helpers
 from sickbeard.common import Quality
+from sickbeard.exceptions import ex
 
-def getSeasonNZBs(name, urlData, season):
+# episode NZBs bigger than this are spooled to disk instead of being kept in memory
+SPOOL_SIZE = 256 * 1024
 
-    try:
-        showXML = etree.ElementTree(etree.XML(urlData))
-    except SyntaxError:
-        logger.log(u"Unable to parse the XML of "+name+", not splitting it", logger.ERROR)
-        return ({},'')
+def splitTag(tag):
+    """
+    Splits an ElementTree tag like {http://www.newzbin.com/DTD/2003/nzb}file into its namespace and name
+    """
 
-    filename = name.replace(".nzb", "")
+    if tag.startswith('{'):
+        return tuple(tag[1:].split('}', 1))
+
+    return (None, tag)
 
-    nzbElement = showXML.getroot()
+def stripNS(element, ns):
+    if ns:
+        prefix = "{" + ns + "}"
+        for curElement in element.getiterator():
+            if curElement.tag.startswith(prefix):
+                curElement.tag = curElement.tag[len(prefix):]
+
+    return element
 
-    regex = '([\w\._\ ]+)[\. ]S%02d[\. ]([\w\._\-\ ]+)[\- ]([\w_\-\ ]+?)' % season
+def getSeasonNZBs(name, nzbFile, season, wantEpisode=None):
+    """
+    Splits a season NZB up into one NZB per episode while it's being read.
 
-    sceneNameMatch = re.search(regex, filename, re.I)
+    name: the name of the season NZB
+    nzbFile: a file-like object to read the season NZB from
+    season: the season number the NZB is for
+    wantEpisode: an optional function which is given each episode name when it's first found, any
+                 episode it returns False for is skipped
+
+    Returns a dict of episode name -> temporary file holding the complete NZB for that episode.
+    """
+
+    filename = name.replace(".nzb", "")
+
+    sceneNameMatch = re.search('([\w\._\ ]+)[\. ]S%02d[\. ]([\w\._\-\ ]+)[\- ]([\w_\-\ ]+?)' % season, filename, re.I)
     if sceneNameMatch:
         showName, qualitySection, groupName = sceneNameMatch.groups() #@UnusedVariable
     else:
         logger.log(u"Unable to parse "+name+" into a scene name. If it's a valid one log a bug.", logger.ERROR)
-        return ({},'')
+        return {}
 
     regex = '(' + re.escape(showName) + '\.S%02d(?:[E0-9]+)\.[\w\._]+\-\w+' % season + ')'
-    regex = regex.replace(' ', '.')
+    epRegex = re.compile(regex.replace(' ', '.'), re.I)
 
     epFiles = {}
+    skippedEps = set()
+    nzbHeader = None
     xmlns = None
+    root = None
 
-    for curFile in nzbElement.getchildren():
-        xmlnsMatch = re.match("\{(http:\/\/[A-Za-z0-9_\.\/]+\/nzb)\}file", curFile.tag)
-        if not xmlnsMatch:
-            continue
-        else:
-            xmlns = xmlnsMatch.group(1)
-        match = re.search(regex, curFile.get("subject"), re.I)
-        if not match:
-            #print curFile.get("subject"), "doesn't match", regex
-            continue
-        curEp = match.group(1)
-        if curEp not in epFiles:
-            epFiles[curEp] = [curFile]
-        else:
-            epFiles[curEp].append(curFile)
-
-    return (epFiles, xmlns)
-
-def createNZBString(fileElements, xmlns):
-
-    rootElement = etree.Element("nzb")
-    if xmlns:
-        rootElement.set("xmlns", xmlns)
-
-    for curFile in fileElements:
-        rootElement.append(stripNS(curFile, xmlns))
-
-    return xml.etree.ElementTree.tostring(rootElement, 'utf-8')
-
-
-def saveNZB(nzbName, nzbString):
+    try:
+        for event, curElement in etree.iterparse(nzbFile, ('start', 'end')):
+
+            # the root element tells us the namespace the whole NZB uses
+            if root is None:
+                root = curElement
+                xmlns = splitTag(root.tag)[0]
+                if xmlns:
+                    nzbHeader = '<nzb xmlns="' + xmlns + '">'
+                else:
+                    nzbHeader = '<nzb>'
+                continue
+
+            if event != 'end' or splitTag(curElement.tag)[1] != 'file':
+                continue
+
+            match = epRegex.search(curElement.get("subject", ''))
+            if match:
+                curEp = match.group(1)
+
+                if curEp not in epFiles and curEp not in skippedEps:
+                    if wantEpisode and not wantEpisode(curEp):
+                        skippedEps.add(curEp)
+                    else:
+                        epFiles[curEp] = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+                        epFiles[curEp].write(nzbHeader)
+
+                if curEp in epFiles:
+                    curElement.tail = None
+                    epFiles[curEp].write(etree.tostring(stripNS(curElement, xmlns), 'utf-8'))
+
+            # throw away everything we've read so far so memory use stays flat no matter how big the NZB is
+            root.clear()
+
+    # the NZB is read as it downloads so a dropped connection or a broken gzip stream shows up here too
+    except (SyntaxError, IOError, EnvironmentError, httplib.HTTPException, zlib.error), e:
+        logger.log(u"Unable to read the XML of "+name+", not splitting it: "+ex(e), logger.ERROR)
+        for curFile in epFiles.values():
+            curFile.close()
+        return {}
+
+    for curFile in epFiles.values():
+        curFile.write('</nzb>')
+        curFile.seek(0)
+
+    return epFiles
+
+def saveNZB(nzbName, nzbFile):
 
     nzb_fh = open(nzbName+".nzb", 'w')
-    nzb_fh.write(nzbString)
+    nzbFile.seek(0)
+    for chunk in iter(lambda: nzbFile.read(helpers.URL_CHUNK_SIZE), ''):
+        nzb_fh.write(chunk)
     nzb_fh.close()
 
-def stripNS(element, ns):
-    element.tag = element.tag.replace("{"+ns+"}", "")
-    for curChild in element.getchildren():
-        stripNS(curChild, ns)
-
-    return element
-
-
 def splitResult(result):
 
-    urlData = helpers.getURL(result.url)
-
-    if urlData is None:
-        logger.log(u"Unable to load url "+result.url+", can't download season NZB", logger.ERROR)
-        return False
-
     # parse the season ep name
     try:
         np = NameParser(False)
         parse_result = np.parse(result.name, True)
     except InvalidNameException:
         logger.log(u"Unable to parse the filename "+result.name+" into a valid episode", logger.WARNING)
-        return False
+        return []
 
     # bust it up
     season = parse_result.season_number if parse_result.season_number != None else 1
 
-    separateNZBs, xmlns = getSeasonNZBs(result.name, urlData, season)
+    epParseResults = {}
 
-    resultList = []
-
-    for newNZB in separateNZBs:
+    def wantEpisode(newNZB):
 
         logger.log(u"Split out "+newNZB+" from "+result.name, logger.DEBUG)
 
@@ -136,23 +167,37 @@ def splitResult(result):
         # make sure the result is sane
         if (parse_result.season_number != None and parse_result.season_number != season) or (parse_result.season_number == None and season != 1):
             logger.log(u"Found "+newNZB+" inside "+result.name+" but it doesn't seem to belong to the same season, ignoring it", logger.WARNING)
-            continue
+            return False
         elif len(parse_result.episode_numbers) == 0:
             logger.log(u"Found "+newNZB+" inside "+result.name+" but it doesn't seem to be a valid episode NZB, ignoring it", logger.WARNING)
-            continue
+            return False
 
-        wantEp = True
         for epNo in parse_result.episode_numbers:
             if not result.extraInfo[0].wantEpisode(season, epNo, result.quality):
                 logger.log(u"Ignoring result "+newNZB+" because we don't want an episode that is "+Quality.qualityStrings[result.quality], logger.DEBUG)
-                wantEp = False
-                break
-        if not wantEp:
-            continue
+                return False
+
+        epParseResults[newNZB] = parse_result
+        return True
+
+    nzbFile = helpers.getURLStream(result.url)
+
+    if nzbFile is None:
+        logger.log(u"Unable to load url "+result.url+", can't download season NZB", logger.ERROR)
+        return []
+
+    try:
+        separateNZBs = getSeasonNZBs(result.name, nzbFile, season, wantEpisode)
+    finally:
+        nzbFile.close()
+
+    resultList = []
+
+    for newNZB in separateNZBs:
 
         # get all the associated episode objects
         epObjList = []
-        for curEp in parse_result.episode_numbers:
+        for curEp in epParseResults[newNZB].episode_numbers:
             epObjList.append(result.extraInfo[0].getEpisode(season, curEp))
 
         # make a result
@@ -160,7 +205,7 @@ def splitResult(result):
         curResult.name = newNZB
         curResult.provider = result.provider
         curResult.quality = result.quality
-        curResult.extraInfo = [createNZBString(separateNZBs[newNZB], xmlns)]
+        curResult.extraInfo = [separateNZBs[newNZB]]
 
         resultList.append(curResult)
 
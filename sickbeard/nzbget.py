@@ -18,8 +18,11 @@
 
 
 
+from __future__ import with_statement
+
 import httplib
 import datetime
+import threading
 
 import sickbeard
 
@@ -30,23 +33,34 @@ from sickbeard.providers.generic import GenericProvider
 
 from sickbeard import logger
 
-def sendNZB(nzb):
+nzbgetXMLrpc = "http://nzbget:%(password)s@%(host)s/xmlrpc"
 
-    addToTop = False
-    nzbgetXMLrpc = "http://nzbget:%(password)s@%(host)s/xmlrpc"
+_proxy = None
+_proxy_url = None
+_proxy_lock = threading.Lock()
 
-    if sickbeard.NZBGET_HOST == None:
-        logger.log(u"No NZBget host found in configuration. Please configure it.", logger.ERROR)
-        return False
+def _getProxy():
+    """
+    Returns the XML-RPC proxy for NZBget, reusing the last one (and its open connection) if the settings haven't changed
+    """
+
+    global _proxy, _proxy_url
 
     url = nzbgetXMLrpc % {"host": sickbeard.NZBGET_HOST, "password": sickbeard.NZBGET_PASSWORD}
 
-    nzbGetRPC = xmlrpclib.ServerProxy(url)
+    if _proxy is None or url != _proxy_url:
+        _proxy = xmlrpclib.ServerProxy(url)
+        _proxy_url = url
+
+    return _proxy
+
+def _checkConnection(nzbGetRPC, message):
+
     try:
-        if nzbGetRPC.writelog("INFO", "Sickbeard connected to drop of %s any moment now." % (nzb.name + ".nzb")):
+        if nzbGetRPC.writelog("INFO", message):
             logger.log(u"Successful connected to NZBget", logger.DEBUG)
         else:
-            logger.log(u"Successful connected to NZBget, but unable to send a message" % (nzb.name + ".nzb"), logger.ERROR)
+            logger.log(u"Successful connected to NZBget, but unable to send a message", logger.ERROR)
 
     except httplib.socket.error:
         logger.log(u"Please check your NZBget host and port (if it is running). NZBget is not responding to this combination", logger.ERROR)
@@ -59,30 +73,110 @@ def sendNZB(nzb):
             logger.log(u"Protocol Error: " + e.errmsg, logger.ERROR)
         return False
 
-    # if it aired recently make it high priority
-    for curEp in nzb.episodes:
-        if datetime.date.today() - curEp.airdate <= datetime.timedelta(days=7):
-            addToTop = True
+    return True
+
+def _getNZBContent(nzb):
+    """
+    Returns the NZB's data base64 encoded the way NZBget wants it, or None if it couldn't be downloaded
+    """
 
     # if it's a normal result need to download the NZB content
     if nzb.resultType == "nzb":
         genProvider = GenericProvider("")
         data = genProvider.getURL(nzb.url)
         if (data == None):
-            return False
+            return None
 
     # if we get a raw data result thats even better
     elif nzb.resultType == "nzbdata":
-        data = nzb.extraInfo[0]
+        data = nzb.getNZBData()
+
+    return standard_b64encode(data)
 
-    nzbcontent64 = standard_b64encode(data)
+def _addToTop(nzb):
 
-    logger.log(u"Sending NZB to NZBget")
-    logger.log(u"URL: " + url, logger.DEBUG)
+    # if it aired recently make it high priority
+    for curEp in nzb.episodes:
+        if datetime.date.today() - curEp.airdate <= datetime.timedelta(days=7):
+            return True
+
+    return False
+
+def sendNZBs(nzbs):
+    """
+    Sends a batch of NZBs to NZBget in a single XML-RPC multicall (or one call after the other over
+    the same connection if NZBget doesn't support multicall).
+
+    nzbs: A list of NZBSearchResult objects to send to NZBget
+
+    Returns: A list of bools saying which of the NZBs were sent
+    """
+
+    results = [False] * len(nzbs)
+
+    if sickbeard.NZBGET_HOST == None:
+        logger.log(u"No NZBget host found in configuration. Please configure it.", logger.ERROR)
+        return results
+
+    with _proxy_lock:
+
+        nzbGetRPC = _getProxy()
+
+        if len(nzbs) == 1:
+            message = "Sickbeard connected to drop of %s any moment now." % (nzbs[0].name + ".nzb")
+        else:
+            message = "Sickbeard connected to drop of %d NZBs any moment now." % len(nzbs)
+
+        if not _checkConnection(nzbGetRPC, message):
+            return results
+
+        # (index, args for append)
+        toSend = []
+        for i, curNZB in enumerate(nzbs):
+            nzbcontent64 = _getNZBContent(curNZB)
+            if nzbcontent64 == None:
+                continue
+            toSend.append((i, (curNZB.name + ".nzb", sickbeard.NZBGET_CATEGORY, _addToTop(curNZB), nzbcontent64)))
+
+        if not toSend:
+            return results
+
+        logger.log(u"Sending " + str(len(toSend)) + " NZBs to NZBget")
+        logger.log(u"URL: " + _proxy_url, logger.DEBUG)
+
+        multicall = xmlrpclib.MultiCall(nzbGetRPC)
+        for i, args in toSend:
+            multicall.append(*args)
+
+        try:
+            try:
+                multicallResults = multicall()
+                answers = []
+                for k in range(len(toSend)):
+                    try:
+                        answers.append(multicallResults[k])
+                    except xmlrpclib.Fault, e:
+                        logger.log(u"NZBget returned an error for " + toSend[k][1][0] + ": " + e.faultString, logger.DEBUG)
+                        answers.append(False)
+
+            # older versions don't know system.multicall
+            except xmlrpclib.Fault, e:
+                logger.log(u"NZBget doesn't support multicall, sending the NZBs one at a time: " + e.faultString, logger.DEBUG)
+                answers = [nzbGetRPC.append(*args) for i, args in toSend]
+
+        except (httplib.socket.error, xmlrpclib.Error), e:
+            logger.log(u"Unable to send the NZBs to NZBget: " + str(e), logger.ERROR)
+            return results
+
+        for (i, args), answer in zip(toSend, answers):
+            if answer:
+                logger.log(u"NZB sent to NZBget successfully", logger.DEBUG)
+                results[i] = True
+            else:
+                logger.log(u"NZBget could not add %s to the queue" % args[0], logger.ERROR)
+
+    return results
+
+def sendNZB(nzb):
 
-    if nzbGetRPC.append(nzb.name + ".nzb", sickbeard.NZBGET_CATEGORY, addToTop, nzbcontent64):
-        logger.log(u"NZB sent to NZBget successfully", logger.DEBUG)
-        return True
-    else:
-        logger.log(u"NZBget could not add %s to the queue" % (nzb.name + ".nzb"), logger.ERROR)
-        return False
\ No newline at end of file
+    return sendNZBs([nzb])[0]
@@ -318,7 +318,7 @@ class PostProcessor(object):
 
         # search the database for a possible match and return immediately if we find one
         for curName in names:
-            sql_results = myDB.select("SELECT * FROM history WHERE resource LIKE ?", [re.sub("[\.\-\ ]", "_", curName)])
+            sql_results = myDB.select("SELECT * FROM history WHERE resource_key = ?", [history.resourceKey(curName)])
 
             if len(sql_results) == 0:
                 continue
@@ -26,6 +26,7 @@ from sickbeard import exceptions
 from sickbeard.exceptions import ex
 from sickbeard import helpers, logger, show_name_helpers
 from sickbeard import providers
+from sickbeard import provider_health
 from sickbeard import search
 from sickbeard import history
 
@@ -73,6 +74,10 @@ class ProperFinder():
             if not curProvider.isActive():
                 continue
 
+            if not provider_health.canTry(curProvider.getID()):
+                logger.log(u"Skipping " + curProvider.name + " because it has been failing", logger.DEBUG)
+                continue
+
             search_date = datetime.datetime.today() - datetime.timedelta(days=2)
 
             logger.log(u"Searching for any new PROPER releases from " + curProvider.name)
@@ -80,6 +85,7 @@ class ProperFinder():
                 curPropers = curProvider.findPropers(search_date)
             except exceptions.AuthException, e:
                 logger.log(u"Authentication error: " + ex(e), logger.ERROR)
+                provider_health.recordAuthFailure(curProvider.getID(), ex(e))
                 continue
 
             # if they haven't been added by a different provider than add the proper to the list
@@ -0,0 +1,285 @@
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import with_statement
+
+import collections
+import datetime
+import threading
+import time
+
+import sickbeard
+
+from sickbeard import logger
+
+# consecutive failures before a provider is skipped
+FAILURE_THRESHOLD = 3
+
+# or if at least this many of the recent requests failed
+ERROR_RATE_THRESHOLD = 0.5
+ERROR_RATE_MIN_REQUESTS = 10
+
+# how long a failing provider is skipped for, doubling every time it fails again right after
+COOLDOWN = 5 * 60
+MAX_COOLDOWN = 60 * 60
+
+# adaptive timeouts are this many times the 95th percentile latency, but never less than MIN_TIMEOUT
+# or more than sickbeard.SOCKET_TIMEOUT
+TIMEOUT_FACTOR = 4
+MIN_TIMEOUT = 10
+MIN_SAMPLES = 5
+
+HISTORY_SIZE = 100
+
+# a retry which hasn't reported back after this many seconds (eg. the thread never sent the request)
+# is given up on and the next caller gets to try
+PROBE_TIMEOUT = 2 * 60
+
+CLOSED = 'ok'
+OPEN = 'open'
+HALF_OPEN = 'retrying'
+
+
+class ProviderHealth(object):
+    """
+    Keeps track of how well requests to one provider are going and decides when to stop
+    sending it any more (a circuit breaker).
+    """
+
+    def __init__(self, provider_id):
+        self.provider_id = provider_id
+
+        # seconds taken by recent successful requests
+        self.latencies = collections.deque(maxlen=HISTORY_SIZE)
+        # True/False for recent requests
+        self.outcomes = collections.deque(maxlen=HISTORY_SIZE)
+
+        self.requests = 0
+        self.errors = 0
+        self.auth_failures = 0
+        self.consecutive_failures = 0
+
+        self.last_error = None
+        self.last_error_time = None
+
+        self.open_until = None
+        self.cooldown = COOLDOWN
+
+        # the thread making the one retry request once the cooldown is over, and when it got the go ahead
+        self.probe_thread = None
+        self.probe_time = None
+
+        self.lock = threading.Lock()
+
+    def state(self):
+        if self.open_until is None:
+            return CLOSED
+        elif time.time() < self.open_until:
+            return OPEN
+        else:
+            return HALF_OPEN
+
+    def _probeFree(self):
+        """
+        Returns True if the current thread could make the retry request, nobody else is making it
+        """
+
+        return self.probe_thread is None or self.probe_thread is threading.current_thread() or time.time() - self.probe_time > PROBE_TIMEOUT
+
+    def canTry(self):
+        """
+        Returns True if requests could be sent to the provider right now. It doesn't change anything so
+        it's what planning and the UI use, the request itself goes through tryRequest.
+        """
+
+        state = self.state()
+        if state != HALF_OPEN:
+            return state == CLOSED
+
+        with self.lock:
+            return self._probeFree()
+
+    def tryRequest(self):
+        """
+        Returns True if a request can be sent to the provider now. Once the cooldown is over only one
+        thread at a time is let through to retry it, the rest still skip it until that retry has worked.
+        """
+
+        state = self.state()
+        if state != HALF_OPEN:
+            return state == CLOSED
+
+        with self.lock:
+            if not self._probeFree():
+                return False
+
+            if self.probe_thread is not threading.current_thread():
+                logger.log(u"Trying provider " + self.provider_id + " again", logger.DEBUG)
+                self.probe_thread = threading.current_thread()
+                self.probe_time = time.time()
+
+            return True
+
+    def percentile(self, percent):
+        """
+        Returns the given percentile of the recent request latencies in seconds, or None if there aren't any
+        """
+
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100.0))]
+
+    def errorRate(self):
+        if not self.outcomes:
+            return 0.0
+
+        return float(self.outcomes.count(False)) / len(self.outcomes)
+
+    def timeout(self):
+        """
+        Returns how long to wait for the provider, based on how long it's been taking lately
+        """
+
+        if len(self.latencies) < MIN_SAMPLES:
+            return sickbeard.SOCKET_TIMEOUT
+
+        return int(min(sickbeard.SOCKET_TIMEOUT, max(MIN_TIMEOUT, self.percentile(95) * TIMEOUT_FACTOR)))
+
+    def recordSuccess(self, seconds):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(seconds)
+            self.outcomes.append(True)
+
+            self.consecutive_failures = 0
+
+            if self.open_until is not None:
+                logger.log(u"Provider " + self.provider_id + " is responding again", logger.MESSAGE)
+                self.open_until = None
+                self.cooldown = COOLDOWN
+                self.probe_thread = None
+
+    def recordFailure(self, error, auth=False):
+        with self.lock:
+            self.requests += 1
+            self.errors += 1
+            self.outcomes.append(False)
+
+            if auth:
+                self.auth_failures += 1
+
+            self.consecutive_failures += 1
+            self.last_error = error
+            self.last_error_time = time.time()
+
+            state = self.state()
+
+            # a failed retry sends it straight back to being skipped, for longer
+            if state == HALF_OPEN:
+                self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN)
+                self._open()
+
+            elif state == CLOSED and (auth or self.consecutive_failures >= FAILURE_THRESHOLD or \
+                    (len(self.outcomes) >= ERROR_RATE_MIN_REQUESTS and self.errorRate() >= ERROR_RATE_THRESHOLD)):
+                self._open()
+
+    def _open(self):
+        self.open_until = time.time() + self.cooldown
+        self.probe_thread = None
+        logger.log(u"Provider " + self.provider_id + " keeps failing (" + unicode(self.last_error) + "), skipping it for " + str(self.cooldown / 60) + " minutes", logger.WARNING)
+
+    def retryTime(self):
+        """
+        Returns when the provider will be tried again as a datetime, or None if it isn't being skipped
+        """
+
+        if self.state() != OPEN:
+            return None
+
+        return datetime.datetime.fromtimestamp(self.open_until)
+
+    def toDict(self):
+        retryTime = self.retryTime()
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+
+        return {"provider": self.provider_id,
+                "state": self.state(),
+                "retry_time": retryTime.strftime("%Y-%m-%d %H:%M") if retryTime else None,
+                "requests": self.requests,
+                "errors": self.errors,
+                "error_rate": round(self.errorRate(), 2),
+                "auth_failures": self.auth_failures,
+                "latency_p50": round(p50, 2) if p50 is not None else None,
+                "latency_p95": round(p95, 2) if p95 is not None else None,
+                "timeout": self.timeout(),
+                "last_error": self.last_error}
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+def getHealth(provider_id):
+    with _health_lock:
+        if provider_id not in _health:
+            _health[provider_id] = ProviderHealth(provider_id)
+
+        return _health[provider_id]
+
+def resetHealth():
+    """
+    Forgets everything, eg. after the provider settings were changed
+    """
+
+    with _health_lock:
+        _health.clear()
+
+def canTry(provider_id):
+    """
+    Returns False if the provider has been failing and is being skipped for now
+    """
+
+    return getHealth(provider_id).canTry()
+
+def tryRequest(provider_id):
+    """
+    Like canTry but for when a request is about to be sent, see ProviderHealth.tryRequest
+    """
+
+    return getHealth(provider_id).tryRequest()
+
+def getTimeout(provider_id):
+    return getHealth(provider_id).timeout()
+
+def recordSuccess(provider_id, seconds):
+    getHealth(provider_id).recordSuccess(seconds)
+
+def recordFailure(provider_id, error):
+    getHealth(provider_id).recordFailure(error)
+
+def recordAuthFailure(provider_id, error):
+    getHealth(provider_id).recordFailure(error, auth=True)
+
+def healthReport():
+    """
+    Returns the ProviderHealth of every provider that's been used, sorted by provider id
+    """
+
+    with _health_lock:
+        return [_health[x] for x in sorted(_health)]
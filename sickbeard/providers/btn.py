@@ -23,6 +23,7 @@ import generic
 from sickbeard import classes
 from sickbeard import scene_exceptions
 from sickbeard import logger
+from sickbeard import request_budget
 from sickbeard import tvcache
 from sickbeard.helpers import sanitizeSceneName
 from sickbeard.common import Quality
@@ -34,6 +35,10 @@ import time
 import socket
 import math
 
+# the API sends at most 1000 results at a time, max 150 requests per hour so don't let one search use too many
+RESULTS_PER_PAGE = 1000
+MAX_PAGES = 35
+
 
 class BTNProvider(generic.TorrentProvider):
 
@@ -70,6 +75,10 @@ class BTNProvider(generic.TorrentProvider):
         return True
 
     def _doSearch(self, search_params, show=None, age=0):
+        """
+        Yields the results a page at a time, the next page is only requested once the caller has
+        gone through the previous one. Stop iterating to stop fetching.
+        """
 
         self._checkAuth()
 
@@ -83,56 +92,55 @@ class BTNProvider(generic.TorrentProvider):
         if search_params:
             params.update(search_params)
 
-        parsedJSON = self._api_call(apikey, params)
+        parsedJSON = self._api_call(apikey, params, RESULTS_PER_PAGE)
 
         if not parsedJSON:
             logger.log(u"No data returned from " + self.name, logger.ERROR)
-            return []
+            return
 
-        if self._checkAuthFromData(parsedJSON):
+        if not self._checkAuthFromData(parsedJSON):
+            return
 
-            if 'torrents' in parsedJSON:
-                found_torrents = parsedJSON['torrents']
-            else:
-                found_torrents = {}
-
-            # We got something, we know the API sends max 1000 results at a time.
-            # See if there are more than 1000 results for our query, if not we
-            # keep requesting until we've got everything.
-            # max 150 requests per hour so limit at that. Scan every 15 minutes. 60 / 15 = 4.
-            max_pages = 35
-            results_per_page = 1000
-
-            if 'results' in parsedJSON and int(parsedJSON['results']) >= results_per_page:
-                pages_needed = int(math.ceil(int(parsedJSON['results']) / results_per_page))
-                if pages_needed > max_pages:
-                    pages_needed = max_pages
-
-                # +1 because range(1,4) = 1, 2, 3
-                for page in range(1, pages_needed + 1):
-                    parsedJSON = self._api_call(apikey, params, results_per_page, page * results_per_page)
-                    # Note that this these are individual requests and might time out individually. This would result in 'gaps'
-                    # in the results. There is no way to fix this though.
-                    if 'torrents' in parsedJSON:
-                        found_torrents.update(parsedJSON['torrents'])
-
-            results = []
+        # we know the API sends max 1000 results at a time, keep requesting until we've got everything
+        if 'results' in parsedJSON:
+            pages = min(int(math.ceil(int(parsedJSON['results']) / float(RESULTS_PER_PAGE))), MAX_PAGES)
+        else:
+            pages = 1
+
+        # the same torrent can turn up on two pages if something was uploaded in between
+        seen_torrents = set()
+
+        page = 0
+        while True:
+
+            found_torrents = parsedJSON.get('torrents') or {}
 
             for torrentid, torrent_info in found_torrents.iteritems():
+                if torrentid in seen_torrents:
+                    continue
+                seen_torrents.add(torrentid)
+
                 (title, url) = self._get_title_and_url(torrent_info)
 
                 if title and url:
-                    results.append(torrent_info)
+                    yield torrent_info
 
-            return results
+            page += 1
+            if page >= pages or self._budgetExhausted():
+                break
 
-        return []
+            # Note that these are individual requests and might time out individually. This would result in 'gaps'
+            # in the results. There is no way to fix this though.
+            logger.log(u"Requesting page " + str(page + 1) + " of " + str(pages) + " from " + self.name, logger.DEBUG)
+            parsedJSON = self._api_call(apikey, params, RESULTS_PER_PAGE, page * RESULTS_PER_PAGE)
 
-    def _api_call(self, apikey, params={}, results_per_page=1000, offset=0):
+    def _api_call(self, apikey, params={}, results_per_page=RESULTS_PER_PAGE, offset=0):
 
         server = jsonrpclib.Server('http://api.btnapps.net')
         parsedJSON = {}
 
+        request_budget.recordRequest(self.getID())
+
         try:
             parsedJSON = server.getTorrents(apikey, params, int(results_per_page), int(offset))
 
@@ -359,7 +367,7 @@ class BTNCache(tvcache.TVCache):
             logger.log(u"The last known successful update on " + self.provider.name + " was more than 24 hours ago, only trying to fetch the last 24 hours!", logger.WARNING)
             seconds_since_last_update = 86400
 
-        data = self.provider._doSearch(search_params=None, age=seconds_since_last_update)
+        data = list(self.provider._doSearch(search_params=None, age=seconds_since_last_update))
 
         return data
 
@@ -33,6 +33,8 @@ from sickbeard.common import Quality
 from sickbeard import logger
 from sickbeard import tvcache
 from sickbeard import helpers
+from sickbeard import feedreader
+from sickbeard import query_cache
 from sickbeard.exceptions import ex
 
 
@@ -123,23 +125,25 @@ class EZRSSProvider(generic.TorrentProvider):
 
         logger.log(u"Search string: " + search_url, logger.DEBUG)
 
+        results = query_cache.getCachedResults(self.getID(), search_url)
+        if results is not None:
+            return results
+
         data = self.getURL(search_url)
 
         if not data:
             logger.log(u"No data returned from " + search_url, logger.ERROR)
             return []
 
-        parsedXML = helpers.parse_xml(data)
+        feed = feedreader.FeedReader(data)
 
-        if parsedXML is None:
+        if not feed.readHeader():
             logger.log(u"Error trying to load " + self.name + " RSS feed", logger.ERROR)
             return []
 
-        items = parsedXML.findall('.//item')
-
         results = []
 
-        for curItem in items:
+        for curItem in feed:
 
             (title, url) = self._get_title_and_url(curItem)
 
@@ -152,6 +156,8 @@ class EZRSSProvider(generic.TorrentProvider):
                 continue
             results.append(curItem)
 
+        query_cache.cacheResults(self.getID(), search_url, results)
+
         return results
 
     def _get_title_and_url(self, item):
@@ -202,17 +208,17 @@ class EZRSSCache(tvcache.TVCache):
                     logger.log(u"Feed result is empty!", logger.ERROR)
                     return False
 
-                parsedXML = helpers.parse_xml(feed)
+                parsedFeed = feedreader.FeedReader(feed)
 
-                if parsedXML is None:
+                if not parsedFeed.readHeader():
                     logger.log(u"Resulting XML isn't XML, not parsing it", logger.ERROR)
                     return False
                 else:
-                    items = parsedXML.findall('.//item')
+                    # only the first item is needed so there's no need to read the rest of the feed
+                    item = parsedFeed.firstItem
 
-                    if len(items) > 0:
-                        item = items[0]
-                        pubDate = helpers.get_xml_text(item.find('pubDate'))
+                    if item is not None:
+                        pubDate = item.pubdate
 
                         # pubDate has a timezone, but it makes things much easier if
                         # we ignore it (and we don't need that level of accuracy anyway)
@@ -31,11 +31,15 @@ import sickbeard
 
 from sickbeard import helpers, classes, logger, db
 
-from sickbeard.common import Quality, MULTI_EP_RESULT, SEASON_RESULT
+from sickbeard.common import Quality, MULTI_EP_RESULT, SEASON_RESULT, WANTED, UNAIRED, DOWNLOADED, SNATCHED, SNATCHED_PROPER
 from sickbeard import tvcache
 from sickbeard import encodingKludge as ek
 from sickbeard.exceptions import ex
 from sickbeard import downloader
+from sickbeard import request_budget
+from sickbeard import provider_health
+from sickbeard import feedreader
+from sickbeard import show_name_helpers
 
 from sickbeard.name_parser.parser import NameParser, InvalidNameException
 
@@ -113,7 +117,19 @@ class GenericProvider:
         if not headers:
             headers = []
 
-        data = helpers.getURL(url, headers)
+        if not provider_health.tryRequest(self.getID()):
+            logger.log(u"Skipping " + self.name + " URL " + url + " because the provider has been failing", logger.DEBUG)
+            return None
+
+        request_budget.recordRequest(self.getID())
+
+        startTime = time.time()
+        data = helpers.getURL(url, headers, provider_health.getTimeout(self.getID()))
+
+        if data is None:
+            provider_health.recordFailure(self.getID(), u"Unable to load " + url)
+        else:
+            provider_health.recordSuccess(self.getID(), time.time() - startTime)
 
         if not data:
             logger.log(u"Error loading " + self.name + " URL: " + url, logger.ERROR)
@@ -121,6 +137,33 @@ class GenericProvider:
 
         return data
 
+    def getURLStream(self, url, headers=None):
+        """
+        Like getURL but returns a file-like object to read the data from as it downloads
+        """
+
+        if not headers:
+            headers = []
+
+        if not provider_health.tryRequest(self.getID()):
+            logger.log(u"Skipping " + self.name + " URL " + url + " because the provider has been failing", logger.DEBUG)
+            return None
+
+        request_budget.recordRequest(self.getID())
+
+        startTime = time.time()
+        stream = helpers.getURLStream(url, headers, provider_health.getTimeout(self.getID()))
+
+        if not stream:
+            provider_health.recordFailure(self.getID(), u"Unable to load " + url)
+            logger.log(u"Error loading " + self.name + " URL: " + url, logger.ERROR)
+            return None
+
+        # only the time until the response starts arriving is known here
+        provider_health.recordSuccess(self.getID(), time.time() - startTime)
+
+        return stream
+
     def downloadResult(self, result):
         """
         Save the result to disk.
@@ -168,12 +211,12 @@ class GenericProvider:
         # this is now simply overridden when it needs to be.
         return True
 
-    def searchRSS(self):
+    def searchRSS(self, merger=None):
 
         self._checkAuth()
         self.cache.updateCache()
 
-        return self.cache.findNeededEpisodes()
+        return self.cache.findNeededEpisodes(merger=merger)
 
     def getQuality(self, item):
         """
@@ -212,11 +255,21 @@ class GenericProvider:
         (so, rant over, we now need to cater for both cases here)
 
         @param item: An xml.dom.minidom.Node (or an elementtree.ElementTree
-                element) representing the <item> tag of the RSS feed.
+                element, or a feedreader.FeedItem) representing the <item> tag
+                of the RSS feed.
         @return: A tuple containing two strings representing title and URL
                 respectively.
         """
-        if isinstance(item, xml.dom.minidom.Node):
+        if isinstance(item, feedreader.FeedItem):
+            title = item.title
+            if title:
+                title = title.replace(' ', '.')
+
+            url = item.url
+            if url:
+                url = url.replace('&amp;', '&')
+
+        elif isinstance(item, xml.dom.minidom.Node):
             title = helpers.get_xml_text(item.getElementsByTagName('title')[0], mini_dom=True)
             try:
                 url = helpers.get_xml_text(item.getElementsByTagName('link')[0], mini_dom=True)
@@ -235,6 +288,61 @@ class GenericProvider:
 
         return (title, url)
 
+    def _searchItems(self, search_strings, show=None):
+        """
+        Yields the items found by each of the searches in turn. Providers whose _doSearch is a
+        generator only fetch as many pages as the caller ends up reading.
+        """
+
+        for cur_string in search_strings:
+            if self._budgetExhausted():
+                return
+            for item in self._doSearch(cur_string, show=show):
+                yield item
+
+    def _budgetExhausted(self):
+        """
+        Returns True (and logs it) if this provider's request budget is used up, searches check it
+        before each request so one search with many names or pages can't run far over the budget
+        """
+
+        if request_budget.isExhausted(self.getID()):
+            logger.log(u"The request budget for " + self.name + " is used up, not searching it any more for now", logger.DEBUG)
+            return True
+
+        return False
+
+    def _isFinalResult(self, result, show):
+        """
+        Returns True if the result is good enough that there's no point fetching any more results for its episodes
+        """
+
+        if not Quality.isFinalQuality(result.quality, show.quality):
+            return False
+
+        # it'll be thrown away later if it's not a proper release of the show
+        return show_name_helpers.filterBadReleases(result.name) and show_name_helpers.isGoodResult(result.name, show)
+
+    def _neededEpisodes(self, show, season):
+        """
+        Returns the set of episode numbers in the season which still need a download: the wanted
+        ones and the ones which could be upgraded
+        """
+
+        anyQualities, bestQualities = Quality.splitQuality(show.quality)  #@UnusedVariable
+        highestBestQuality = max(bestQualities) if bestQualities else 0
+
+        myDB = db.DBConnection()
+        sqlResults = myDB.select("SELECT episode, status FROM tv_episodes WHERE showid = ? AND season = ?", [show.tvdbid, season])
+
+        needed = set()
+        for cur_result in sqlResults:
+            curStatus, curQuality = Quality.splitCompositeStatus(int(cur_result["status"]))
+            if curStatus in (WANTED, UNAIRED) or (curStatus in (DOWNLOADED, SNATCHED, SNATCHED_PROPER) and curQuality < highestBestQuality):
+                needed.add(int(cur_result["episode"]))
+
+        return needed
+
     def findEpisode(self, episode, manualSearch=False):
 
         self._checkAuth()
@@ -257,12 +365,7 @@ class GenericProvider:
         if results or not manualSearch:
             return results
 
-        itemList = []
-
-        for cur_search_string in self._get_episode_search_strings(episode_scene):
-            itemList += self._doSearch(cur_search_string, show=episode.show)
-
-        for item in itemList:
+        for item in self._searchItems(self._get_episode_search_strings(episode_scene), show=episode.show):
 
             (title, url) = self._get_title_and_url(item)
 
@@ -302,17 +405,29 @@ class GenericProvider:
 
             results.append(result)
 
+            # nothing after this would be wanted so don't fetch any more
+            if self._isFinalResult(result, episode.show):
+                logger.log(u"Found a final result for " + episode.prettyName() + ", not looking at any more results from " + self.name, logger.DEBUG)
+                break
+
         return results
 
     def findSeasonResults(self, show, season):
 
-        itemList = []
         results = {}
 
-        for cur_string in self._get_season_search_strings(show, season):
-            itemList += self._doSearch(cur_string)
+        # the episodes which don't have a result good enough to stop looking yet
+        if show.air_by_date:
+            stillNeeded = None
+        else:
+            stillNeeded = self._neededEpisodes(show, season)
 
-        for item in itemList:
+            # every result would be thrown away
+            if not stillNeeded:
+                logger.log(u"No episodes of " + show.name + " season " + str(season) + " are needed, not searching " + self.name, logger.DEBUG)
+                return results
+
+        for item in self._searchItems(self._get_season_search_strings(show, season)):
 
             (title, url) = self._get_title_and_url(item)
 
@@ -393,6 +508,13 @@ class GenericProvider:
             else:
                 results[epNum] = [result]
 
+            # stop fetching once every needed episode has a result nothing else would beat
+            if stillNeeded and len(epObj) == 1 and epNum in stillNeeded and self._isFinalResult(result, show):
+                stillNeeded.discard(epNum)
+                if not stillNeeded:
+                    logger.log(u"Found final results for every needed episode, not looking at any more results from " + self.name, logger.DEBUG)
+                    break
+
         return results
 
     def findPropers(self, search_date=None):
@@ -19,7 +19,7 @@
 
 import urllib, urllib2
 import StringIO, zlib, gzip
-import re, socket
+import re, socket, time
 from xml.dom.minidom import parseString
 from httplib import BadStatusLine
 import traceback
@@ -31,9 +31,17 @@ from sickbeard.common import Quality, USER_AGENT
 from sickbeard import logger
 from sickbeard import tvcache
 from sickbeard import helpers
+from sickbeard import feedreader
+from sickbeard import request_budget
+from sickbeard import provider_health
+from sickbeard import query_cache
 from sickbeard.exceptions import ex
 from sickbeard import scene_exceptions
 
+# KAT's RSS search gives 25 results a page, sorted by seeders
+PAGE_SIZE = 25
+MAX_PAGES = 5
+
 class KATProvider(generic.TorrentProvider):
 
     def __init__(self):
@@ -130,13 +138,31 @@ class KATProvider(generic.TorrentProvider):
         if not headers:
             headers = []
 
+        if not provider_health.tryRequest(self.getID()):
+            logger.log(u"Skipping " + self.name + " URL " + url + " because the provider has been failing", logger.DEBUG)
+            return None
+
+        request_budget.recordRequest(self.getID())
+
+        startTime = time.time()
+        data = self._getURL(url, headers, provider_health.getTimeout(self.getID()))
+
+        if data is None:
+            provider_health.recordFailure(self.getID(), u"Unable to load " + url)
+        else:
+            provider_health.recordSuccess(self.getID(), time.time() - startTime)
+
+        return data
+
+    def _getURL(self, url, headers, timeout):
+
         opener = urllib2.build_opener()
         opener.addheaders = [('User-Agent', USER_AGENT), ('Accept-Encoding', 'gzip,deflate')]
         for cur_header in headers:
             opener.addheaders.append(cur_header)
 
         try:
-            usock = opener.open(url)
+            usock = opener.open(url, timeout=timeout)
             url = usock.geturl()
             encoding = usock.info().get("Content-Encoding")
     
@@ -179,6 +205,44 @@ class KATProvider(generic.TorrentProvider):
             return None
 
     def _doSearch(self, search_params, show=None):
+        """
+        Yields the results a page at a time, the next page is only fetched once the caller has gone
+        through the previous one (and only if it could have anything with seeders on it).
+        """
+
+        paramBuilder = None
+
+        for page in range(1, MAX_PAGES + 1):
+
+            items, paramBuilder = self._getPage(search_params, page, paramBuilder)
+
+            for curItem in items:
+
+                (title, url) = self._get_title_and_url(curItem)
+
+                if self._get_seeders(curItem) <= 0:
+                    logger.log(u"Discarded result with no seeders: " + title, logger.DEBUG)
+                    continue
+
+                if self.urlIsBlacklisted(url):
+                    logger.log(u'URL "%s" for "%s" is blacklisted, ignoring.' % (url, title), logger.DEBUG)
+                    continue
+
+                yield curItem
+
+            # the results are sorted by seeders so once they've run out there's nothing more worth having
+            if len(items) < PAGE_SIZE or self._get_seeders(items[-1]) <= 0:
+                break
+
+    def _getPage(self, search_params, page=1, paramBuilder=None):
+        """
+        Gets one page of search results, each search URL's results are kept in the query cache.
+
+        paramBuilder: the builder for the search URL, if None the advanced search is tried first and
+                      the fuzzy one if that has nothing
+
+        Returns a tuple of the complete items on the page and the builder which was used.
+        """
 
         # First run a search using the advanced format -- results are probably more reliable, but often not available for several weeks
         # http://kat.ph/usearch/%22james%20may%22%20season:1%20episode:1%20verified:1/?rss=1
@@ -191,32 +255,45 @@ class KATProvider(generic.TorrentProvider):
             if 'episode' in params:
                 episodeParam = episodeParam + 'episode:' + str(params.pop('episode')) +"%20"
             return episodeParam
-        searchURL = self._buildSearchURL(advancedEpisodeParamBuilder, search_params);
-        logger.log(u"Advanced-style search string: " + searchURL, logger.DEBUG)
-        data = self.getURL(searchURL)
 
         # Run a fuzzier search if no results came back from the "advanced" style search
         # http://kat.ph/usearch/%22james%20may%22%20S01E01%20verified:1/?rss=1
-        if not data or data == '<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel></channel></rss>':
-            def fuzzyEpisodeParamBuilder(params):
-                episodeParam = ''
-                if not 'show_name' in params or not 'season' in params:
-                    return ''
-                episodeParam = episodeParam + urllib.quote('"' + params.pop('show_name') + '"') + "%20"
-                episodeParam = episodeParam + 'S' + str(params.pop('season')).zfill(2)
-                if 'episode' in params:
-                    episodeParam += 'E' + str(params.pop('episode')).zfill(2)
-                return episodeParam
-            searchURL = self._buildSearchURL(fuzzyEpisodeParamBuilder, search_params);
-            logger.log(u"Fuzzy-style search string: " + searchURL, logger.DEBUG)
-            data = self.getURL(searchURL)
-
-        if not data:
-            return []
-
-        return self._parseKatRSS(data)
-
-    def _buildSearchURL(self, episodeParamBuilder, search_params):
+        def fuzzyEpisodeParamBuilder(params):
+            episodeParam = ''
+            if not 'show_name' in params or not 'season' in params:
+                return ''
+            episodeParam = episodeParam + urllib.quote('"' + params.pop('show_name') + '"') + "%20"
+            episodeParam = episodeParam + 'S' + str(params.pop('season')).zfill(2)
+            if 'episode' in params:
+                episodeParam += 'E' + str(params.pop('episode')).zfill(2)
+            return episodeParam
+
+        if paramBuilder:
+            paramBuilders = [paramBuilder]
+        else:
+            paramBuilders = [advancedEpisodeParamBuilder, fuzzyEpisodeParamBuilder]
+
+        for curBuilder in paramBuilders:
+
+            searchURL = self._buildSearchURL(curBuilder, search_params, page)
+            logger.log(u"Search string: " + searchURL, logger.DEBUG)
+
+            results = query_cache.getCachedResults(self.getID(), searchURL)
+
+            if results is None:
+                data = self.getURL(searchURL)
+                if not data:
+                    continue
+
+                results = list(self._parseKatRSS(data))
+                query_cache.cacheResults(self.getID(), searchURL, results)
+
+            if results:
+                return (results, curBuilder)
+
+        return ([], paramBuilders[-1])
+
+    def _buildSearchURL(self, episodeParamBuilder, search_params, page=1):
 
         params = {"rss": "1", "field": "seeders", "sorder": "desc" }
 
@@ -239,22 +316,27 @@ class KATProvider(generic.TorrentProvider):
         if searchURL.endswith('%20'):
             searchURL = searchURL[:-3]
 
-        searchURL = searchURL + '%20verified:1/?' + urllib.urlencode(params)  # this will likely only append the rss=1 part
+        searchURL = searchURL + '%20verified:1/'
+
+        # http://kat.ph/usearch/%22james%20may%22%20verified:1/2/?rss=1
+        if page > 1:
+            searchURL = searchURL + str(page) + '/'
+
+        searchURL = searchURL + '?' + urllib.urlencode(params)  # this will likely only append the rss=1 part
 
         return searchURL
 
     def _parseKatRSS(self, data):
+        """
+        Yields the complete items in the feed as they're read
+        """
 
-        parsedXML = helpers.parse_xml(data)
-        if parsedXML is None:
+        feed = feedreader.FeedReader(data)
+        if not feed.readHeader():
             logger.log(u"Error trying to load " + self.name + " RSS feed", logger.ERROR)
-            return []
-
-        items = parsedXML.findall('.//item')
-
-        results = []
+            return
 
-        for curItem in items:
+        for curItem in feed:
 
             (title, url) = self._get_title_and_url(curItem)
 
@@ -262,17 +344,7 @@ class KATProvider(generic.TorrentProvider):
                 logger.log(u"The XML returned from the KAT RSS feed is incomplete, this result is unusable: "+data, logger.ERROR)
                 continue
 
-            if self._get_seeders(curItem) <= 0:
-                logger.log(u"Discarded result with no seeders: " + title, logger.DEBUG)
-                continue
-
-            if self.urlIsBlacklisted(url):
-                logger.log(u'URL "%s" for "%s" is blacklisted, ignoring.' % (url, title), logger.DEBUG)
-                continue
-
-            results.append(curItem)
-
-        return results
+            yield curItem
 
     def _get_title_and_url(self, item):
         #     <item>
@@ -16,11 +16,15 @@
 # You should have received a copy of the GNU General Public License
 # along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
 
+from __future__ import with_statement
+
 import urllib
 import email.utils
 import datetime
 import re
 import os
+import threading
+import time
 
 try:
     import xml.etree.cElementTree as etree
@@ -31,14 +35,60 @@ import sickbeard
 import generic
 
 from sickbeard import classes
+from sickbeard import db
 from sickbeard import helpers
+from sickbeard import feedreader
+from sickbeard import query_cache
 from sickbeard import scene_exceptions
 from sickbeard import encodingKludge as ek
 
 from sickbeard import logger
 from sickbeard import tvcache
+from sickbeard.common import WANTED
 from sickbeard.exceptions import ex, AuthException
 
+# results asked for per request and the most requests one search can page through
+SEARCH_LIMIT = 100
+MAX_SEARCH_PAGES = 10
+
+# manual episode searches ask for the whole season if at least this many of its episodes are wanted,
+# the season's results are cached so searching for the others doesn't cost any more requests
+SEASON_SEARCH_MIN_WANTED = 3
+
+# how long (in seconds) the number of wanted episodes in a season is remembered for, so searching for
+# several episodes of the season only counts them once
+WANTED_COUNT_TTL = 10 * 60
+
+# how long (in seconds) to wait before asking for an indexer's caps again when they couldn't be loaded
+CAPS_RETRY_TIME = 60 * 60
+
+# (show tvdbid, season) -> (wanted episodes, expiry time)
+_wantedCounts = {}
+_wantedCountsLock = threading.Lock()
+
+def wantedInSeason(tvdbid, season):
+    """
+    Returns how many episodes of the season are wanted, shared by all the newznab providers
+    """
+
+    key = (tvdbid, season)
+    now = time.time()
+
+    with _wantedCountsLock:
+        if key in _wantedCounts and _wantedCounts[key][1] > now:
+            return _wantedCounts[key][0]
+
+    myDB = db.DBConnection()
+    sqlResults = myDB.select("SELECT COUNT(*) AS eps FROM tv_episodes WHERE showid = ? AND season = ? AND status = ?", [tvdbid, season, WANTED])
+    wanted = int(sqlResults[0]["eps"])
+
+    with _wantedCountsLock:
+        for cur_key in [x for x in _wantedCounts if _wantedCounts[x][1] <= now]:
+            del _wantedCounts[cur_key]
+        _wantedCounts[key] = (wanted, now + WANTED_COUNT_TTL)
+
+    return wanted
+
 
 class NewznabProvider(generic.NZBProvider):
 
@@ -59,6 +109,11 @@ class NewznabProvider(generic.NZBProvider):
 
         self.default = False
 
+        # the params the indexer's tv-search supports, False until its caps have been checked
+        self._searchParams = False
+        # when to try again if the caps couldn't be loaded
+        self._capsRetryTime = 0
+
     def configStr(self):
         return self.name + '|' + self.url + '|' + self.key + '|' + str(int(self.enabled))
 
@@ -70,6 +125,71 @@ class NewznabProvider(generic.NZBProvider):
     def isEnabled(self):
         return self.enabled
 
+    def _getSearchParams(self):
+        """
+        Returns the set of params the indexer's tv-search supports according to its caps, or None if
+        it doesn't say (or they couldn't be loaded). Once loaded the caps are kept, if they couldn't be
+        they're asked for again after CAPS_RETRY_TIME.
+        """
+
+        if self._searchParams is False and time.time() >= self._capsRetryTime:
+
+            caps_url = self.url + 'api?t=caps'
+            if self.key:
+                caps_url += '&apikey=' + self.key
+
+            data = self.getURL(caps_url)
+
+            if data:
+                try:
+                    tv_search = etree.fromstring(data).find('searching/tv-search')
+                except SyntaxError, e:
+                    logger.log(u"Unable to parse the caps of " + self.name + ": " + ex(e), logger.DEBUG)
+                    data = None
+
+            if not data:
+                logger.log(u"Unable to get the caps of " + self.name + ", trying again later", logger.DEBUG)
+                self._capsRetryTime = time.time() + CAPS_RETRY_TIME
+                return None
+
+            if tv_search is not None and tv_search.get('supportedParams'):
+                self._searchParams = set([x.strip() for x in tv_search.get('supportedParams').split(',')])
+                logger.log(u"The tv-search of " + self.name + " supports " + ', '.join(sorted(self._searchParams)), logger.DEBUG)
+            else:
+                self._searchParams = None
+
+        if self._searchParams is False:
+            return None
+
+        return self._searchParams
+
+    def _get_show_search_strings(self, show):
+        """
+        Returns the params which find the show: a single query by its tvrage id or tvdb id if the
+        indexer can search by them, otherwise one query for each of its names.
+        """
+
+        supported = self._getSearchParams()
+
+        # search directly by tvrage id, every newznab supports it unless its caps say otherwise
+        if show.tvrid and (supported is None or 'rid' in supported):
+            return [{'rid': show.tvrid}]
+
+        if supported and 'tvdbid' in supported:
+            return [{'tvdbid': show.tvdbid}]
+
+        # if we can't then fall back on a very basic name search
+        to_return = []
+
+        for cur_name in [show.name] + scene_exceptions.get_scene_exceptions(show.tvdbid):
+            cur_params = {'q': helpers.sanitizeSceneName(cur_name)}
+
+            # don't add duplicates
+            if cur_params not in to_return:
+                to_return.append(cur_params)
+
+        return to_return
+
     def _get_season_search_strings(self, show, season=None):
 
         if not show:
@@ -77,18 +197,7 @@ class NewznabProvider(generic.NZBProvider):
 
         to_return = []
 
-        # add new query strings for exceptions
-        name_exceptions = scene_exceptions.get_scene_exceptions(show.tvdbid) + [show.name]
-        for cur_exception in name_exceptions:
-
-            cur_params = {}
-
-            # search directly by tvrage id
-            if show.tvrid:
-                cur_params['rid'] = show.tvrid
-            # if we can't then fall back on a very basic name search
-            else:
-                cur_params['q'] = helpers.sanitizeSceneName(cur_exception)
+        for cur_params in self._get_show_search_strings(show):
 
             if season != None:
                 # air-by-date means &season=2010&q=2010.03, no other way to do it atm
@@ -101,51 +210,36 @@ class NewznabProvider(generic.NZBProvider):
                 else:
                     cur_params['season'] = season
 
-            # hack to only add a single result if it's a rageid search
-            if not ('rid' in cur_params and to_return):
-                to_return.append(cur_params)
+            to_return.append(cur_params)
 
         return to_return
 
     def _get_episode_search_strings(self, ep_obj):
 
-        params = {}
-
         if not ep_obj:
-            return [params]
-
-        # search directly by tvrage id
-        if ep_obj.show.tvrid:
-            params['rid'] = ep_obj.show.tvrid
-        # if we can't then fall back on a very basic name search
-        else:
-            params['q'] = helpers.sanitizeSceneName(ep_obj.show.name)
+            return [{}]
 
         if ep_obj.show.air_by_date:
             date_str = str(ep_obj.airdate)
+            season = date_str.partition('-')[0]
+            episode = date_str.partition('-')[2].replace('-', '/')
 
-            params['season'] = date_str.partition('-')[0]
-            params['ep'] = date_str.partition('-')[2].replace('-', '/')
         else:
-            params['season'] = ep_obj.season
-            params['ep'] = ep_obj.episode
-
-        to_return = [params]
+            # the results are matched to the episode afterwards so if several episodes of the season are
+            # wanted get them all in one go, the other episodes will come from the query cache
+            if wantedInSeason(ep_obj.show.tvdbid, ep_obj.season) >= SEASON_SEARCH_MIN_WANTED:
+                logger.log(u"Several episodes of season " + str(ep_obj.season) + " are wanted, searching for the whole season", logger.DEBUG)
+                return self._get_season_search_strings(ep_obj.show, ep_obj.season)
 
-        # only do exceptions if we are searching by name
-        if 'q' in params:
+            season = ep_obj.season
+            episode = ep_obj.episode
 
-            # add new query strings for exceptions
-            name_exceptions = scene_exceptions.get_scene_exceptions(ep_obj.show.tvdbid)
-            for cur_exception in name_exceptions:
-
-                # don't add duplicates
-                if cur_exception == ep_obj.show.name:
-                    continue
+        to_return = []
 
-                cur_return = params.copy()
-                cur_return['q'] = helpers.sanitizeSceneName(cur_exception)
-                to_return.append(cur_return)
+        for cur_params in self._get_show_search_strings(ep_obj.show):
+            cur_params['season'] = season
+            cur_params['ep'] = episode
+            to_return.append(cur_params)
 
         return to_return
 
@@ -160,13 +254,13 @@ class NewznabProvider(generic.NZBProvider):
 
         return True
 
-    def _checkAuthFromData(self, parsedXML):
+    def _checkAuthFromData(self, feed):
 
-        if parsedXML is None:
+        if feed is None:
             return self._checkAuth()
 
-        if parsedXML.tag == 'error':
-            code = parsedXML.attrib['code']
+        if feed.tag == 'error':
+            code = feed.attrib['code']
 
             if code == '100':
                 raise AuthException("Your API key for " + self.name + " is incorrect, check your config.")
@@ -175,18 +269,22 @@ class NewznabProvider(generic.NZBProvider):
             elif code == '102':
                 raise AuthException("Your account isn't allowed to use the API on " + self.name + ", contact the administrator")
             else:
-                logger.log(u"Unknown error given from " + self.name + ": " + parsedXML.attrib['description'], logger.ERROR)
+                logger.log(u"Unknown error given from " + self.name + ": " + feed.attrib['description'], logger.ERROR)
                 return False
 
         return True
 
     def _doSearch(self, search_params, show=None, max_age=0):
+        """
+        Searches the indexer, paging through the results until there are no more (or MAX_SEARCH_PAGES
+        have been read).
+        """
 
         self._checkAuth()
 
         params = {"t": "tvsearch",
                   "maxage": sickbeard.USENET_RETENTION,
-                  "limit": 100,
+                  "limit": SEARCH_LIMIT,
                   "cat": '5030,5040'}
 
         # if max_age is set, use it, don't allow it to be missing
@@ -205,47 +303,108 @@ class NewznabProvider(generic.NZBProvider):
 
         search_url = self.url + 'api?' + urllib.urlencode(params)
 
+        # all the pages are cached together under the first one
+        results = query_cache.getCachedResults(self.getID(), search_url)
+        if results is not None:
+            return results
+
+        results = []
+        offset = 0
+
+        for cur_page in range(MAX_SEARCH_PAGES):
+
+            if offset:
+                # don't cache the results if they're cut short by the budget
+                if self._budgetExhausted():
+                    return results
+                params['offset'] = offset
+                page_url = self.url + 'api?' + urllib.urlencode(params)
+            else:
+                page_url = search_url
+
+            page = self._getSearchPage(page_url)
+            if page is None:
+                # only keep what was found if the first page worked
+                if not offset:
+                    return []
+                break
+
+            page_results, page_size, total = page
+            results += page_results
+            offset += page_size
+
+            # a short page is the last one
+            if page_size < SEARCH_LIMIT or (total is not None and offset >= total):
+                break
+
+        else:
+            logger.log(u"Stopped reading the results from " + self.name + " after " + str(MAX_SEARCH_PAGES) + " pages", logger.DEBUG)
+
+        query_cache.cacheResults(self.getID(), search_url, results)
+
+        return results
+
+    def _getSearchPage(self, search_url):
+        """
+        Reads one page of search results.
+
+        Returns a tuple of the usable items, the number of items on the page and the total number of
+        results the indexer says there are (or None if it doesn't say), or None if the page couldn't be read.
+        """
+
         logger.log(u"Search url: " + search_url, logger.DEBUG)
 
-        data = self.getURL(search_url)
+        data = self.getURLStream(search_url)
 
         if not data:
             logger.log(u"No data returned from " + search_url, logger.ERROR)
-            return []
+            return None
 
-        # hack this in until it's fixed server side
-        if not data.startswith('<?xml'):
-            data = '<?xml version="1.0" encoding="ISO-8859-1" ?>' + data
+        try:
+            # the encoding is a hack until it's fixed server side
+            feed = feedreader.FeedReader(data, 'ISO-8859-1', keepElements=False)
 
-        parsedXML = helpers.parse_xml(data)
-
-        if parsedXML is None:
-            logger.log(u"Error trying to load " + self.name + " XML data", logger.ERROR)
-            return []
+            if not feed.readHeader():
+                logger.log(u"Error trying to load " + self.name + " XML data", logger.ERROR)
+                return None
 
-        if self._checkAuthFromData(parsedXML):
+            if self._checkAuthFromData(feed):
+
+                if feed.tag != 'rss':
+                    logger.log(u"Resulting XML from " + self.name + " isn't RSS, not parsing it", logger.ERROR)
+                    return None
 
-            if parsedXML.tag == 'rss':
-                items = parsedXML.findall('.//item')
+                results = []
+                page_size = 0
 
-            else:
-                logger.log(u"Resulting XML from " + self.name + " isn't RSS, not parsing it", logger.ERROR)
-                return []
-
-            results = []
-
-            for curItem in items:
-                (title, url) = self._get_title_and_url(curItem)
+                for curItem in feed:
+                    page_size += 1
 
-                if title and url:
-                    logger.log(u"Adding item from RSS to results: " + title, logger.DEBUG)
-                    results.append(curItem)
-                else:
-                    logger.log(u"The XML returned from the " + self.name + " RSS feed is incomplete, this result is unusable", logger.DEBUG)
+                    (title, url) = self._get_title_and_url(curItem)
 
-            return results
+                    if title and url:
+                        logger.log(u"Adding item from RSS to results: " + title, logger.DEBUG)
+                        results.append(curItem)
+                    else:
+                        logger.log(u"The XML returned from the " + self.name + " RSS feed is incomplete, this result is unusable", logger.DEBUG)
+
+                # the connection dropped part way through, treat it like a page that couldn't be read so it isn't cached
+                if feed.error is not None:
+                    logger.log(u"Unable to read all of the results from " + self.name, logger.ERROR)
+                    return None
+
+                # <newznab:response offset="0" total="1234"/>
+                try:
+                    total = int(feed.channelAttrib.get('response', {})['total'])
+                except (KeyError, ValueError):
+                    total = None
+
+                return (results, page_size, total)
+
+        finally:
+            data.close()
 
-        return []
+        return None
 
     def findPropers(self, search_date=None):
 
@@ -259,8 +418,7 @@ class NewznabProvider(generic.NZBProvider):
 
                 (title, url) = self._get_title_and_url(item)
 
-                description_node = item.find('pubDate')
-                description_text = helpers.get_xml_text(description_node)
+                description_text = item.pubdate or ''
 
                 try:
                     # we could probably do dateStr = descriptionStr but we want date in this format
@@ -321,5 +479,5 @@ class NewznabCache(tvcache.TVCache):
 
         return data
 
-    def _checkAuth(self, parsedXML):
-            return self.provider._checkAuthFromData(parsedXML)
+    def _checkAuth(self, feed):
+            return self.provider._checkAuthFromData(feed)
@@ -51,12 +51,15 @@ class TorrentLeechProvider(generic.TorrentProvider):
             raise AuthException("Your authentication credentials for " + self.name + " are missing, check your config.")
         return True
 
-    def _checkAuthFromData(self, parsedXML):
+    def _checkAuthFromData(self, feed):
 
-        if parsedXML is None:
+        if feed is None:
             return self._checkAuth()
 
-        description_text = helpers.get_xml_text(parsedXML.find('.//channel/item/description'))
+        if feed.firstItem is None:
+            return True
+
+        description_text = feed.firstItem.attrs.get('description', '')
 
         if "Your RSS key is invalid" in description_text:
             logger.log(u"Incorrect authentication credentials for " + self.name + " : " + str(description_text), logger.DEBUG)
@@ -86,7 +89,7 @@ class TorrentLeechCache(tvcache.TVCache):
 
         return data
 
-    def _checkAuth(self, parsedXML):
-            return self.provider._checkAuthFromData(parsedXML)
+    def _checkAuth(self, feed):
+            return self.provider._checkAuthFromData(feed)
 
 provider = TorrentLeechProvider()
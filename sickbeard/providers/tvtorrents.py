@@ -55,12 +55,12 @@ class TvTorrentsProvider(generic.TorrentProvider):
 
         return True
 
-    def _checkAuthFromData(self, parsedXML):
+    def _checkAuthFromData(self, feed):
 
-        if parsedXML is None:
+        if feed is None:
             return self._checkAuth()
 
-        description_text = helpers.get_xml_text(parsedXML.find('.//channel/description'))
+        description_text = feed.channel.get('description', '')
 
         if "User can't be found" in description_text or "Invalid Hash" in description_text:
             logger.log(u"Incorrect authentication credentials for " + self.name + " : " + str(description_text), logger.DEBUG)
@@ -94,7 +94,7 @@ class TvTorrentsCache(tvcache.TVCache):
 
         return data
 
-    def _checkAuth(self, parsedXML):
-            return self.provider._checkAuthFromData(parsedXML)
+    def _checkAuth(self, feed):
+            return self.provider._checkAuthFromData(feed)
 
 provider = TvTorrentsProvider()
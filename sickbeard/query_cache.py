@@ -0,0 +1,187 @@
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import with_statement
+
+import threading
+import time
+import urllib
+import urlparse
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = None
+
+import sickbeard
+
+from sickbeard import logger
+
+# url parameters that hold credentials, they're left out of the cache keys (and the logs)
+CREDENTIAL_PARAMS = ('apikey', 'api_key', 'passkey', 'rsskey')
+
+# credentials that only mean that on a particular provider, anywhere else they could be part of the search
+PROVIDER_CREDENTIAL_PARAMS = {'nzbs_org_old': ('i', 'h'),
+                              'nzbs_r_us': ('uid', 'key', 'i', 'h'),
+                              'omgwtfnzbs': ('user', 'api'),
+                              'nzbmatrix': ('username',),
+                              'tvtorrents': ('digest', 'hash'),
+                              }
+
+# rough per item and per entry overheads when working out how much memory the cache uses
+ITEM_OVERHEAD = 300
+ELEMENT_OVERHEAD = 150
+ENTRY_OVERHEAD = 500
+
+
+def normalizeURL(url, provider_id=None):
+    """
+    Returns the url with the credentials (for provider_id) taken out and the query parameters sorted,
+    so the same search always gives the same key no matter what order the parameters were added in.
+    """
+
+    scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+
+    credentials = CREDENTIAL_PARAMS + PROVIDER_CREDENTIAL_PARAMS.get(provider_id, ())
+
+    params = [x for x in urlparse.parse_qsl(query, True) if x[0].lower() not in credentials]
+    params.sort()
+
+    return urlparse.urlunsplit((scheme.lower(), netloc.lower(), path, urllib.urlencode(params), ''))
+
+
+def _itemSize(item):
+    """
+    Guesses how many bytes a search result item takes up
+    """
+
+    size = ITEM_OVERHEAD
+
+    if isinstance(item, basestring):
+        return size + len(item)
+
+    for cur_attr in ('title', 'url', 'guid', 'pubdate'):
+        value = getattr(item, cur_attr, None)
+        if isinstance(value, basestring):
+            size += len(value)
+
+    attrs = getattr(item, 'attrs', None)
+    if attrs:
+        size += sum([len(x or '') + len(y or '') for x, y in attrs.items()])
+
+    element = getattr(item, 'element', item if hasattr(item, 'getiterator') else None)
+    if element is not None:
+        for cur_element in element.getiterator():
+            size += ELEMENT_OVERHEAD + len(cur_element.text or '')
+
+    return size
+
+
+class QueryCache(object):
+    """
+    Least recently used cache of the parsed results of provider searches which forgets them after
+    sickbeard.QUERY_CACHE_TTL minutes and keeps the total size under sickbeard.QUERY_CACHE_SIZE megabytes.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict() if OrderedDict else {}
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+
+    def _remove(self, key):
+        expires, size, items = self.entries.pop(key) #@UnusedVariable
+        self.size -= size
+
+    def get(self, provider_id, url):
+        """
+        Returns a copy of the results cached for the url or None if there aren't any
+        """
+
+        if not sickbeard.QUERY_CACHE_TTL:
+            return None
+
+        key = (provider_id, normalizeURL(url, provider_id))
+
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+
+            expires, size, items = self.entries[key]
+
+            if expires < time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            # move it to the end so it's the last to be evicted
+            if OrderedDict:
+                del self.entries[key]
+                self.entries[key] = (expires, size, items)
+
+            self.hits += 1
+
+        logger.log(u"Using cached results for " + key[1], logger.DEBUG)
+        return list(items)
+
+    def add(self, provider_id, url, items):
+
+        if not sickbeard.QUERY_CACHE_TTL:
+            return
+
+        key = (provider_id, normalizeURL(url, provider_id))
+        size = ENTRY_OVERHEAD + sum([_itemSize(x) for x in items])
+        max_size = sickbeard.QUERY_CACHE_SIZE * 1024 * 1024
+
+        if size > max_size:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+            # evict the least recently used entries (or any old ones if there's no OrderedDict) until it fits
+            while self.entries and self.size + size > max_size:
+                if OrderedDict:
+                    oldest = iter(self.entries).next()
+                else:
+                    oldest = min(self.entries, key=lambda x: self.entries[x][0])
+                self._remove(oldest)
+
+            self.entries[key] = (time.time() + sickbeard.QUERY_CACHE_TTL * 60, size, list(items))
+            self.size += size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+query_cache = QueryCache()
+
+def getCachedResults(provider_id, url):
+    return query_cache.get(provider_id, url)
+
+def cacheResults(provider_id, url, items):
+    query_cache.add(provider_id, url, items)
+
+def clearCache():
+    query_cache.clear()
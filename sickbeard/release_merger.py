@@ -0,0 +1,89 @@
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+from sickbeard import logger
+from sickbeard import show_name_helpers
+
+
+class ReleaseMerger(object):
+    """
+    Merges the results of one search across all the providers.
+
+    Indexers mirror each other so the same release usually turns up on several of them. Providers
+    are searched in order so the first copy of a release that's seen comes from the provider the
+    user prefers, later copies are dropped before any work is done on them. The checks done on
+    each release are remembered so every unique release (and every episode/quality) is only
+    judged once per search.
+
+    Only use one for a single search, the wantEpisode answers go stale as soon as anything is snatched.
+    """
+
+    def __init__(self):
+        self._seen = {}
+        self._badReleases = {}
+        self._goodResults = {}
+        self._wantEpisodes = {}
+
+    def isNew(self, name, provider=None):
+        """
+        Returns True the first time a release is seen and False for any copies of it after that.
+        """
+
+        key = show_name_helpers.canonicalReleaseName(name)
+
+        if key in self._seen:
+            if provider and self._seen[key] and provider != self._seen[key]:
+                logger.log(u"Skipping " + name + " from " + provider.name + ", it was already found on " + self._seen[key].name, logger.DEBUG)
+            return False
+
+        self._seen[key] = provider
+        return True
+
+    def merge(self, results):
+        """
+        Returns the results which are the first copy of their release, in the same order
+        """
+
+        return [x for x in results if self.isNew(x.name, x.provider)]
+
+    def filterBadReleases(self, name):
+        key = show_name_helpers.canonicalReleaseName(name)
+
+        if key not in self._badReleases:
+            self._badReleases[key] = show_name_helpers.filterBadReleases(name)
+
+        return self._badReleases[key]
+
+    def isGoodResult(self, name, show):
+        """
+        filterBadReleases and show_name_helpers.isGoodResult in one go
+        """
+
+        key = (show_name_helpers.canonicalReleaseName(name), show.tvdbid)
+
+        if key not in self._goodResults:
+            self._goodResults[key] = self.filterBadReleases(name) and show_name_helpers.isGoodResult(name, show)
+
+        return self._goodResults[key]
+
+    def wantEpisode(self, show, season, episode, quality, manualSearch=False):
+        key = (show.tvdbid, season, episode, quality, manualSearch)
+
+        if key not in self._wantEpisodes:
+            self._wantEpisodes[key] = show.wantEpisode(season, episode, quality, manualSearch)
+
+        return self._wantEpisodes[key]
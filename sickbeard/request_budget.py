@@ -0,0 +1,142 @@
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import with_statement
+
+import threading
+import time
+
+import sickbeard
+
+from sickbeard import logger
+
+
+class TokenBucket(object):
+    """
+    Allows per_hour requests an hour on average, in bursts of up to capacity requests.
+
+    Requests are always counted, the bucket can go negative when requests are made while it's
+    nearly empty and whoever checks it has to wait longer.
+    """
+
+    def __init__(self, per_hour, capacity=None):
+        self.per_hour = float(per_hour)
+        self.capacity = float(capacity or per_hour)
+
+        self.tokens = self.capacity
+        self.last_refill = time.time()
+
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.per_hour / 3600)
+        self.last_refill = now
+
+    def consume(self, num=1):
+        with self.lock:
+            self._refill()
+            self.tokens -= num
+
+    def available(self):
+        with self.lock:
+            self._refill()
+            return self.tokens
+
+
+def parseBudgets(budget_string):
+    """
+    Parses the provider_budgets setting: space separated provider_id:requests entries where the number of
+    requests is per hour, or per day if it ends in /day. Eg. "nzbs_org:100/day womble:60"
+
+    Returns a dict of provider id -> requests per hour
+    """
+
+    budgets = {}
+
+    for cur_budget in budget_string.split():
+        try:
+            provider_id, requests = cur_budget.split(':')
+            if requests.endswith('/day'):
+                per_hour = float(requests[:-4]) / 24
+            else:
+                per_hour = float(requests.rpartition('/hour')[0] or requests)
+        except ValueError:
+            logger.log(u"Unable to understand the provider budget " + cur_budget + ", ignoring it", logger.ERROR)
+            continue
+
+        if per_hour > 0:
+            budgets[provider_id.strip()] = per_hour
+
+    return budgets
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def _getBucket(provider_id):
+    """
+    Returns the TokenBucket for the given provider or None if its requests aren't limited
+    """
+
+    with _buckets_lock:
+        if provider_id not in _buckets:
+            per_hour = parseBudgets(sickbeard.PROVIDER_BUDGETS).get(provider_id, sickbeard.PROVIDER_REQUESTS_PER_HOUR)
+            if per_hour:
+                _buckets[provider_id] = TokenBucket(per_hour)
+            else:
+                _buckets[provider_id] = None
+
+        return _buckets[provider_id]
+
+def resetBudgets():
+    """
+    Forgets all the buckets so changed budget settings are used
+    """
+
+    with _buckets_lock:
+        _buckets.clear()
+
+def recordRequest(provider_id, num=1):
+    """
+    Counts a request made to a provider against its budget. Every search and RSS request goes
+    through here so the backlog and the daily search share the same budget.
+    """
+
+    bucket = _getBucket(provider_id)
+    if bucket:
+        bucket.consume(num)
+
+def available(provider_id):
+    """
+    Returns how many requests can be made to the provider right now, None if it's not limited
+    """
+
+    bucket = _getBucket(provider_id)
+    if not bucket:
+        return None
+
+    return bucket.available()
+
+def isExhausted(provider_id):
+    """
+    Returns True if the provider's budget is used up, the searches and RSS updates check this before
+    every request (including each page of results) and stop until it has refilled
+    """
+
+    remaining = available(provider_id)
+    return remaining is not None and remaining <= 0
@@ -64,7 +64,7 @@ def get_scene_exception_by_name(show_name):
     myDB = db.DBConnection("cache.db")
 
     # try the obvious case first
-    exception_result = myDB.select(u"SELECT tvdb_id FROM scene_exceptions WHERE LOWER(show_name) = ?", [show_name.lower()])
+    exception_result = myDB.select(u"SELECT tvdb_id FROM scene_exceptions WHERE show_name = ? COLLATE NOCASE", [show_name])
     if exception_result:
         return int(exception_result[0]["tvdb_id"])
 
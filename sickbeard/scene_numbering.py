@@ -19,6 +19,9 @@
 # @copyright: Dermot Buckley
 #
 
+from __future__ import with_statement
+
+import threading
 import time
 import traceback
 
@@ -27,12 +30,20 @@ try:
 except ImportError:
     from lib import simplejson as json
 
+import sickbeard
+
 from sickbeard import logger
 from sickbeard import db
 from sickbeard.helpers import getURL
 
 MAX_XEM_AGE_SECS = 86400 # 1 day
 
+# how often (in minutes) XEMRefresher looks for shows whose xem numbering is out of date
+XEM_REFRESH_FREQUENCY = 60
+
+# a show whose refresh failed (thexem.de and tvtumbler both down) is tried again after this long
+XEM_RETRY_SECS = 60 * 60
+
 _schema_created = False
 def _check_for_schema():
     global _schema_created
@@ -214,6 +225,22 @@ def _xem_refresh_needed(tvdb_id):
         return time.time() > (int(rows[0]['last_refreshed']) + MAX_XEM_AGE_SECS)
     else:
         return True
+
+def _xem_refresh_needed_shows(tvdb_ids):
+    """
+    Returns which of the shows need a refresh, checking them all with one query
+    
+    @param tvdb_ids: list of int
+    @return: list of int
+    """
+    _check_for_schema()
+    cacheDB = db.DBConnection('cache.db')
+    rows = cacheDB.select("SELECT tvdb_id, last_refreshed FROM xem_refresh")
+    
+    last_refreshed = dict([(int(x['tvdb_id']), int(x['last_refreshed'])) for x in rows])
+    oldest = time.time() - MAX_XEM_AGE_SECS
+    
+    return [x for x in tvdb_ids if last_refreshed.get(x, 0) < oldest]
     
 def _xem_refresh(tvdb_id):
     """
@@ -233,42 +260,65 @@ def _xem_refresh(tvdb_id):
             data = getURL('http://show-api.tvtumbler.com/api/thexem/all?id=%s&origin=tvdb&destination=scene' % (tvdb_id,))
             if data is None or data == '':
                 logger.log(u'tvtumbler also failed for "%s".  giving up.' % (tvdb_id,), logger.MESSAGE)
+                _xem_refresh_failed(tvdb_id)
                 return None
         result = json.loads(data)
         if result:
             _check_for_schema()
             cacheDB = db.DBConnection('cache.db')
-            cacheDB.action("INSERT OR REPLACE INTO xem_refresh (tvdb_id, last_refreshed) VALUES (?,?)", [tvdb_id, time.time()])
+            # all in one transaction so the numbering is never seen half written
+            ql = [["INSERT OR REPLACE INTO xem_refresh (tvdb_id, last_refreshed) VALUES (?,?)", [tvdb_id, time.time()]]]
             if result['result'] == 'success':
-                cacheDB.action("DELETE FROM xem_num where tvdb_id = ?", [tvdb_id])
+                ql.append(["DELETE FROM xem_num where tvdb_id = ?", [tvdb_id]])
                 for entry in result['data']:
                     if 'scene' in entry:
-                        cacheDB.action("INSERT INTO xem_num (tvdb_id, season, episode, scene_season, scene_episode) VALUES (?,?,?,?,?)", 
-                                    [tvdb_id, entry['tvdb']['season'], entry['tvdb']['episode'], entry['scene']['season'], entry['scene']['episode'] ])
+                        ql.append(["INSERT INTO xem_num (tvdb_id, season, episode, scene_season, scene_episode) VALUES (?,?,?,?,?)", 
+                                    [tvdb_id, entry['tvdb']['season'], entry['tvdb']['episode'], entry['scene']['season'], entry['scene']['episode'] ]])
                     if 'scene_2' in entry: # for doubles
-                        cacheDB.action("INSERT INTO xem_num (tvdb_id, season, episode, scene_season, scene_episode) VALUES (?,?,?,?,?)", 
-                                    [tvdb_id, entry['tvdb']['season'], entry['tvdb']['episode'], entry['scene_2']['season'], entry['scene_2']['episode'] ])
+                        ql.append(["INSERT INTO xem_num (tvdb_id, season, episode, scene_season, scene_episode) VALUES (?,?,?,?,?)", 
+                                    [tvdb_id, entry['tvdb']['season'], entry['tvdb']['episode'], entry['scene_2']['season'], entry['scene_2']['episode'] ]])
             else:
                 logger.log(u'Failure getting thexem.de for show %s with message "%s"' % (tvdb_id, result['message']), logger.MESSAGE)
+            cacheDB.mass_action(ql)
         else:
             logger.log(u"Empty lookup result - no data from thexem.de for %s" % (tvdb_id,), logger.MESSAGE)
+            _xem_refresh_failed(tvdb_id)
     except Exception, e:
         logger.log(u"Exception while refreshing thexem data for " + str(tvdb_id) + ": " + str(e), logger.WARNING)
         logger.log(traceback.format_exc(), logger.DEBUG)
+        _xem_refresh_failed(tvdb_id)
         return None
+
+def _xem_refresh_failed(tvdb_id):
+    """
+    Records a failed refresh so the show isn't tried again until XEM_RETRY_SECS from now, it's saved as
+    if it had been refreshed that long before it's due. The numbering it already had is kept.
+    
+    @param tvdb_id: int
+    """
+    try:
+        _check_for_schema()
+        cacheDB = db.DBConnection('cache.db')
+        cacheDB.action("INSERT OR REPLACE INTO xem_refresh (tvdb_id, last_refreshed) VALUES (?,?)", [tvdb_id, time.time() - MAX_XEM_AGE_SECS + XEM_RETRY_SECS])
+    except Exception, e:
+        logger.log(u"Unable to save the failed xem refresh for " + str(tvdb_id) + ": " + str(e), logger.WARNING)
     
 def get_xem_numbering_for_show(tvdb_id):
     """
     Returns a dict of (season, episode) : (sceneSeason, sceneEpisode) mappings
     for an entire show.  Both the keys and values of the dict are tuples.
     Will be empty if there are no scene numbers set in xem
+    
+    Only reads what's already cached, if the show needs a refresh XEMRefresher is
+    started to do just that show in the background.
     """
     if tvdb_id is None:
         return {}
     
     _check_for_schema()
-    if _xem_refresh_needed(tvdb_id):
-        _xem_refresh(tvdb_id)
+    if _xem_refresh_needed(tvdb_id) and sickbeard.xemRefreshScheduler:
+        sickbeard.xemRefreshScheduler.action.refreshShow(tvdb_id)
+        sickbeard.xemRefreshScheduler.forceRun()
     cacheDB = db.DBConnection('cache.db')
         
     rows = cacheDB.select('''SELECT season, episode, scene_season, scene_episode 
@@ -278,4 +328,46 @@ def get_xem_numbering_for_show(tvdb_id):
     for row in rows:
         result[(int(row['season']), int(row['episode']))] = (int(row['scene_season']), int(row['scene_episode']))
         
-    return result
\ No newline at end of file
+    return result
+
+class XEMRefresher():
+    """
+    Refreshes the xem numbering of the shows that need it, in the background so the show
+    pages never have to wait on thexem.de
+    """
+
+    def __init__(self):
+        self.amActive = False
+
+        # shows whose page asked for a refresh, they're done right away without going through the whole library
+        self.wanted = set()
+        self.lock = threading.Lock()
+
+        self.lastFullRun = 0
+
+    def refreshShow(self, tvdb_id):
+        """
+        Has the show refreshed on the next run, which can be forced to happen now
+        """
+
+        with self.lock:
+            self.wanted.add(tvdb_id)
+
+    def run(self):
+        self.amActive = True
+
+        try:
+            with self.lock:
+                wanted = list(self.wanted)
+                self.wanted.clear()
+
+            for curShowID in _xem_refresh_needed_shows(wanted):
+                _xem_refresh(curShowID)
+
+            # a run forced by a show page doesn't check the whole library again
+            if time.time() - self.lastFullRun >= XEM_REFRESH_FREQUENCY * 60:
+                self.lastFullRun = time.time()
+                for curShowID in _xem_refresh_needed_shows([x.tvdbid for x in sickbeard.showList]):
+                    _xem_refresh(curShowID)
+        finally:
+            self.amActive = False
@@ -21,6 +21,7 @@ import time
 import threading
 import traceback
 
+from sickbeard import instrumentation
 from sickbeard import logger
 from sickbeard.exceptions import ex
 
@@ -51,6 +52,13 @@ class Scheduler:
     def timeLeft(self):
         return self.cycleTime - (datetime.datetime.now() - self.lastRun)
 
+    def delayRun(self, delay):
+        """
+        Makes the next run happen after the given timedelta instead of whenever it was due
+        """
+
+        self.lastRun = datetime.datetime.now() - self.cycleTime + delay
+
     def forceRun(self):
         if not self.action.amActive:
             self.lastRun = datetime.datetime.fromordinal(1)
@@ -65,6 +73,8 @@ class Scheduler:
 
             if currentTime - self.lastRun > self.cycleTime:
                 self.lastRun = currentTime
+                startTime = time.time()
+                instrumentation.startQueryCount()
                 try:
                     if not self.silent:
                         logger.log(u"Starting new thread: "+self.threadName, logger.DEBUG)
@@ -72,6 +82,8 @@ class Scheduler:
                 except Exception, e:
                     logger.log(u"Exception generated in thread "+self.threadName+": " + ex(e), logger.ERROR)
                     logger.log(repr(traceback.format_exc()), logger.DEBUG)
+                queries, queryTime = instrumentation.stopQueryCount()
+                instrumentation.record(instrumentation.SCHEDULER, self.threadName, time.time() - startTime, queries, queryTime)
 
             if self.abort:
                 self.abort = False
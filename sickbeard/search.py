@@ -34,9 +34,12 @@ from sickbeard import nzbSplitter
 from sickbeard import ui
 from sickbeard import encodingKludge as ek
 from sickbeard import providers
+from sickbeard import provider_health
+from sickbeard import request_budget
 
 from sickbeard.exceptions import ex
 from sickbeard.providers.generic import GenericProvider
+from sickbeard.release_merger import ReleaseMerger
 
 def _downloadResult(result):
     """
@@ -72,7 +75,7 @@ def _downloadResult(result):
         # save the data to disk
         try:
             fileOut = open(fileName, "w")
-            fileOut.write(result.extraInfo[0])
+            fileOut.write(result.getNZBData())
             fileOut.close()
             helpers.chmodAsParent(fileName)
         except IOError, e:
@@ -94,53 +97,108 @@ def _downloadResult(result):
 
     return newResult
 
-def snatchEpisode(result, endStatus=SNATCHED):
+def _sendResults(results):
+    """
+    Sends the results to SAB/NZBget (all the NZBs in one go) or saves them to disk.
+
+    Returns a list with the download result for each of them.
+    """
+
+    dlResults = [False] * len(results)
+
+    # the ones which go to SAB/NZBget are sent together at the end
+    clientResults = []
+
+    for i, result in enumerate(results):
+
+        # NZBs can be sent straight to SAB or saved to disk
+        if result.resultType in ("nzb", "nzbdata"):
+            if sickbeard.NZB_METHOD == "blackhole":
+                dlResults[i] = _downloadResult(result)
+            elif sickbeard.NZB_METHOD in ("sabnzbd", "nzbget"):
+                clientResults.append(i)
+            else:
+                logger.log(u"Unknown NZB action specified in config: " + sickbeard.NZB_METHOD, logger.ERROR)
+
+        # torrents are always saved to disk
+        elif result.resultType == "torrent":
+            dlResults[i] = _downloadResult(result)
+        elif result.resultType == 'stream':
+            dlResults[i] = _downloadResult(result)
+        else:
+            logger.log(u"Unknown result type, unable to download it", logger.ERROR)
+
+    if clientResults:
+        nzbs = [results[i] for i in clientResults]
+
+        if sickbeard.NZB_METHOD == "sabnzbd":
+            sentResults = sab.sendNZBs(nzbs)
+        else:
+            sentResults = nzbget.sendNZBs(nzbs)
+
+        for i, sent in zip(clientResults, sentResults):
+            dlResults[i] = sent
+
+    return dlResults
+
+def snatchEpisodes(results, endStatus=SNATCHED):
     """
-    Contains the internal logic necessary to actually "snatch" a result that
-    has been found.
+    Contains the internal logic necessary to actually "snatch" results that
+    have been found. NZBs going to SAB/NZBget are sent as one batch and the history
+    and episode statuses for all the results are saved in a single transaction.
     
-    Returns a bool representing success.
+    Returns a list of bools saying which of the results were snatched.
     
-    result: SearchResult instance to be snatched.
-    endStatus: the episode status that should be used for the episode object once it's snatched.
+    results: list of SearchResult instances to be snatched.
+    endStatus: the episode status that should be used for the episode objects once they're snatched.
     """
 
-    # NZBs can be sent straight to SAB or saved to disk
-    if result.resultType in ("nzb", "nzbdata"):
-        if sickbeard.NZB_METHOD == "blackhole":
-            dlResult = _downloadResult(result)
-        elif sickbeard.NZB_METHOD == "sabnzbd":
-            dlResult = sab.sendNZB(result)
-        elif sickbeard.NZB_METHOD == "nzbget":
-            dlResult = nzbget.sendNZB(result)
-        else:
-            logger.log(u"Unknown NZB action specified in config: " + sickbeard.NZB_METHOD, logger.ERROR)
-            dlResult = False
-
-    # torrents are always saved to disk
-    elif result.resultType == "torrent":
-        dlResult = _downloadResult(result)
-    elif result.resultType == 'stream':
-        dlResult = _downloadResult(result)
-    else:
-        logger.log(u"Unknown result type, unable to download it", logger.ERROR)
-        dlResult = False
+    if not results:
+        return []
 
-    if dlResult == False:
-        return False
+    dlResults = _sendResults(results)
 
-    history.logSnatch(result)
+    queries = []
+    snatchedEps = []
 
-    # don't notify when we re-download an episode
-    for curEpObj in result.episodes:
-        with curEpObj.lock:
-            curEpObj.status = Quality.compositeStatus(endStatus, result.quality)
-            curEpObj.saveToDB()
+    for result, dlResult in zip(results, dlResults):
+
+        if dlResult == False:
+            continue
+
+        queries += history.snatchQueries(result)
 
+        for curEpObj in result.episodes:
+            with curEpObj.lock:
+                curEpObj.status = Quality.compositeStatus(endStatus, result.quality)
+                queries += curEpObj.saveQueries()
+
+            snatchedEps.append(curEpObj)
+
+    if queries:
+        myDB = db.DBConnection()
+        if myDB.mass_action(queries):
+            for curEpObj in snatchedEps:
+                curEpObj.dirty = False
+
+    # don't notify when we re-download an episode
+    for curEpObj in snatchedEps:
         if curEpObj.status not in Quality.DOWNLOADED:
             notifiers.notify_snatch(curEpObj.prettyName())
 
-    return True
+    return [x != False for x in dlResults]
+
+def snatchEpisode(result, endStatus=SNATCHED):
+    """
+    Snatches a single result, see snatchEpisodes.
+    
+    Returns a bool representing success.
+    
+    result: SearchResult instance to be snatched.
+    endStatus: the episode status that should be used for the episode object once it's snatched.
+    """
+
+    return snatchEpisodes([result], endStatus)[0]
 
 def searchForNeededEpisodes():
 
@@ -150,18 +208,26 @@ def searchForNeededEpisodes():
 
     didSearch = False
 
+    # the same release from several providers is only looked at once
+    merger = ReleaseMerger()
+
     # ask all providers for any episodes it finds
     for curProvider in providers.sortedProviderList():
 
         if not curProvider.isActive():
             continue
 
+        if not provider_health.canTry(curProvider.getID()):
+            logger.log(u"Skipping "+curProvider.name+" because it has been failing", logger.DEBUG)
+            continue
+
         curFoundResults = {}
 
         try:
-            curFoundResults = curProvider.searchRSS()
+            curFoundResults = curProvider.searchRSS(merger)
         except exceptions.AuthException, e:
             logger.log(u"Authentication error: "+ex(e), logger.ERROR)
+            provider_health.recordAuthFailure(curProvider.getID(), ex(e))
             continue
         except Exception, e:
             logger.log(u"Error while searching "+curProvider.name+", skipping: "+ex(e), logger.ERROR)
@@ -243,29 +309,7 @@ def isFinalResult(result):
     
     show_obj = result.episodes[0].show
     
-    any_qualities, best_qualities = Quality.splitQuality(show_obj.quality)
-    
-    # if there is a redownload that's higher than this then we definitely need to keep looking
-    if best_qualities and result.quality < max(best_qualities):
-        return False
-
-    # if there's no redownload that's higher (above) and this is the highest initial download then we're good
-    elif any_qualities and result.quality == max(any_qualities):
-        return True
-    
-    elif best_qualities and result.quality == max(best_qualities):
-        
-        # if this is the best redownload but we have a higher initial download then keep looking
-        if any_qualities and result.quality < max(any_qualities):
-            return False
-        
-        # if this is the best redownload and we don't have a higher initial download then we're done
-        else:
-            return True
-
-    # if we got here than it's either not on the lists, they're empty, or it's lower than the highest required
-    else:
-        return False
+    return Quality.isFinalQuality(result.quality, show_obj.quality)
 
 
 def findEpisode(episode, manualSearch=False):
@@ -276,15 +320,22 @@ def findEpisode(episode, manualSearch=False):
 
     didSearch = False
 
+    merger = ReleaseMerger()
+
     for curProvider in providers.sortedProviderList():
 
         if not curProvider.isActive():
             continue
 
+        if not provider_health.canTry(curProvider.getID()):
+            logger.log(u"Skipping "+curProvider.name+" because it has been failing", logger.DEBUG)
+            continue
+
         try:
             curFoundResults = curProvider.findEpisode(episode, manualSearch=manualSearch)
         except exceptions.AuthException, e:
             logger.log(u"Authentication error: "+ex(e), logger.ERROR)
+            provider_health.recordAuthFailure(curProvider.getID(), ex(e))
             continue
         except Exception, e:
             logger.log(u"Error while searching "+curProvider.name+", skipping: "+ex(e), logger.ERROR)
@@ -293,8 +344,8 @@ def findEpisode(episode, manualSearch=False):
 
         didSearch = True
 
-        # skip non-tv crap
-        curFoundResults = filter(lambda x: show_name_helpers.filterBadReleases(x.name) and show_name_helpers.isGoodResult(x.name, episode.show), curFoundResults)
+        # skip releases an earlier provider already gave us and non-tv crap
+        curFoundResults = filter(lambda x: merger.isGoodResult(x.name, episode.show), merger.merge(curFoundResults))
 
         # loop all results and see if any of them are good enough that we can stop searching
         done_searching = False
@@ -317,7 +368,13 @@ def findEpisode(episode, manualSearch=False):
 
     return bestResult
 
-def findSeason(show, season):
+def findSeason(show, season, providerIDs=None, cutOff=None):
+    """
+    Searches the providers for a season of a show and returns the results worth downloading.
+
+    providerIDs: only search these providers, all the active ones if None
+    cutOff: if given, the ids of the providers whose request budget ran out before they were done are added to it
+    """
 
     logger.log(u"Searching for stuff we need from "+show.name+" season "+str(season))
 
@@ -325,19 +382,34 @@ def findSeason(show, season):
 
     didSearch = False
 
+    merger = ReleaseMerger()
+
     for curProvider in providers.sortedProviderList():
 
         if not curProvider.isActive():
             continue
 
+        if providerIDs is not None and curProvider.getID() not in providerIDs:
+            continue
+
+        if not provider_health.canTry(curProvider.getID()):
+            logger.log(u"Skipping "+curProvider.name+" because it has been failing", logger.DEBUG)
+            continue
+
+        if request_budget.isExhausted(curProvider.getID()):
+            logger.log(u"Skipping "+curProvider.name+" because its request budget is used up", logger.DEBUG)
+            if cutOff is not None:
+                cutOff.append(curProvider.getID())
+            continue
+
         try:
             curResults = curProvider.findSeasonResults(show, season)
 
             # make a list of all the results for this provider
             for curEp in curResults:
 
-                # skip non-tv crap
-                curResults[curEp] = filter(lambda x:  show_name_helpers.filterBadReleases(x.name) and show_name_helpers.isGoodResult(x.name, show), curResults[curEp])
+                # skip releases an earlier provider already gave us and non-tv crap
+                curResults[curEp] = filter(lambda x: merger.isGoodResult(x.name, show), merger.merge(curResults[curEp]))
 
                 if curEp in foundResults:
                     foundResults[curEp] += curResults[curEp]
@@ -346,12 +418,17 @@ def findSeason(show, season):
 
         except exceptions.AuthException, e:
             logger.log(u"Authentication error: "+ex(e), logger.ERROR)
+            provider_health.recordAuthFailure(curProvider.getID(), ex(e))
             continue
         except Exception, e:
             logger.log(u"Error while searching "+curProvider.name+", skipping: "+ex(e), logger.ERROR)
             logger.log(traceback.format_exc(), logger.DEBUG)
             continue
 
+        # the search stops when the budget runs out so it might not have got through all the names and pages
+        if cutOff is not None and request_budget.isExhausted(curProvider.getID()):
+            cutOff.append(curProvider.getID())
+
         didSearch = True
 
     if not didSearch:
@@ -388,7 +465,7 @@ def findSeason(show, season):
         allWanted = True
         anyWanted = False
         for curEpNum in allEps:
-            if not show.wantEpisode(season, curEpNum, seasonQual):
+            if not merger.wantEpisode(show, season, curEpNum, seasonQual):
                 allWanted = False
             else:
                 anyWanted = True
@@ -413,7 +490,8 @@ def findSeason(show, season):
                 # if not, break it apart and add them as the lowest priority results
                 individualResults = nzbSplitter.splitResult(bestSeasonNZB)
 
-                individualResults = filter(lambda x:  show_name_helpers.filterBadReleases(x.name) and show_name_helpers.isGoodResult(x.name, show), individualResults)
+                # a provider may have listed some of the episodes on their own already, those copies are better
+                individualResults = filter(lambda x: merger.isGoodResult(x.name, show), merger.merge(individualResults))
 
                 for curResult in individualResults:
                     if len(curResult.episodes) == 1:
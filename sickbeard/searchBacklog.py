@@ -19,20 +19,25 @@
 from __future__ import with_statement
 
 import datetime
+import math
 import threading
 
 import sickbeard
 
-from sickbeard import db, scheduler
+from sickbeard import db, scheduler, providers, request_budget, provider_health
 from sickbeard import search_queue
 from sickbeard import logger
 from sickbeard import ui
-#from sickbeard.common import *
+from sickbeard.common import Quality, WANTED, DOWNLOADED, SNATCHED, SNATCHED_PROPER
+
+# how long the backlog plan shown on the Manage Searches page and by the API is kept before it's worked out again
+PLAN_CACHE_TIME = datetime.timedelta(minutes=5)
 
 class BacklogSearchScheduler(scheduler.Scheduler):
 
     def forceSearch(self):
         self.action._set_lastBacklog(1)
+        self.action._lastPlan = datetime.datetime.fromordinal(1)
         self.lastRun = datetime.datetime.fromordinal(1)
 
     def nextRun(self):
@@ -41,13 +46,49 @@ class BacklogSearchScheduler(scheduler.Scheduler):
         else:
             return datetime.date.fromordinal(self.action._lastBacklog + self.action.cycleTime)
 
+class BacklogSegment(object):
+    """
+    A season (or a month of an air by date show) which the backlog needs to search for.
+
+    wanted: number of episodes which are WANTED
+    upgrades: number of episodes we have but want in a better quality
+    last_airdate: ordinal of the newest episode in the segment
+    cost: estimated number of provider searches it takes
+    """
+
+    def __init__(self, show, segment):
+        self.show = show
+        self.segment = segment
+
+        self.wanted = 0
+        self.upgrades = 0
+        self.last_airdate = 1
+        self.cost = 0
+
+        # whether any episode aired since the date the plan was made from
+        self.recent = False
+
+    def needed(self):
+        return self.wanted + self.upgrades
+
+    def __str__(self):
+        return self.show.name + " segment " + str(self.segment) + ": " + str(self.wanted) + " wanted, " + str(self.upgrades) + " upgrades, cost " + str(self.cost)
+
 class BacklogSearcher:
 
     def __init__(self):
 
         self._lastBacklog = self._get_lastBacklog()
         self.cycleTime = 7
+
+        # how often the backlog is planned, the planned searches are dispatched every time we run
+        self.planFrequency = datetime.timedelta(minutes=720)
+        self._lastPlan = datetime.datetime.fromordinal(1)
         self.lock = threading.Lock()
+
+        # the plan for currentPlan and when it was made
+        self._cachedPlan = None
+        self._cachedPlanTime = datetime.datetime.fromordinal(1)
         self.amActive = False
         self.amPaused = False
         self.amWaiting = False
@@ -82,62 +123,164 @@ class BacklogSearcher:
         self._get_lastBacklog()
 
         curDate = datetime.date.today().toordinal()
-        fromDate = datetime.date.fromordinal(1)
+        fromDate = self._get_fromDate(which_shows)
 
-        if not which_shows and not curDate - self._lastBacklog >= self.cycleTime:
+        if fromDate != datetime.date.fromordinal(1):
             logger.log(u"Running limited backlog on recently missed episodes only")
-            fromDate = datetime.date.today() - datetime.timedelta(days=7)
 
         self.amActive = True
         self.amPaused = False
 
-        #myDB = db.DBConnection()
-        #numSeasonResults = myDB.select("SELECT DISTINCT(season), showid FROM tv_episodes ep, tv_shows show WHERE season != 0 AND ep.showid = show.tvdb_id AND show.paused = 0 AND ep.airdate > ?", [fromDate.toordinal()])
+        # only the segments which actually need something get searched
+        plan = self.planBacklog(show_list, fromDate)
 
-        # get separate lists of the season/date shows
-        #season_shows = [x for x in show_list if not x.air_by_date]
-        air_by_date_shows = [x for x in show_list if x.air_by_date]
-
-        # figure out how many segments of air by date shows we're going to do
-        air_by_date_segments = []
-        for cur_id in [x.tvdbid for x in air_by_date_shows]:
-            air_by_date_segments += self._get_air_by_date_segments(cur_id, fromDate) 
-
-        logger.log(u"Air-by-date segments: "+str(air_by_date_segments), logger.DEBUG)
+        # searches for specific shows were asked for by the user so they're started right away
+        if which_shows:
+            for cur_segment in plan:
 
-        #totalSeasons = float(len(numSeasonResults) + len(air_by_date_segments))
-        #numSeasonsDone = 0.0
+                self.currentSearchInfo = {'title': cur_segment.show.name + " Season "+str(cur_segment.segment)}
 
-        # go through non air-by-date shows and see if they need any episodes
-        for curShow in show_list:
+                logger.log(u"Adding backlog search for " + str(cur_segment), logger.DEBUG)
+                backlog_queue_item = search_queue.BacklogQueueItem(cur_segment.show, cur_segment.segment)
+                sickbeard.searchQueueScheduler.action.add_item(backlog_queue_item)  #@UndefinedVariable
 
-            if curShow.paused:
-                continue
+        # otherwise save the plan and let dispatchBacklog spread it out over the backlog cycle
+        else:
+            logger.log(u"Saving " + str(len(plan)) + " planned backlog searches", logger.DEBUG)
+            myDB = db.DBConnection()
 
-            if curShow.air_by_date:
-                segments = [x[1] for x in self._get_air_by_date_segments(curShow.tvdbid, fromDate)]
+            # saved segments which don't need anything any more (downloaded, skipped, ignored, ...) are taken out. A limited
+            # backlog only plans the recent segments so the older ones are checked against a full plan.
+            if fromDate == datetime.date.fromordinal(1):
+                needed = plan
             else:
-                segments = self._get_season_segments(curShow.tvdbid, fromDate)
-
-            for cur_segment in segments:
+                needed = self.planBacklog(show_list, datetime.date.fromordinal(1))
+            needed_keys = set([(x.show.tvdbid, str(x.segment)) for x in needed])
 
-                self.currentSearchInfo = {'title': curShow.name + " Season "+str(cur_segment)}
+            queries = [["DELETE FROM backlog_progress WHERE showid = ? AND segment = ?", [x["showid"], x["segment"]]]
+                       for x in myDB.select("SELECT showid, segment FROM backlog_progress") if (int(x["showid"]), x["segment"]) not in needed_keys]
+            if queries:
+                logger.log(u"Removing " + str(len(queries)) + " planned backlog searches which aren't needed any more", logger.DEBUG)
 
-                backlog_queue_item = search_queue.BacklogQueueItem(curShow, cur_segment)
-
-                if not backlog_queue_item.wantSeason:
-                    logger.log(u"Nothing in season "+str(cur_segment)+" needs to be downloaded, skipping this season", logger.DEBUG)
-                else:
-                    sickbeard.searchQueueScheduler.action.add_item(backlog_queue_item)  #@UndefinedVariable
+            queries += [["INSERT OR REPLACE INTO backlog_progress (showid, segment, last_airdate, cost, providers) VALUES (?,?,?,?,?)",
+                         [x.show.tvdbid, str(x.segment), x.last_airdate, x.cost, ""]] for x in plan]
+            myDB.mass_action(queries)
 
         # don't consider this an actual backlog search if we only did recent eps
         # or if we only did certain shows
         if fromDate == datetime.date.fromordinal(1) and not which_shows:
             self._set_lastBacklog(curDate)
 
+        # the shown plan is out of date now
+        self._cachedPlan = None
+
         self.amActive = False
         self._resetPI()
 
+    def dispatchBacklog(self):
+        """
+        Hands the next part of the saved backlog plan to the search queue. The searches are spread evenly over
+        the time left until the next full backlog with the most recently aired segments first, and each provider
+        is only given as many segments as its request budget allows right now. Whatever isn't dispatched (to
+        every provider) stays saved in the DB.
+        """
+
+        # wait for the last part to be done, this also stops a paused backlog from piling up
+        if sickbeard.searchQueueScheduler.action.is_backlog_in_progress():  #@UndefinedVariable
+            return
+
+        myDB = db.DBConnection()
+        sqlResults = myDB.select("SELECT * FROM backlog_progress ORDER BY last_airdate DESC")
+
+        if not sqlResults:
+            return
+
+        # spread what's left over the dispatches until the next full backlog
+        if self._lastBacklog <= 1:
+            time_left = datetime.timedelta(0)
+        else:
+            next_backlog = datetime.datetime.combine(datetime.date.fromordinal(self._lastBacklog + self.cycleTime), datetime.time())
+            time_left = next_backlog - datetime.datetime.now()
+
+        dispatches_left = max(1.0, (time_left.days * 86400 + time_left.seconds) / (sickbeard.BACKLOG_DISPATCH_FREQUENCY * 60.0))
+        num_to_dispatch = int(math.ceil(len(sqlResults) / dispatches_left))
+
+        # episodes which aired in the last week don't wait their turn
+        recent_date = (datetime.date.today() - datetime.timedelta(days=7)).toordinal()
+
+        # every segment does at least one search with each provider it's dispatched to, so that's how many segments each
+        # provider's budget can take right now (None if it isn't limited). Segments needing more names or pages stop when
+        # the budget runs out and are dispatched to that provider again later, see BacklogQueueItem.
+        active = [x.getID() for x in providers.sortedProviderList() if x.isActive()]
+        budgets = dict([(x, request_budget.available(x)) for x in active if provider_health.canTry(x)])
+
+        shows = dict([(x.tvdbid, x) for x in sickbeard.showList])
+
+        # show id -> segments which still need something
+        needed = {}
+
+        num_dispatched = 0
+
+        for cur_result in sqlResults:
+
+            if num_dispatched >= num_to_dispatch and int(cur_result["last_airdate"]) < recent_date:
+                break
+
+            if not [x for x in budgets.values() if x is None or x >= 1]:
+                logger.log(u"The provider request budgets are used up (or the providers are failing), leaving the rest of the backlog for later", logger.DEBUG)
+                break
+
+            cur_show = shows.get(int(cur_result["showid"]))
+
+            # the providers it hasn't been searched with yet, if it was cut short last time
+            if cur_result["providers"]:
+                pending = [x for x in cur_result["providers"].split("|") if x in active]
+            else:
+                pending = active
+
+            # it'll be planned again if it's unpaused
+            if not cur_show or cur_show.paused or not pending:
+                myDB.action("DELETE FROM backlog_progress WHERE showid = ? AND segment = ?", [cur_result["showid"], cur_result["segment"]])
+                continue
+
+            # the rest wait for their budgets to refill or for them to stop failing
+            dispatch_to = [x for x in pending if x in budgets and (budgets[x] is None or budgets[x] >= 1)]
+            if not dispatch_to:
+                continue
+
+            if cur_show.air_by_date:
+                cur_segment = cur_result["segment"]
+            else:
+                cur_segment = int(cur_result["segment"])
+
+            # it might have been downloaded, skipped or ignored since it was planned
+            if cur_show.tvdbid not in needed:
+                needed[cur_show.tvdbid] = set([str(x.segment) for x in self.planBacklog([cur_show], datetime.date.fromordinal(1))])
+            if str(cur_segment) not in needed[cur_show.tvdbid]:
+                logger.log(u"Nothing is needed from " + cur_show.name + " segment " + str(cur_segment) + " any more, not searching for it", logger.DEBUG)
+                myDB.action("DELETE FROM backlog_progress WHERE showid = ? AND segment = ?", [cur_result["showid"], cur_result["segment"]])
+                continue
+
+            for cur_provider in dispatch_to:
+                if budgets[cur_provider] is not None:
+                    budgets[cur_provider] -= 1
+
+            logger.log(u"Dispatching backlog search for " + cur_show.name + " segment " + str(cur_segment) + " to " + ", ".join(dispatch_to), logger.DEBUG)
+            backlog_queue_item = search_queue.BacklogQueueItem(cur_show, cur_segment, dispatch_to, [x for x in pending if x not in dispatch_to])
+            sickbeard.searchQueueScheduler.action.add_item(backlog_queue_item)  #@UndefinedVariable
+
+            num_dispatched += 1
+
+        logger.log(u"Dispatched " + str(num_dispatched) + " of " + str(len(sqlResults)) + " planned backlog searches")
+
+    def pendingSearches(self):
+        """
+        Returns the number of planned backlog searches which haven't been done yet
+        """
+
+        myDB = db.DBConnection()
+        return int(myDB.select("SELECT COUNT(*) FROM backlog_progress")[0][0])
+
     def _get_lastBacklog(self):
 
         logger.log(u"Retrieving the last check time from the DB", logger.DEBUG)
@@ -155,29 +298,130 @@ class BacklogSearcher:
         self._lastBacklog = lastBacklog
         return self._lastBacklog
 
-    def _get_season_segments(self, tvdb_id, fromDate):
-        myDB = db.DBConnection()
-        sqlResults = myDB.select("SELECT DISTINCT(season) as season FROM tv_episodes WHERE showid = ? AND season > 0 and airdate > ?", [tvdb_id, fromDate.toordinal()])
-        return [int(x["season"]) for x in sqlResults]
+    def _get_fromDate(self, which_shows=None):
+        """
+        Returns the date the backlog searches from: the beginning of time for a full backlog, a week ago
+        if it's not time for a full one yet
+        """
+
+        curDate = datetime.date.today().toordinal()
+
+        if not which_shows and not curDate - self._lastBacklog >= self.cycleTime:
+            return datetime.date.today() - datetime.timedelta(days=7)
+
+        return datetime.date.fromordinal(1)
+
+    def planBacklog(self, show_list=None, fromDate=None):
+        """
+        Works out which segments (seasons, or months for air by date shows) of which shows need to be
+        searched for. The episode statuses of all the shows are counted in a single grouped query.
+
+        show_list: shows to plan for, all shows if None. Paused shows are skipped.
+        fromDate: only plan segments with an episode that aired after this date, works it out like
+                  the backlog does if None
+
+        Returns a list of BacklogSegments which need at least one episode.
+        """
+
+        if show_list is None:
+            show_list = sickbeard.showList
+
+        if fromDate is None:
+            fromDate = self._get_fromDate()
+
+        shows = dict([(x.tvdbid, x) for x in show_list if not x.paused])
+        if not shows:
+            return []
+
+        # the highest quality each show would be upgraded to
+        highest_best_quality = {}
+        for cur_show in shows.values():
+            anyQualities, bestQualities = Quality.splitQuality(cur_show.quality)  #@UnusedVariable
+            if bestQualities:
+                highest_best_quality[cur_show.tvdbid] = max(bestQualities)
+            else:
+                highest_best_quality[cur_show.tvdbid] = 0
+
+        # every active provider that isn't failing does a season search for each segment
+        cost = len([x for x in providers.sortedProviderList() if x.isActive() and provider_health.canTry(x.getID())])
+
+        # count the episodes of each status per season and month, airdates are ordinals so convert them to julian days for sqlite
+        sql = "SELECT showid, season, status, strftime('%Y-%m', airdate + 1721424.5) AS month, COUNT(*) AS eps, MAX(airdate) AS last_airdate FROM tv_episodes"
+        sql_args = []
+        if show_list is not sickbeard.showList:
+            sql += " WHERE showid IN (" + ",".join(["?"] * len(shows)) + ")"
+            sql_args = shows.keys()
+        sql += " GROUP BY showid, season, month, status"
 
-    def _get_air_by_date_segments(self, tvdb_id, fromDate):
-        # query the DB for all dates for this show
         myDB = db.DBConnection()
-        num_air_by_date_results = myDB.select("SELECT airdate, showid FROM tv_episodes ep, tv_shows show WHERE season != 0 AND ep.showid = show.tvdb_id AND show.paused = 0 ANd ep.airdate > ? AND ep.showid = ?",
-                                 [fromDate.toordinal(), tvdb_id])
-
-        # break them apart into month/year strings
-        air_by_date_segments = []
-        for cur_result in num_air_by_date_results:
-            cur_date = datetime.date.fromordinal(int(cur_result["airdate"]))
-            cur_date_str = str(cur_date)[:7]
-            cur_tvdb_id = int(cur_result["showid"])
-            
-            cur_result_tuple = (cur_tvdb_id, cur_date_str)
-            if cur_result_tuple not in air_by_date_segments:
-                air_by_date_segments.append(cur_result_tuple)
-        
-        return air_by_date_segments
+        sqlResults = myDB.select(sql, sql_args)
+
+        segments = {}
+
+        for cur_result in sqlResults:
+            cur_show = shows.get(int(cur_result["showid"]))
+            if not cur_show:
+                continue
+
+            cur_season = int(cur_result["season"])
+
+            if cur_show.air_by_date:
+                cur_segment = cur_result["month"]
+                searchable = cur_season != 0
+            else:
+                cur_segment = cur_season
+                searchable = cur_season > 0
+                if not searchable:
+                    continue
+
+            key = (cur_show.tvdbid, cur_segment)
+            if key not in segments:
+                segments[key] = BacklogSegment(cur_show, cur_segment)
+            backlog_segment = segments[key]
+
+            eps = int(cur_result["eps"])
+            last_airdate = int(cur_result["last_airdate"])
+
+            if searchable and last_airdate > fromDate.toordinal():
+                backlog_segment.recent = True
+            backlog_segment.last_airdate = max(backlog_segment.last_airdate, last_airdate)
+
+            curStatus, curQuality = Quality.splitCompositeStatus(int(cur_result["status"]))
+
+            # if we need a better one then say yes
+            if curStatus == WANTED:
+                backlog_segment.wanted += eps
+            elif curStatus in (DOWNLOADED, SNATCHED, SNATCHED_PROPER) and curQuality < highest_best_quality[cur_show.tvdbid]:
+                backlog_segment.upgrades += eps
+
+        # keep the show list order, with each show's segments in order
+        show_order = dict([(x.tvdbid, i) for i, x in enumerate(show_list)])
+
+        plan = []
+        for key in sorted(segments.keys(), key=lambda x: (show_order[x[0]], x[1])):
+            backlog_segment = segments[key]
+            if not backlog_segment.recent or not backlog_segment.needed():
+                continue
+            backlog_segment.cost = cost
+            plan.append(backlog_segment)
+
+        logger.log(u"Backlog plan has " + str(len(plan)) + " segments out of " + str(len(segments)), logger.DEBUG)
+
+        return plan
+
+    def currentPlan(self):
+        """
+        Returns what planBacklog gives for all the shows, but only works it out again every PLAN_CACHE_TIME so
+        looking at it doesn't run the grouped query over all the episodes every time
+        """
+
+        now = datetime.datetime.now()
+
+        if self._cachedPlan is None or now - self._cachedPlanTime >= PLAN_CACHE_TIME:
+            self._cachedPlan = self.planBacklog()
+            self._cachedPlanTime = now
+
+        return self._cachedPlan
 
     def _set_lastBacklog(self, when):
 
@@ -194,7 +438,12 @@ class BacklogSearcher:
 
     def run(self):
         try:
-            self.searchBacklog()
+            # plan the backlog every planFrequency, the plan is dispatched a bit at a time every run
+            if datetime.datetime.now() - self._lastPlan >= self.planFrequency:
+                self._lastPlan = datetime.datetime.now()
+                self.searchBacklog()
+
+            self.dispatchBacklog()
         except:
             self.amActive = False
             raise
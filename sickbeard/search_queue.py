@@ -19,13 +19,13 @@
 from __future__ import with_statement
 
 import datetime
-import time
 
 import sickbeard
 from sickbeard import db, logger, common, exceptions, helpers
 from sickbeard import generic_queue
 from sickbeard import search
 from sickbeard import ui
+from sickbeard import episode_cache
 
 BACKLOG_SEARCH = 10
 RSS_SEARCH = 20
@@ -84,12 +84,17 @@ class ManualSearchQueueItem(generic_queue.QueueItem):
         self.priority = generic_queue.QueuePriorities.HIGH
 
         self.ep_obj = ep_obj
+        self.pinned = False
 
         self.success = None
 
     def execute(self):
         generic_queue.QueueItem.execute(self)
 
+        # keep it in the episode cache while it's being searched for
+        episode_cache.pinEpisode(self.ep_obj)
+        self.pinned = True
+
         logger.log(u"Beginning manual search for " + self.ep_obj.prettyName())
 
         foundEpisode = search.findEpisode(self.ep_obj, manualSearch=True)
@@ -116,6 +121,9 @@ class ManualSearchQueueItem(generic_queue.QueueItem):
         # don't let this linger if something goes wrong
         if self.success == None:
             self.success = False
+        if self.pinned:
+            episode_cache.unpinEpisode(self.ep_obj)
+            self.pinned = False
         generic_queue.QueueItem.finish(self)
 
 
@@ -135,9 +143,7 @@ class RSSSearchQueueItem(generic_queue.QueueItem):
         if not len(foundResults):
             logger.log(u"No needed episodes found on the RSS feeds")
         else:
-            for curResult in foundResults:
-                search.snatchEpisode(curResult)
-                time.sleep(2)
+            search.snatchEpisodes(foundResults)
 
         generic_queue.QueueItem.finish(self)
 
@@ -162,7 +168,7 @@ class RSSSearchQueueItem(generic_queue.QueueItem):
                 logger.log(u"Unable to find the show with ID " + str(sqlEp["showid"]) + " in your show list! DB value was " + str(sqlEp), logger.ERROR)
                 return None
 
-            ep = show.getEpisode(sqlEp["season"], sqlEp["episode"])
+            ep = show.getEpisode(int(sqlEp["season"]), int(sqlEp["episode"]), dbResult=sqlEp)
             with ep.lock:
                 if ep.show.paused:
                     ep.status = common.SKIPPED
@@ -172,7 +178,12 @@ class RSSSearchQueueItem(generic_queue.QueueItem):
 
 
 class BacklogQueueItem(generic_queue.QueueItem):
-    def __init__(self, show, segment):
+    def __init__(self, show, segment, providerIDs=None, laterProviderIDs=None):
+        """
+        providerIDs: the providers to search, all of them if None
+        laterProviderIDs: providers the segment still has to be searched with in a later dispatch
+        """
+
         generic_queue.QueueItem.__init__(self, 'Backlog', BACKLOG_SEARCH)
         self.priority = generic_queue.QueuePriorities.LOW
         self.thread_name = 'BACKLOG-' + str(show.tvdbid)
@@ -180,59 +191,30 @@ class BacklogQueueItem(generic_queue.QueueItem):
         self.show = show
         self.segment = segment
 
-        logger.log(u"Seeing if we need any episodes from " + self.show.name + " season " + str(self.segment))
-
-        myDB = db.DBConnection()
-
-        # see if there is anything in this season worth searching for
-        if not self.show.air_by_date:
-            statusResults = myDB.select("SELECT status FROM tv_episodes WHERE showid = ? AND season = ?", [self.show.tvdbid, self.segment])
-        else:
-            segment_year, segment_month = map(int, self.segment.split('-'))
-            min_date = datetime.date(segment_year, segment_month, 1)
-
-            # it's easier to just hard code this than to worry about rolling the year over or making a month length map
-            if segment_month == 12:
-                max_date = datetime.date(segment_year, 12, 31)
-            else:
-                max_date = datetime.date(segment_year, segment_month + 1, 1) - datetime.timedelta(days=1)
-
-            statusResults = myDB.select("SELECT status FROM tv_episodes WHERE showid = ? AND airdate >= ? AND airdate <= ?",
-                                        [self.show.tvdbid, min_date.toordinal(), max_date.toordinal()])
-
-        anyQualities, bestQualities = common.Quality.splitQuality(self.show.quality)  #@UnusedVariable
-        self.wantSeason = self._need_any_episodes(statusResults, bestQualities)
+        self.providerIDs = providerIDs
+        self.laterProviderIDs = laterProviderIDs or []
 
     def execute(self):
 
         generic_queue.QueueItem.execute(self)
 
-        results = search.findSeason(self.show, self.segment)
+        cutOff = []
+        results = search.findSeason(self.show, self.segment, self.providerIDs, cutOff)
 
         # download whatever we find
-        for curResult in results:
-            search.snatchEpisode(curResult)
-            time.sleep(5)
-
-        self.finish()
-
-    def _need_any_episodes(self, statusResults, bestQualities):
+        search.snatchEpisodes(results)
 
-        wantSeason = False
-
-        # check through the list of statuses to see if we want any
-        for curStatusResult in statusResults:
-            curCompositeStatus = int(curStatusResult["status"])
-            curStatus, curQuality = common.Quality.splitCompositeStatus(curCompositeStatus)
+        myDB = db.DBConnection()
 
-            if bestQualities:
-                highestBestQuality = max(bestQualities)
-            else:
-                highestBestQuality = 0
+        # providers which ran out of requests might not have finished, leave it planned for just them (and the
+        # ones it wasn't dispatched to yet) so it's searched with them again once their budgets have refilled
+        remaining = self.laterProviderIDs + [x for x in cutOff if x not in self.laterProviderIDs]
+        if remaining:
+            logger.log(u"Backlog search for " + self.show.name + " segment " + str(self.segment) + " still has to be done with " + ", ".join(remaining), logger.DEBUG)
+            myDB.action("UPDATE backlog_progress SET providers = ? WHERE showid = ? AND segment = ?", ["|".join(remaining), self.show.tvdbid, str(self.segment)])
 
-            # if we need a better one then say yes
-            if (curStatus in (common.DOWNLOADED, common.SNATCHED, common.SNATCHED_PROPER) and curQuality < highestBestQuality) or curStatus == common.WANTED:
-                wantSeason = True
-                break
+        else:
+            # this segment is done, don't search it again if we get restarted before the backlog finishes
+            myDB.action("DELETE FROM backlog_progress WHERE showid = ? AND segment = ?", [self.show.tvdbid, str(self.segment)])
 
-        return wantSeason
+        self.finish()
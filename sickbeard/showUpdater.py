@@ -17,12 +17,14 @@
 # along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
 
 import datetime
+import time
 
 import sickbeard
 
 from sickbeard import logger
 from sickbeard import exceptions
 from sickbeard import ui
+from sickbeard import tvdb_updates
 from sickbeard.exceptions import ex
 
 class ShowUpdater():
@@ -39,20 +41,47 @@ class ShowUpdater():
 
         hourDiff = datetime.datetime.today().time().hour - updateTime.hour
 
-        # if it's less than an interval after the update time then do an update (or if we're forcing it)
-        if hourDiff >= 0 and hourDiff < self.updateInterval.seconds/3600 or force:
-            logger.log(u"Doing full update on all shows")
-        else:
+        # only update if it's less than an interval after the update time (or if we're forcing it)
+        if not (hourDiff >= 0 and hourDiff < self.updateInterval.seconds/3600 or force):
             return
 
+        # only update the shows which changed on TVDB since the last update
+        updateStartTime = int(time.time())
+        lastUpdate = tvdb_updates.getLastUpdate()
+        updates = tvdb_updates.getUpdates(lastUpdate)
+
+        # move on now, before anything is queued, so the updates which fail (here or once they've run)
+        # can put it back to get their changes again next time
+        if updates:
+            tvdb_updates.setLastUpdate(updates.time)
+        else:
+            tvdb_updates.setLastUpdate(updateStartTime)
+
+        if updates:
+            logger.log(u"Updating the shows which changed on TVDB")
+        else:
+            logger.log(u"Doing full update on all shows")
+
         piList = []
 
         for curShow in sickbeard.showList:
 
+            needsUpdate = False
+
             try:
 
-                if curShow.status != "Ended":
-                    curQueueItem = sickbeard.showQueueScheduler.action.updateShow(curShow, True) #@UndefinedVariable
+                if updates:
+                    if updates.isChanged(curShow.tvdbid):
+                        changedEpisodes = updates.changedEpisodes(curShow.tvdbid)
+                        logger.log(u"Show " + curShow.name + " changed on TVDB (" + str(len(changedEpisodes)) + " episodes), updating it", logger.DEBUG)
+                        needsUpdate = True
+                        curQueueItem = sickbeard.showQueueScheduler.action.updateShow(curShow, True, changedEpisodes, lastUpdate) #@UndefinedVariable
+                    else:
+                        curQueueItem = sickbeard.showQueueScheduler.action.refreshShow(curShow, True) #@UndefinedVariable
+
+                elif curShow.status != "Ended":
+                    needsUpdate = True
+                    curQueueItem = sickbeard.showQueueScheduler.action.updateShow(curShow, True, changedSince=lastUpdate) #@UndefinedVariable
                 else:
                     #TODO: maybe I should still update specials?
                     logger.log(u"Not updating episodes for show "+curShow.name+" because it's marked as ended.", logger.DEBUG)
@@ -62,5 +91,8 @@ class ShowUpdater():
 
             except (exceptions.CantUpdateException, exceptions.CantRefreshException), e:
                 logger.log(u"Automatic update failed: " + ex(e), logger.ERROR)
+                # its changes have to be got again next time
+                if needsUpdate:
+                    tvdb_updates.rewindLastUpdate(lastUpdate)
 
         ui.ProgressIndicators.setIndicator('dailyUpdate', ui.QueueProgressIndicator("Daily Update", piList))
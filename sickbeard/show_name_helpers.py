@@ -74,6 +74,21 @@ def filterBadReleases(name):
     return True
 
 
+def canonicalReleaseName(name):
+    """
+    Returns the name a release goes by no matter which provider listed it: lower case, without a
+    .nzb/.torrent extension and with runs of dots, dashes, underscores and spaces turned into one dot.
+
+    name: the release name
+
+    Returns: the canonical name, eg. "Show Name - S01E01 - 720p HDTV x264-GRP.nzb" -> "show.name.s01e01.720p.hdtv.x264.grp"
+    """
+
+    name = re.sub('(?i)\.(nzb|torrent)$', '', name.strip())
+
+    return re.sub('[\.\-\ _]+', '.', name.lower()).strip('.')
+
+
 def sceneToNormalShowNames(name):
     """
     Takes a show name from a scene dirname and converts it to a more "human-readable" format.
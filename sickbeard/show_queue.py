@@ -18,6 +18,7 @@
 
 from __future__ import with_statement
 
+import time
 import traceback
 
 import sickbeard
@@ -30,6 +31,7 @@ from sickbeard.tv import TVShow
 from sickbeard import exceptions, logger, ui, db
 from sickbeard import generic_queue
 from sickbeard import name_cache
+from sickbeard import tvdb_updates
 from sickbeard.exceptions import ex
 
 
@@ -72,7 +74,11 @@ class ShowQueue(generic_queue.GenericQueue):
 
     loadingShowList = property(_getLoadingShowList)
 
-    def updateShow(self, show, force=False):
+    def updateShow(self, show, force=False, changedEpisodes=None, changedSince=None):
+        """
+        changedEpisodes: if given only the episodes with these TVDB ids (and any new ones) are reloaded from TVDB
+        changedSince: the last TVDB update time the daily update got the changes since, it's put back if the update fails
+        """
 
         if self.isBeingAdded(show):
             raise exceptions.CantUpdateException("Show is still being added, wait until it is finished before you update.")
@@ -84,9 +90,9 @@ class ShowQueue(generic_queue.GenericQueue):
             raise exceptions.CantUpdateException("This show is already being updated, can't update again until it's done.")
 
         if not force:
-            queueItemObj = QueueItemUpdate(show)
+            queueItemObj = QueueItemUpdate(show, changedEpisodes, changedSince)
         else:
-            queueItemObj = QueueItemForceUpdate(show)
+            queueItemObj = QueueItemForceUpdate(show, changedEpisodes, changedSince)
 
         self.add_item(queueItemObj)
 
@@ -308,7 +314,7 @@ class QueueItemAdd(ShowQueueItem):
         if self.default_status != SKIPPED:
             logger.log(u"Setting all episodes to the specified default status: " + str(self.default_status))
             myDB = db.DBConnection()
-            myDB.action("UPDATE tv_episodes SET status = ? WHERE status = ? AND showid = ? AND season != 0", [self.default_status, SKIPPED, self.show.tvdbid])
+            myDB.action("UPDATE tv_episodes SET status = ?, last_modified = ? WHERE status = ? AND showid = ? AND season != 0", [self.default_status, int(time.time()), SKIPPED, self.show.tvdbid])
 
         # if they started with WANTED eps then run the backlog
         if self.default_status == WANTED:
@@ -388,9 +394,16 @@ class QueueItemRename(ShowQueueItem):
 
 
 class QueueItemUpdate(ShowQueueItem):
-    def __init__(self, show=None):
+    def __init__(self, show=None, changedEpisodes=None, changedSince=None):
         ShowQueueItem.__init__(self, ShowQueueActions.UPDATE, show)
         self.force = False
+        self.changedEpisodes = changedEpisodes
+        self.changedSince = changedSince
+
+    def _tvdbFailed(self):
+        # the daily update has moved on past this show's changes, put it back so they're tried again
+        if self.changedSince is not None:
+            tvdb_updates.rewindLastUpdate(self.changedSince)
 
     def execute(self):
 
@@ -403,9 +416,11 @@ class QueueItemUpdate(ShowQueueItem):
             self.show.loadFromTVDB(cache=not self.force)
         except tvdb_exceptions.tvdb_error, e:
             logger.log(u"Unable to contact TVDB, aborting: " + ex(e), logger.WARNING)
+            self._tvdbFailed()
             return
         except tvdb_exceptions.tvdb_attributenotfound, e:
             logger.log(u"Data retrieved from TVDB was incomplete, aborting: " + ex(e), logger.ERROR)
+            self._tvdbFailed()
             return
 
         # get episode list from DB
@@ -415,13 +430,14 @@ class QueueItemUpdate(ShowQueueItem):
         # get episode list from TVDB
         logger.log(u"Loading all episodes from theTVDB", logger.DEBUG)
         try:
-            TVDBEpList = self.show.loadEpisodesFromTVDB(cache=not self.force)
+            TVDBEpList = self.show.loadEpisodesFromTVDB(cache=not self.force, changedEpisodes=self.changedEpisodes)
         except tvdb_exceptions.tvdb_exception, e:
             logger.log(u"Unable to get info from TVDB, the show info will not be refreshed: " + ex(e), logger.ERROR)
             TVDBEpList = None
 
         if TVDBEpList == None:
             logger.log(u"No data returned from TVDB, unable to update this show", logger.ERROR)
+            self._tvdbFailed()
 
         else:
 
@@ -453,6 +469,8 @@ class QueueItemUpdate(ShowQueueItem):
 
 
 class QueueItemForceUpdate(QueueItemUpdate):
-    def __init__(self, show=None):
+    def __init__(self, show=None, changedEpisodes=None, changedSince=None):
         ShowQueueItem.__init__(self, ShowQueueActions.FORCEUPDATE, show)
         self.force = True
+        self.changedEpisodes = changedEpisodes
+        self.changedSince = changedSince
@@ -21,6 +21,7 @@ from __future__ import with_statement
 import os.path
 import datetime
 import threading
+import time
 import re
 import glob
 
@@ -37,7 +38,9 @@ from sickbeard import helpers, exceptions, logger
 from sickbeard.exceptions import ex
 from sickbeard import tvrage
 from sickbeard import image_cache
+from sickbeard import episode_cache
 from sickbeard import postProcessor
+from sickbeard.metadata import helpers as metadata_helpers
 from sickbeard.scene_exceptions import get_scene_exceptions
 
 from sickbeard import encodingKludge as ek
@@ -48,7 +51,12 @@ from common import NAMING_DUPLICATE, NAMING_EXTEND, NAMING_LIMITED_EXTEND, NAMIN
 
 class TVShow(object):
 
-    def __init__ (self, tvdbid, lang=""):
+    def __init__ (self, tvdbid, lang="", dbResult=None):
+        """
+        Loads the show from the database and saves it back. When the show's tv_shows row was already
+        fetched (eg. when loading all the shows at startup) it can be given as dbResult, the show is
+        then built straight from it without checking the show list or saving anything.
+        """
 
         self.tvdbid = tvdbid
 
@@ -73,7 +81,11 @@ class TVShow(object):
         self._isDirGood = False
 
         self.episodes = {}
-        
+
+        if dbResult is not None:
+            self.loadFromDB(dbResult=dbResult)
+            return
+
         otherShow = helpers.findCertainShow(sickbeard.showList, self.tvdbid)
         if otherShow != None:
             raise exceptions.MultipleShowObjectsException("Can't create a show if it already exists")
@@ -111,75 +123,92 @@ class TVShow(object):
     # delete references to anything that's not in the internal lists
     def flushEpisodes(self):
 
-        for curSeason in self.episodes:
-            for curEp in self.episodes[curSeason]:
-                myEp = self.episodes[curSeason][curEp]
-                self.episodes[curSeason][curEp] = None
-                del myEp
+        episode_cache.removeShow(self)
 
     def getAllEpisodes(self, season=None, has_location=False):
 
         myDB = db.DBConnection()
 
-        sql_selection = "SELECT season, episode, "
-
-        # subselection to detect multi-episodes early, share_location > 0
-        sql_selection = sql_selection + " (SELECT COUNT (*) FROM tv_episodes WHERE showid = tve.showid AND season = tve.season AND location != '' AND location = tve.location AND episode != tve.episode) AS share_location "
-
-        sql_selection = sql_selection + " FROM tv_episodes tve WHERE showid = " + str(self.tvdbid)
+        # load every row in one go, the episode objects are built straight from them
+        sql_selection = "SELECT * FROM tv_episodes WHERE showid = ?"
+        sql_args = [self.tvdbid]
 
         if season is not None:
-            sql_selection = sql_selection + " AND season = " + str(season)
+            sql_selection = sql_selection + " AND season = ?"
+            sql_args.append(season)
         if has_location:
-            sql_selection = sql_selection + " AND location != '' "
+            sql_selection = sql_selection + " AND location != ''"
 
         # need ORDER episode ASC to rename multi-episodes in order S01E01-02
         sql_selection = sql_selection + " ORDER BY season ASC, episode ASC"
 
-        results = myDB.select(sql_selection)
+        results = myDB.select(sql_selection, sql_args)
 
         ep_list = []
-        for cur_result in results:
-            cur_ep = self.getEpisode(int(cur_result["season"]), int(cur_result["episode"]))
-            if cur_ep:
-                cur_ep.relatedEps = []
-                if cur_ep.location:
-                    # if there is a location, check if it's a multi-episode (share_location > 0) and put them in relatedEps
-                    if cur_result["share_location"] > 0:
-                        related_eps_result = myDB.select("SELECT * FROM tv_episodes WHERE showid = ? AND season = ? AND location = ? AND episode != ? ORDER BY episode ASC", [self.tvdbid, cur_ep.season, cur_ep.location, cur_ep.episode])
-                        for cur_related_ep in related_eps_result:
-                            related_ep = self.getEpisode(int(cur_related_ep["season"]), int(cur_related_ep["episode"]))
-                            if related_ep not in cur_ep.relatedEps:
-                                cur_ep.relatedEps.append(related_ep)
-                ep_list.append(cur_ep)
+        eps_by_location = {}
+        for cur_ep in self.loadEpisodesFromDBResults(results):
+            cur_ep.relatedEps = []
+            # episodes of the same season sharing a location are a multi-episode
+            if cur_ep.location:
+                eps_by_location.setdefault((cur_ep.season, cur_ep.location), []).append(cur_ep)
+            ep_list.append(cur_ep)
+
+        # put the other parts of each multi-episode in relatedEps, they're already in episode order
+        for cur_eps in eps_by_location.values():
+            if len(cur_eps) < 2:
+                continue
+            for cur_ep in cur_eps:
+                cur_ep.relatedEps = [x for x in cur_eps if x is not cur_ep]
 
         return ep_list
 
 
-    def getEpisode(self, season, episode, file=None, noCreate=False):
+    def getEpisode(self, season, episode, file=None, noCreate=False, dbResult=None):
 
         #return TVEpisode(self, season, episode)
 
-        if not season in self.episodes:
-            self.episodes[season] = {}
-
-        ep = None
+        ep = episode_cache.getEpisode(self, season, episode)
 
-        if not episode in self.episodes[season] or self.episodes[season][episode] == None:
+        if ep is None:
             if noCreate:
                 return None
 
             logger.log(str(self.tvdbid) + ": An object for episode " + str(season) + "x" + str(episode) + " didn't exist in the cache, trying to create it", logger.DEBUG)
 
             if file != None:
-                ep = TVEpisode(self, season, episode, file)
+                ep = TVEpisode(self, season, episode, file, dbResult=dbResult)
             else:
-                ep = TVEpisode(self, season, episode)
+                ep = TVEpisode(self, season, episode, dbResult=dbResult)
+
+            episode_cache.addEpisode(self, season, episode, ep)
+
+        return ep
+
+    def loadEpisodesFromDBResults(self, sqlResults, refresh=False):
+        """
+        Returns the episode objects for a set of this show's tv_episodes rows (a season, the
+        whole show, ...) in the same order as the rows. Episodes that aren't cached yet are
+        built straight from their row instead of being queried one by one.
+
+        sqlResults: rows of SELECT * FROM tv_episodes
+        refresh: also reload the episodes which were already cached from their row
+        """
 
-            if ep != None:
-                self.episodes[season][episode] = ep
+        ep_list = []
+
+        for cur_result in sqlResults:
+            season = int(cur_result["season"])
+            episode = int(cur_result["episode"])
+
+            cur_ep = self.getEpisode(season, episode, noCreate=True)
+            if cur_ep is None:
+                cur_ep = self.getEpisode(season, episode, dbResult=cur_result)
+            elif refresh:
+                cur_ep.loadFromDB(season, episode, cur_result)
+
+            ep_list.append(cur_ep)
 
-        return self.episodes[season][episode]
+        return ep_list
 
     def writeShowNFO(self):
 
@@ -189,8 +218,9 @@ class TVShow(object):
             logger.log(str(self.tvdbid) + u": Show dir doesn't exist, skipping NFO generation")
             return False
 
-        for cur_provider in sickbeard.metadata_provider_dict.values():
-            result = cur_provider.create_show_metadata(self) or result
+        with metadata_helpers.sharedShowData(self):
+            for cur_provider in sickbeard.metadata_provider_dict.values():
+                result = cur_provider.create_show_metadata(self) or result
 
         return result
 
@@ -200,12 +230,14 @@ class TVShow(object):
             logger.log(str(self.tvdbid) + u": Show dir doesn't exist, skipping NFO generation")
             return
 
-        self.getImages()
+        # fetch the TVDB data and images once for all the metadata providers
+        with metadata_helpers.sharedShowData(self):
+            self.getImages()
 
-        self.writeShowNFO()
-        
-        if not show_only:
-            self.writeEpisodeNFOs()
+            self.writeShowNFO()
+
+            if not show_only:
+                self.writeEpisodeNFOs()
 
     def writeEpisodeNFOs (self):
 
@@ -218,10 +250,15 @@ class TVShow(object):
         myDB = db.DBConnection()
         sqlResults = myDB.select("SELECT * FROM tv_episodes WHERE showid = ? AND location != ''", [self.tvdbid])
 
-        for epResult in sqlResults:
-            logger.log(str(self.tvdbid) + ": Retrieving/creating episode " + str(epResult["season"]) + "x" + str(epResult["episode"]), logger.DEBUG)
-            curEp = self.getEpisode(epResult["season"], epResult["episode"])
-            curEp.createMetaFiles()
+        with metadata_helpers.sharedShowData(self):
+            writer_pool = metadata_helpers.MetadataWriterPool()
+
+            try:
+                for curEp in self.loadEpisodesFromDBResults(sqlResults):
+                    logger.log(str(self.tvdbid) + ": Writing metadata for episode " + str(curEp.season) + "x" + str(curEp.episode), logger.DEBUG)
+                    writer_pool.add_job(curEp.createMetaFiles)
+            finally:
+                writer_pool.finish()
 
 
     # find all media files in the show folder and create episodes for as many as possible
@@ -293,12 +330,13 @@ class TVShow(object):
         cachedShow = t[self.tvdbid]
         cachedSeasons = {}
 
-        for curResult in sqlResults:
+        # every episode is (re)loaded from the rows we already have
+        for curEp in self.loadEpisodesFromDBResults(sqlResults, refresh=True):
 
             deleteEp = False
-                    
-            curSeason = int(curResult["season"])
-            curEpisode = int(curResult["episode"])
+
+            curSeason = curEp.season
+            curEpisode = curEp.episode
             if curSeason not in cachedSeasons:
                 try:
                     cachedSeasons[curSeason] = cachedShow[curSeason]
@@ -312,13 +350,10 @@ class TVShow(object):
             logger.log(u"Loading episode "+str(curSeason)+"x"+str(curEpisode)+" from the DB", logger.DEBUG)
 
             try:
-                curEp = self.getEpisode(curSeason, curEpisode)
-                
                 # if we found out that the ep is no longer on TVDB then delete it from our database too
                 if deleteEp:
                     curEp.deleteEpisode()
-                
-                curEp.loadFromDB(curSeason, curEpisode)
+
                 curEp.loadFromTVDB(tvapi=t, cachedSeason=cachedSeasons[curSeason])
                 scannedEps[curSeason][curEpisode] = True
             except exceptions.EpisodeDeletedException:
@@ -328,7 +363,15 @@ class TVShow(object):
         return scannedEps
 
 
-    def loadEpisodesFromTVDB(self, cache=True):
+    def loadEpisodesFromTVDB(self, cache=True, changedEpisodes=None):
+        """
+        Loads the show's episodes from TVDB and saves any changes to the DB.
+
+        changedEpisodes: set of TVDB episode ids, if given episodes already in the DB which aren't
+                         in it are left alone
+
+        Returns a dict of season -> dict of episode -> True for every episode TVDB has
+        """
 
         # There's gotta be a better way of doing this but we don't wanna
         # change the cache value elsewhere
@@ -349,6 +392,10 @@ class TVShow(object):
 
         logger.log(str(self.tvdbid) + ": Loading all episodes from theTVDB...")
 
+        # cache every episode we already know about from a single query, only the new ones need more work
+        myDB = db.DBConnection()
+        self.loadEpisodesFromDBResults(myDB.select("SELECT * FROM tv_episodes WHERE showid = ?", [self.tvdbid]))
+
         scannedEps = {}
 
         for season in showObj:
@@ -363,16 +410,24 @@ class TVShow(object):
                 except exceptions.EpisodeNotFoundException:
                     logger.log(str(self.tvdbid) + ": TVDB object for " + str(season) + "x" + str(episode) + " is incomplete, skipping this episode")
                     continue
-                else:
+
+                # nothing changed on TVDB for this one since the last update
+                if changedEpisodes is not None:
                     try:
-                        ep.loadFromTVDB(tvapi=t)
-                    except exceptions.EpisodeDeletedException:
-                        logger.log(u"The episode was deleted, skipping the rest of the load")
+                        tvdb_ep_id = int(showObj[season][episode]['id'])
+                    except (KeyError, TypeError, ValueError):
+                        tvdb_ep_id = None
+                    if tvdb_ep_id and tvdb_ep_id == ep.tvdbid and tvdb_ep_id not in changedEpisodes:
+                        scannedEps[season][episode] = True
                         continue
 
                 with ep.lock:
                     logger.log(str(self.tvdbid) + ": Loading info from theTVDB for episode " + str(season) + "x" + str(episode), logger.DEBUG)
-                    ep.loadFromTVDB(season, episode, tvapi=t)
+                    try:
+                        ep.loadFromTVDB(season, episode, tvapi=t)
+                    except exceptions.EpisodeDeletedException:
+                        logger.log(u"The episode was deleted, skipping the rest of the load")
+                        continue
                     if ep.dirty:
                         ep.saveToDB()
 
@@ -400,11 +455,12 @@ class TVShow(object):
 
         poster_result = fanart_result = season_thumb_result = False
 
-        for cur_provider in sickbeard.metadata_provider_dict.values():
-            logger.log("Running season folders for "+cur_provider.name, logger.DEBUG)
-            poster_result = cur_provider.create_poster(self) or poster_result
-            fanart_result = cur_provider.create_fanart(self) or fanart_result
-            season_thumb_result = cur_provider.create_season_thumbs(self) or season_thumb_result
+        with metadata_helpers.sharedShowData(self):
+            for cur_provider in sickbeard.metadata_provider_dict.values():
+                logger.log("Running season folders for "+cur_provider.name, logger.DEBUG)
+                poster_result = cur_provider.create_poster(self) or poster_result
+                fanart_result = cur_provider.create_fanart(self) or fanart_result
+                season_thumb_result = cur_provider.create_season_thumbs(self) or season_thumb_result
 
         return poster_result or fanart_result or season_thumb_result
 
@@ -566,13 +622,15 @@ class TVShow(object):
         return rootEp
 
 
-    def loadFromDB(self, skipNFO=False):
+    def loadFromDB(self, skipNFO=False, dbResult=None):
 
-        logger.log(str(self.tvdbid) + ": Loading show info from database")
+        if dbResult is None:
+            logger.log(str(self.tvdbid) + ": Loading show info from database")
 
-        myDB = db.DBConnection()
-
-        sqlResults = myDB.select("SELECT * FROM tv_shows WHERE tvdb_id = ?", [self.tvdbid])
+            myDB = db.DBConnection()
+            sqlResults = myDB.select("SELECT * FROM tv_shows WHERE tvdb_id = ?", [self.tvdbid])
+        else:
+            sqlResults = [dbResult]
 
         if len(sqlResults) > 1:
             raise exceptions.MultipleDBShowsException()
@@ -755,6 +813,7 @@ class TVShow(object):
 
         # remove self from show list
         sickbeard.showList = [x for x in sickbeard.showList if x.tvdbid != self.tvdbid]
+        episode_cache.removeShow(self)
         
         # clear the cache
         image_cache_dir = ek.ek(os.path.join, sickbeard.CACHE_DIR, 'images')
@@ -783,17 +842,11 @@ class TVShow(object):
         myDB = db.DBConnection()
         sqlResults = myDB.select("SELECT * FROM tv_episodes WHERE showid = ? AND location != ''", [self.tvdbid])
 
-        for ep in sqlResults:
+        for ep, curEp in zip(sqlResults, self.loadEpisodesFromDBResults(sqlResults)):
             curLoc = os.path.normpath(ep["location"])
             season = int(ep["season"])
             episode = int(ep["episode"])
 
-            try:
-                curEp = self.getEpisode(season, episode)
-            except exceptions.EpisodeDeletedException:
-                logger.log(u"The episode was deleted while we were refreshing it, moving on to the next one", logger.DEBUG)
-                continue
-
             # if the path doesn't exist or if it's not in our show dir
             if not ek.ek(os.path.isfile, curLoc) or not os.path.normpath(curLoc).startswith(os.path.normpath(self.location)):
 
@@ -951,9 +1004,309 @@ def dirty_setter(attr_name):
             self.dirty = True
     return wrapper
 
+def _naming_dot(name):
+    return helpers.sanitizeSceneName(name)
+
+def _naming_us(name):
+    return re.sub('[ -]','_', name)
+
+def _naming_release_name(name):
+    if name and name.lower().endswith('.nzb'):
+        name = name.rpartition('.')[0]
+    return name
+
+def _naming_release_group(name):
+    if not name:
+        return ''
+
+    np = NameParser(name)
+
+    try:
+        parse_result = np.parse(name)
+    except InvalidNameException, e:
+        logger.log(u"Unable to get parse release_group: "+ex(e), logger.DEBUG)
+        return ''
+
+    if not parse_result.release_group:
+        return ''
+    return parse_result.release_group
+
+def _naming_quality(ep_obj):
+    epStatus, epQual = Quality.splitCompositeStatus(ep_obj.status) #@UnusedVariable
+    return Quality.qualityStrings[epQual]
+
+# how to work out the value of every naming pattern token, each one gets the NamingValues of the episode
+naming_fields = {
+                 '%SN': lambda v: v.ep.show.name,
+                 '%S.N': lambda v: _naming_dot(v['%SN']),
+                 '%S_N': lambda v: _naming_us(v['%SN']),
+                 '%EN': lambda v: v.ep._ep_name(),
+                 '%E.N': lambda v: _naming_dot(v['%EN']),
+                 '%E_N': lambda v: _naming_us(v['%EN']),
+                 '%QN': lambda v: _naming_quality(v.ep),
+                 '%Q.N': lambda v: _naming_dot(v['%QN']),
+                 '%Q_N': lambda v: _naming_us(v['%QN']),
+                 '%S': lambda v: str(v.ep.season),
+                 '%0S': lambda v: '%02d' % v.ep.season,
+                 '%E': lambda v: str(v.ep.episode),
+                 '%0E': lambda v: '%02d' % v.ep.episode,
+                 '%RN': lambda v: _naming_release_name(v.ep.release_name),
+                 '%RG': lambda v: _naming_release_group(v.ep.release_name),
+                 '%AD': lambda v: str(v.ep.airdate).replace('-', ' '),
+                 '%A.D': lambda v: str(v.ep.airdate).replace('-', '.'),
+                 '%A_D': lambda v: _naming_us(str(v.ep.airdate)),
+                 '%A-D': lambda v: str(v.ep.airdate),
+                 '%Y': lambda v: str(v.ep.airdate.year),
+                 '%M': lambda v: str(v.ep.airdate.month),
+                 '%D': lambda v: str(v.ep.airdate.day),
+                 '%0M': lambda v: '%02d' % v.ep.airdate.month,
+                 '%0D': lambda v: '%02d' % v.ep.airdate.day,
+                 }
+
+# matches any token in its upper or lower case form, longest tokens first so %S.N wins over %S
+_naming_token_regex = re.compile('|'.join([re.escape(x) + '|' + re.escape(x.lower()) for x in sorted(naming_fields.keys(), key=len, reverse=True)]))
+
+class NamingValues(object):
+    """
+    The values of the naming tokens for one episode. Each one is only worked out the first time it's used.
+    """
+
+    def __init__(self, ep_obj):
+        self.ep = ep_obj
+        self._values = {}
+
+    def __getitem__(self, token):
+        if token not in self._values:
+            self._values[token] = naming_fields[token](self)
+        return self._values[token]
+
+def _compile_naming_string(pattern):
+    """
+    Splits a piece of a naming pattern into a list of (literal text, token, lower case) parts. Literal parts have
+    no token, token parts have no literal text.
+    """
+
+    program = []
+    last_end = 0
+
+    for cur_match in _naming_token_regex.finditer(pattern):
+        if cur_match.start() > last_end:
+            program.append((pattern[last_end:cur_match.start()], None, False))
+
+        token = cur_match.group(0)
+        if token in naming_fields:
+            program.append((None, token, False))
+        else:
+            program.append((None, token.upper(), True))
+
+        last_end = cur_match.end()
+
+    if last_end < len(pattern):
+        program.append((pattern[last_end:], None, False))
+
+    return program
+
+def _fill_naming_string(program, values):
+    """
+    Fills in a list of parts made by _compile_naming_string using the given NamingValues
+    """
+
+    result = []
+
+    for literal, token, lower in program:
+        if token is None:
+            result.append(literal)
+        elif lower:
+            result.append(helpers.sanitizeFileName(values[token].lower()))
+        else:
+            result.append(helpers.sanitizeFileName(values[token]))
+
+    return ''.join(result)
+
+class NamingPattern(object):
+    """
+    A naming pattern compiled for one multi-episode style. The pattern is parsed once into a list of
+    text parts and episode number parts, filling it in for an episode is then a single pass over them.
+
+    pattern: the naming pattern
+    multi: the multi-episode style (NAMING_*)
+    generic_name: None if the episodes have a release name, otherwise whether the show is air by date. Patterns
+                  for episodes with no release name get a generic one in place of %RN and %RG.
+    """
+
+    season_ep_regex = '''
+                        (?P<pre_sep>[ _.-]*)
+                        ((?:s(?:eason|eries)?\s*)?%0?S(?![._]?N))
+                        (.*?)
+                        (%0?E(?![._]?N))
+                        (?P<post_sep>[ _.-]*)
+                      '''
+    ep_only_regex = '(E?%0?E(?![._]?N))'
+
+    def __init__(self, pattern, multi, generic_name=None):
+
+        result_name = pattern
+
+        # if there's no release group then replace it with a reasonable facsimile
+        if generic_name is not None:
+            if generic_name:
+                result_name = result_name.replace('%RN', '%S.N.%A.D.%E.N-SiCKBEARD')
+                result_name = result_name.replace('%rn', '%s.n.%A.D.%e.n-sickbeard')
+            else:
+                result_name = result_name.replace('%RN', '%S.N.S%0SE%0E.%E.N-SiCKBEARD')
+                result_name = result_name.replace('%rn', '%s.n.s%0se%0e.%e.n-sickbeard')
+
+            result_name = result_name.replace('%RG', 'SiCKBEARD')
+            result_name = result_name.replace('%rg', 'sickbeard')
+
+        self.pattern = result_name
+
+        # list of ('text', parts) and ('eps', (ep number parts, separator parts, only append the last ep))
+        self.parts = []
+
+        raw_text = ''
+
+        # figure out the double-ep numbering style for each folder/file name group, if applicable
+        for cur_name_group in re.split(r'([\\/])', result_name):
+
+            season_format = sep = ep_sep = ep_format = None
+
+            # try the normal way
+            season_ep_match = re.search(self.season_ep_regex, cur_name_group, re.I|re.X)
+            ep_only_match = re.search(self.ep_only_regex, cur_name_group, re.I|re.X)
+
+            # if we have a season and episode then collect the necessary data
+            if season_ep_match:
+                season_format = season_ep_match.group(2)
+                ep_sep = season_ep_match.group(3)
+                ep_format = season_ep_match.group(4)
+                sep = season_ep_match.group('pre_sep')
+                if not sep:
+                    sep = season_ep_match.group('post_sep')
+                if not sep:
+                    sep = ' '
+
+                # force 2-3-4 format if they chose to extend
+                if multi in (NAMING_EXTEND, NAMING_LIMITED_EXTEND, NAMING_LIMITED_EXTEND_E_PREFIXED):
+                    ep_sep = '-'
+
+                regex_used = self.season_ep_regex
+
+            # if there's no season then there's not much choice so we'll just force them to use 03-04-05 style
+            elif ep_only_match:
+                season_format = ''
+                ep_sep = '-'
+                ep_format = ep_only_match.group(1)
+                sep = ''
+                regex_used = self.ep_only_regex
+
+            # we need at least this much info to number the episodes, otherwise it's just text
+            if not ep_sep or not ep_format:
+                raw_text += cur_name_group
+                continue
+
+            # what goes between the episode numbers, eg. " - S01E" for "S01E03 - S01E04"
+            ep_separator = ''
+            if multi == NAMING_DUPLICATE:
+                ep_separator += sep + season_format
+            elif multi == NAMING_SEPARATED_REPEAT:
+                ep_separator += sep
+            ep_separator += ep_sep
+            if multi == NAMING_LIMITED_EXTEND_E_PREFIXED:
+                ep_separator += 'E'
+
+            # for limited extend we only append the last ep
+            ep_numbering = (_compile_naming_string(ep_format.upper()),
+                            _compile_naming_string(ep_separator),
+                            multi in (NAMING_LIMITED_EXTEND, NAMING_LIMITED_EXTEND_E_PREFIXED))
+
+            last_end = 0
+            for cur_match in re.finditer(regex_used, cur_name_group, re.I|re.X):
+                raw_text += cur_name_group[last_end:cur_match.start()]
+                if season_ep_match:
+                    raw_text += cur_match.group('pre_sep') + cur_match.group(2) + cur_match.group(3)
+
+                self.parts.append(('text', _compile_naming_string(raw_text)))
+                self.parts.append(('eps', ep_numbering))
+
+                raw_text = ''
+                if season_ep_match:
+                    raw_text = cur_match.group('post_sep')
+
+                last_end = cur_match.end()
+
+            raw_text += cur_name_group[last_end:]
+
+        self.parts.append(('text', _compile_naming_string(raw_text)))
+
+    def fill(self, ep_obj, values=None, related_eps=None):
+        """
+        Returns the pattern filled in for ep_obj and related_eps (its relatedEps if not given) as unicode
+        """
+
+        if values is None:
+            values = NamingValues(ep_obj)
+
+        if related_eps is None:
+            related_eps = ep_obj.relatedEps
+
+        result = []
+
+        for kind, data in self.parts:
+            if kind == 'text':
+                result.append(_fill_naming_string(data, values))
+                continue
+
+            ep_format, ep_separator, last_only = data
+
+            # start with the ep string, eg. E03
+            result.append(_fill_naming_string(ep_format, values))
+
+            if last_only:
+                other_eps = related_eps[-1:]
+            else:
+                other_eps = related_eps
+
+            # add "-E04" etc.
+            for other_ep in other_eps:
+                result.append(_fill_naming_string(ep_separator, values))
+                result.append(_fill_naming_string(ep_format, NamingValues(other_ep)))
+
+        return u''.join(result)
+
+# compiled naming patterns by (pattern, multi, generic_name)
+_naming_patterns = {}
+_naming_patterns_lock = threading.Lock()
+
+# the naming preview compiles every pattern typed into it, don't keep all of them forever
+MAX_NAMING_PATTERNS = 100
+
+def getNamingPattern(pattern, multi, generic_name=None):
+    """
+    Returns the NamingPattern for the given settings, only compiling it the first time it's needed
+    """
+
+    key = (pattern, multi, generic_name)
+
+    with _naming_patterns_lock:
+        if key not in _naming_patterns:
+            if len(_naming_patterns) >= MAX_NAMING_PATTERNS:
+                _naming_patterns.clear()
+            _naming_patterns[key] = NamingPattern(pattern, multi, generic_name)
+
+        return _naming_patterns[key]
+
+# guards giving an episode its lock
+_episode_lock_lock = threading.Lock()
+
 class TVEpisode(object):
 
-    def __init__(self, show, season, episode, file=""):
+    # there can be a lot of these so they don't get a __dict__
+    __slots__ = ('_name', '_season', '_episode', '_description', '_airdate', '_hasnfo', '_hastbn', '_status',
+                 '_tvdbid', '_file_size', '_release_name', '_location', '_lock', 'dirty', 'show', 'relatedEps',
+                 'pins', '__weakref__')
+
+    def __init__(self, show, season, episode, file="", dbResult=None):
 
         self._name = ""
         self._season = season
@@ -973,9 +1326,16 @@ class TVEpisode(object):
         self.show = show
         self._location = file
 
-        self.lock = threading.Lock()
+        self._lock = None
 
-        self.specifyEpisode(self.season, self.episode)
+        # how many things need it kept in the episode cache, see episode_cache.pinEpisode
+        self.pins = 0
+
+        # an episode built from an already fetched row doesn't need to look anywhere else
+        if dbResult is None:
+            self.specifyEpisode(self.season, self.episode)
+        else:
+            self.loadFromDB(self.season, self.episode, dbResult)
 
         self.relatedEps = []
 
@@ -984,7 +1344,6 @@ class TVEpisode(object):
     name = property(lambda self: self._name, dirty_setter("_name"))
     season = property(lambda self: self._season, dirty_setter("_season"))
     episode = property(lambda self: self._episode, dirty_setter("_episode"))
-    description = property(lambda self: self._description, dirty_setter("_description"))
     airdate = property(lambda self: self._airdate, dirty_setter("_airdate"))
     hasnfo = property(lambda self: self._hasnfo, dirty_setter("_hasnfo"))
     hastbn = property(lambda self: self._hastbn, dirty_setter("_hastbn"))
@@ -1007,6 +1366,40 @@ class TVEpisode(object):
 
     location = property(lambda self: self._location, _set_location)
 
+    def _getDescription(self):
+        """
+        Descriptions are only loaded from the DB when they're used, most episodes never need one
+        """
+
+        if self._description is None:
+            myDB = db.DBConnection()
+            sqlResults = myDB.select("SELECT description FROM tv_episodes WHERE showid = ? AND season = ? AND episode = ?", [self.show.tvdbid, self.season, self.episode])
+
+            if sqlResults and sqlResults[0]["description"] != None:
+                self._description = sqlResults[0]["description"]
+            else:
+                self._description = ""
+
+        return self._description
+
+    def _setDescription(self, new_description):
+        # compare against the one in the DB, not the unloaded None
+        self._getDescription()
+        dirty_setter("_description")(self, new_description)
+
+    description = property(_getDescription, _setDescription)
+
+    def _getLock(self):
+        # most episodes are never locked so they only get a lock when they need one
+        if self._lock is None:
+            with _episode_lock_lock:
+                if self._lock is None:
+                    self._lock = threading.Lock()
+
+        return self._lock
+
+    lock = property(_getLock)
+
     def checkForMetaFiles(self):
 
         oldhasnfo = self.hasnfo
@@ -1064,12 +1457,20 @@ class TVEpisode(object):
         if self.dirty:
             self.saveToDB()
 
-    def loadFromDB(self, season, episode):
+    def loadFromDB(self, season, episode, dbResult=None):
+        """
+        Loads the episode details from its tv_episodes row. If the row was already fetched
+        (eg. along with the rest of the show) it can be given as dbResult to skip the query.
+        """
 
-        logger.log(str(self.show.tvdbid) + ": Loading episode details from DB for episode " + str(season) + "x" + str(episode), logger.DEBUG)
+        if dbResult is None:
+            logger.log(str(self.show.tvdbid) + ": Loading episode details from DB for episode " + str(season) + "x" + str(episode), logger.DEBUG)
 
-        myDB = db.DBConnection()
-        sqlResults = myDB.select("SELECT * FROM tv_episodes WHERE showid = ? AND season = ? AND episode = ?", [self.show.tvdbid, season, episode])
+            myDB = db.DBConnection()
+            # everything but the description, that's loaded when it's needed
+            sqlResults = myDB.select("SELECT name, airdate, status, location, file_size, tvdbid, release_name FROM tv_episodes WHERE showid = ? AND season = ? AND episode = ?", [self.show.tvdbid, season, episode])
+        else:
+            sqlResults = [dbResult]
 
         if len(sqlResults) > 1:
             raise exceptions.MultipleDBEpisodesException("Your DB has two records for the same show somehow.")
@@ -1082,9 +1483,11 @@ class TVEpisode(object):
                 self.name = sqlResults[0]["name"]
             self.season = season
             self.episode = episode
-            self.description = sqlResults[0]["description"]
-            if self.description == None:
-                self.description = ""
+            # a whole row already has it, otherwise it's loaded when it's needed
+            if "description" in sqlResults[0].keys():
+                self._description = sqlResults[0]["description"] or ""
+            else:
+                self._description = None
             self.airdate = datetime.date.fromordinal(int(sqlResults[0]["airdate"]))
             #logger.log(u"1 Status changes from " + str(self.status) + " to " + str(sqlResults[0]["status"]), logger.DEBUG)
             self.status = int(sqlResults[0]["status"])
@@ -1346,7 +1749,7 @@ class TVEpisode(object):
         # remove myself from the show dictionary
         if self.show.getEpisode(self.season, self.episode, noCreate=True) == self:
             logger.log(u"Removing myself from my show's list", logger.DEBUG)
-            del self.show.episodes[self.season][self.episode]
+            episode_cache.removeEpisode(self.show, self.season, self.episode)
 
         # delete myself from the DB
         logger.log(u"Deleting myself from the database", logger.DEBUG)
@@ -1372,23 +1775,45 @@ class TVEpisode(object):
 
         logger.log(u"STATUS IS " + str(self.status), logger.DEBUG)
 
+        newValueDict, controlValueDict = self._dbValues()
+
+        # use a custom update/insert method to get the data into the DB
         myDB = db.DBConnection()
+        myDB.upsert("tv_episodes", newValueDict, controlValueDict)
+
+        self.dirty = False
+
+    def saveQueries(self):
+        """
+        Returns the queries which save this episode to the database, for running with other queries in one transaction.
+        The caller sets dirty back to False once they've been committed.
+        """
+
+        newValueDict, controlValueDict = self._dbValues()
+
+        return db.upsertQueries("tv_episodes", newValueDict, controlValueDict)
+
+    def _dbValues(self):
         newValueDict = {"tvdbid": self.tvdbid,
                         "name": self.name,
-                        "description": self.description,
+                        "description": self._description,
                         "airdate": self.airdate.toordinal(),
                         "hasnfo": self.hasnfo,
                         "hastbn": self.hastbn,
                         "status": self.status,
                         "location": self.location,
                         "file_size": self.file_size,
-                        "release_name": self.release_name}
+                        "release_name": self.release_name,
+                        "last_modified": int(time.time())}
         controlValueDict = {"showid": self.show.tvdbid,
                             "season": self.season,
                             "episode": self.episode}
 
-        # use a custom update/insert method to get the data into the DB
-        myDB.upsert("tv_episodes", newValueDict, controlValueDict)
+        # the description hasn't been loaded so it's still whatever is in the DB
+        if self._description is None:
+            del newValueDict["description"]
+
+        return newValueDict, controlValueDict
 
     def fullPath (self):
         if self.location == None or self.location == "":
@@ -1454,78 +1879,17 @@ class TVEpisode(object):
         
         Returns: A dict with patterns as the keys and their replacement values as the values.
         """
-        
-        ep_name = self._ep_name()
-        
-        def dot(name):
-            return helpers.sanitizeSceneName(name)
-        
-        def us(name):
-            return re.sub('[ -]','_', name)
-
-        def release_name(name):
-            if name and name.lower().endswith('.nzb'):
-                name = name.rpartition('.')[0]
-            return name
 
-        def release_group(name):
-            if not name:
-                return ''
+        values = NamingValues(self)
 
-            np = NameParser(name)
-
-            try:
-                parse_result = np.parse(name)
-            except InvalidNameException, e:
-                logger.log(u"Unable to get parse release_group: "+ex(e), logger.DEBUG)
-                return ''
-
-            if not parse_result.release_group:
-                return ''
-            return parse_result.release_group
-
-        epStatus, epQual = Quality.splitCompositeStatus(self.status) #@UnusedVariable
-        
-        return {
-                   '%SN': self.show.name,
-                   '%S.N': dot(self.show.name),
-                   '%S_N': us(self.show.name),
-                   '%EN': ep_name,
-                   '%E.N': dot(ep_name),
-                   '%E_N': us(ep_name),
-                   '%QN': Quality.qualityStrings[epQual],
-                   '%Q.N': dot(Quality.qualityStrings[epQual]),
-                   '%Q_N': us(Quality.qualityStrings[epQual]),
-                   '%S': str(self.season),
-                   '%0S': '%02d' % self.season,
-                   '%E': str(self.episode),
-                   '%0E': '%02d' % self.episode,
-                   '%RN': release_name(self.release_name),
-                   '%RG': release_group(self.release_name),
-                   '%AD': str(self.airdate).replace('-', ' '),
-                   '%A.D': str(self.airdate).replace('-', '.'),
-                   '%A_D': us(str(self.airdate)),
-                   '%A-D': str(self.airdate),
-                   '%Y': str(self.airdate.year),
-                   '%M': str(self.airdate.month),
-                   '%D': str(self.airdate.day),
-                   '%0M': '%02d' % self.airdate.month,
-                   '%0D': '%02d' % self.airdate.day,
-                   }
+        return dict([(x, values[x]) for x in naming_fields])
 
     def _format_string(self, pattern, replace_map):
         """
         Replaces all template strings with the correct value
         """
 
-        result_name = pattern
-
-        # do the replacements
-        for cur_replacement in sorted(replace_map.keys(), reverse=True):
-            result_name = result_name.replace(cur_replacement, helpers.sanitizeFileName(replace_map[cur_replacement]))
-            result_name = result_name.replace(cur_replacement.lower(), helpers.sanitizeFileName(replace_map[cur_replacement].lower()))
-
-        return result_name
+        return _fill_naming_string(_compile_naming_string(pattern), replace_map)
 
     def _format_pattern(self, pattern=None, multi=None):
         """
@@ -1537,116 +1901,27 @@ class TVEpisode(object):
         
         if multi == None:
             multi = sickbeard.NAMING_MULTI_EP
-        
-        replace_map = self._replace_map()
-
-        result_name = pattern
-        
-        # if there's no release group then replace it with a reasonable facsimile
-        if not replace_map['%RN']:
-            if self.show.air_by_date:
-                result_name = result_name.replace('%RN', '%S.N.%A.D.%E.N-SiCKBEARD')
-                result_name = result_name.replace('%rn', '%s.n.%A.D.%e.n-sickbeard')
-            else:
-                result_name = result_name.replace('%RN', '%S.N.S%0SE%0E.%E.N-SiCKBEARD')
-                result_name = result_name.replace('%rn', '%s.n.s%0se%0e.%e.n-sickbeard')
 
-            result_name = result_name.replace('%RG', 'SiCKBEARD')
-            result_name = result_name.replace('%rg', 'sickbeard')
-            logger.log(u"Episode has no release name, replacing it with a generic one: "+result_name, logger.DEBUG)
-        
-        # split off ep name part only
-        name_groups = re.split(r'[\\/]', result_name)
-        
-        # figure out the double-ep numbering style for each group, if applicable
-        for cur_name_group in name_groups:
-        
-            season_format = sep = ep_sep = ep_format = None
-        
-            season_ep_regex = '''
-                                (?P<pre_sep>[ _.-]*)
-                                ((?:s(?:eason|eries)?\s*)?%0?S(?![._]?N))
-                                (.*?)
-                                (%0?E(?![._]?N))
-                                (?P<post_sep>[ _.-]*)
-                              '''
-            ep_only_regex = '(E?%0?E(?![._]?N))'
-        
-            # try the normal way
-            season_ep_match = re.search(season_ep_regex, cur_name_group, re.I|re.X)
-            ep_only_match = re.search(ep_only_regex, cur_name_group, re.I|re.X)
-            
-            # if we have a season and episode then collect the necessary data
-            if season_ep_match:
-                season_format = season_ep_match.group(2)
-                ep_sep = season_ep_match.group(3)
-                ep_format = season_ep_match.group(4)
-                sep = season_ep_match.group('pre_sep')
-                if not sep:
-                    sep = season_ep_match.group('post_sep')
-                if not sep:
-                    sep = ' '
+        values = NamingValues(self)
 
-                # force 2-3-4 format if they chose to extend
-                if multi in (NAMING_EXTEND, NAMING_LIMITED_EXTEND, NAMING_LIMITED_EXTEND_E_PREFIXED):
-                    ep_sep = '-'
-                
-                regex_used = season_ep_regex
-
-            # if there's no season then there's not much choice so we'll just force them to use 03-04-05 style
-            elif ep_only_match:
-                season_format = ''
-                ep_sep = '-'
-                ep_format = ep_only_match.group(1)
-                sep = ''
-                regex_used = ep_only_regex
-
-            else:
-                continue
-
-            # we need at least this much info to continue
-            if not ep_sep or not ep_format:
-                continue
-            
-            # start with the ep string, eg. E03
-            ep_string = self._format_string(ep_format.upper(), replace_map)
-            for other_ep in self.relatedEps:
-                
-                # for limited extend we only append the last ep
-                if multi in (NAMING_LIMITED_EXTEND, NAMING_LIMITED_EXTEND_E_PREFIXED) and other_ep != self.relatedEps[-1]:
-                    continue
-                
-                elif multi == NAMING_DUPLICATE:
-                    # add " - S01"
-                    ep_string += sep + season_format
-                
-                elif multi == NAMING_SEPARATED_REPEAT:
-                    ep_string += sep
-
-                # add "E04"
-                ep_string += ep_sep
-
-                if multi == NAMING_LIMITED_EXTEND_E_PREFIXED:
-                    ep_string += 'E'
+        # if there's no release group then the pattern gets a generic one
+        if values['%RN']:
+            generic_name = None
+        else:
+            generic_name = bool(self.show.air_by_date)
 
-                ep_string += other_ep._format_string(ep_format.upper(), other_ep._replace_map())
+        naming_pattern = getNamingPattern(pattern, multi, generic_name)
 
-            if season_ep_match:
-                regex_replacement = r'\g<pre_sep>\g<2>\g<3>' + ep_string + r'\g<post_sep>'
-            elif ep_only_match:
-                regex_replacement = ep_string
+        if generic_name is not None:
+            logger.log(u"Episode has no release name, replacing it with a generic one: "+naming_pattern.pattern, logger.DEBUG)
 
-            # fill out the template for this piece and then insert this piece into the actual pattern
-            cur_name_group_result = re.sub('(?i)(?x)'+regex_used, regex_replacement, cur_name_group)
-            #cur_name_group_result = cur_name_group.replace(ep_format, ep_string)
-            #logger.log(u"found "+ep_format+" as the ep pattern using "+regex_used+" and replaced it with "+regex_replacement+" to result in "+cur_name_group_result+" from "+cur_name_group, logger.DEBUG)
-            result_name = result_name.replace(cur_name_group, cur_name_group_result)
+        # the related eps have to be in order for the multi-ep numbering
+        related_eps = sorted(self.relatedEps, key=lambda x: x.episode)
 
-        result_name = self._format_string(result_name, replace_map)
+        result_name = naming_pattern.fill(self, values, related_eps)
 
         logger.log(u"formatting pattern: "+pattern+" -> "+result_name, logger.DEBUG)
-        
-        
+
         return result_name
 
     def proper_path(self):
@@ -26,9 +26,12 @@ from sickbeard import db
 from sickbeard import logger
 from sickbeard.common import Quality
 
-from sickbeard import helpers, show_name_helpers
+from sickbeard import helpers, show_name_helpers, feedreader
 from sickbeard import name_cache
+from sickbeard import request_budget
+from sickbeard.release_merger import ReleaseMerger
 from sickbeard.exceptions import ex, AuthException
+from sickbeard.databases import cache_db
 
 try:
     import xml.etree.cElementTree as etree
@@ -50,6 +53,7 @@ class CacheDBConnection(db.DBConnection):
             sql = "CREATE TABLE " + providerName + " (name TEXT, season NUMERIC, episodes TEXT, tvrid NUMERIC, tvdbid NUMERIC, url TEXT, time NUMERIC, quality TEXT);"
             self.connection.execute(sql)
             self.connection.commit()
+            cache_db.addProviderIndex(self, providerName)
         except sqlite3.OperationalError, e:
             if str(e) != "table " + providerName + " already exists":
                 raise
@@ -88,7 +92,7 @@ class TVCache():
 
         return data
 
-    def _checkAuth(self, parsedXML):
+    def _checkAuth(self, feed):
         return True
 
     def _checkItemAuth(self, title, url):
@@ -99,6 +103,10 @@ class TVCache():
         if not self.shouldUpdate():
             return
 
+        if request_budget.isExhausted(self.providerID):
+            logger.log(u"The request budget for " + self.provider.name + " is used up, not updating its RSS cache for now", logger.DEBUG)
+            return
+
         if self._checkAuth(None):
 
             data = self._getRSSData()
@@ -113,22 +121,19 @@ class TVCache():
             logger.log(u"Clearing " + self.provider.name + " cache and updating with new information")
             self._clearCache()
 
-            parsedXML = helpers.parse_xml(data)
+            feed = feedreader.FeedReader(data)
 
-            if parsedXML is None:
+            if not feed.readHeader():
                 logger.log(u"Error trying to load " + self.provider.name + " RSS feed", logger.ERROR)
                 return []
 
-            if self._checkAuth(parsedXML):
-
-                if parsedXML.tag == 'rss':
-                    items = parsedXML.findall('.//item')
+            if self._checkAuth(feed):
 
-                else:
+                if feed.tag != 'rss':
                     logger.log(u"Resulting XML from " + self.provider.name + " isn't RSS, not parsing it", logger.ERROR)
                     return []
 
-                for item in items:
+                for item in feed:
                     self._parseItem(item)
 
             else:
@@ -144,8 +149,8 @@ class TVCache():
 
     def _parseItem(self, item):
 
-        title = helpers.get_xml_text(item.find('title'))
-        url = helpers.get_xml_text(item.find('link'))
+        title = item.title
+        url = item.url
 
         self._checkItemAuth(title, url)
 
@@ -341,9 +346,12 @@ class TVCache():
         #return filter(lambda x: x['tvdbid'] != 0, myDB.select(sql))
         return myDB.select(sql)
 
-    def findNeededEpisodes(self, episode=None, manualSearch=False):
+    def findNeededEpisodes(self, episode=None, manualSearch=False, merger=None):
         neededEps = {}
 
+        if not merger:
+            merger = ReleaseMerger()
+
         if episode:
             neededEps[episode] = []
 
@@ -357,8 +365,12 @@ class TVCache():
         # for each cache entry
         for curResult in sqlResults:
 
+            # skip releases we already got from another provider
+            if not merger.isNew(curResult["name"], self.provider):
+                continue
+
             # skip non-tv crap (but allow them for Newzbin cause we assume it's filtered well)
-            if self.providerID != 'newzbin' and not show_name_helpers.filterBadReleases(curResult["name"]):
+            if self.providerID != 'newzbin' and not merger.filterBadReleases(curResult["name"]):
                 continue
 
             # get the show object, or if it's not one of our shows then ignore it
@@ -377,7 +389,7 @@ class TVCache():
             curQuality = int(curResult["quality"])
 
             # if the show says we want that episode then add it to the list
-            if not showObj.wantEpisode(curSeason, curEp, curQuality, manualSearch):
+            if not merger.wantEpisode(showObj, curSeason, curEp, curQuality, manualSearch):
                 logger.log(u"Skipping " + curResult["name"] + " because we don't want an episode that's " + Quality.qualityStrings[curQuality], logger.DEBUG)
 
             else:
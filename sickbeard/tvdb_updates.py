@@ -0,0 +1,165 @@
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+try:
+    import xml.etree.cElementTree as etree
+except ImportError:
+    import elementtree.ElementTree as etree
+
+import sickbeard
+
+from sickbeard import db
+from sickbeard import helpers
+from sickbeard import logger
+from sickbeard.exceptions import ex
+
+# the update files TVDB publishes and how far back each one goes, smallest first
+UPDATE_PERIODS = (('day', 24 * 60 * 60),
+                  ('week', 7 * 24 * 60 * 60),
+                  ('month', 30 * 24 * 60 * 60))
+
+
+class TVDBUpdates(object):
+    """
+    What changed on TVDB since a point in time, read from one of its updates_<period>.xml files:
+
+    <Data time="1376920823">
+        <Series><id>80348</id><time>1376915160</time></Series>
+        <Episode><id>4587312</id><Series>80348</Series><time>1376915160</time></Episode>
+        ...
+    </Data>
+
+    time: the time the file was made, the next update should start from here
+    series: ids of the series whose own info changed
+    episodes: series id -> set of the ids of its episodes which changed
+    """
+
+    def __init__(self, data, since):
+
+        root = etree.fromstring(data)
+
+        self.time = int(root.get('time') or 0)
+        self.series = set()
+        self.episodes = {}
+
+        for cur_series in root.findall('Series'):
+            if int(cur_series.findtext('time') or 0) >= since:
+                self.series.add(int(cur_series.findtext('id')))
+
+        for cur_episode in root.findall('Episode'):
+            if int(cur_episode.findtext('time') or 0) >= since:
+                self.episodes.setdefault(int(cur_episode.findtext('Series')), set()).add(int(cur_episode.findtext('id')))
+
+        # no time on the file, use the newest change in it
+        if not self.time:
+            self.time = max([int(x.findtext('time') or 0) for x in root.findall('Series') + root.findall('Episode')] or [since])
+
+    def changedShows(self):
+        return self.series.union(self.episodes.keys())
+
+    def isChanged(self, tvdbid):
+        return tvdbid in self.series or tvdbid in self.episodes
+
+    def changedEpisodes(self, tvdbid):
+        """
+        Returns the set of ids of the show's episodes which changed
+        """
+
+        return self.episodes.get(tvdbid, set())
+
+
+def updatesURL(period):
+    return sickbeard.TVDB_BASE_URL + '/updates/updates_' + period + '.xml'
+
+def getUpdates(since, now=None):
+    """
+    Gets what changed on TVDB since the given unix time, using the smallest update file which goes back that far.
+
+    Returns a TVDBUpdates, or None if there's no file that goes back far enough or it couldn't be
+    loaded, in which case every show needs a full update.
+    """
+
+    if not since:
+        return None
+
+    if now is None:
+        now = time.time()
+
+    for period, length in UPDATE_PERIODS:
+
+        if now - since > length:
+            continue
+
+        url = updatesURL(period)
+        logger.log(u"Getting the TVDB updates from " + url, logger.DEBUG)
+
+        data = helpers.getURL(url)
+        if not data:
+            logger.log(u"Unable to get the TVDB updates from " + url, logger.WARNING)
+            return None
+
+        try:
+            updates = TVDBUpdates(data, since)
+        except (SyntaxError, ValueError), e:
+            logger.log(u"Unable to parse the TVDB updates from " + url + ": " + ex(e), logger.WARNING)
+            return None
+
+        # if TVDB's clock is ahead of ours the file might not go back far enough, try the next one
+        if updates.time and updates.time - length > since:
+            logger.log(u"The " + period + " TVDB updates don't go back far enough, trying a longer period", logger.DEBUG)
+            continue
+
+        logger.log(u"TVDB has " + str(len(updates.changedShows())) + " changed series since " + time.ctime(since), logger.DEBUG)
+        return updates
+
+    logger.log(u"The last TVDB update was too long ago to use the update files", logger.DEBUG)
+    return None
+
+def getLastUpdate():
+    """
+    Returns the time of the last TVDB update (info.last_tvdb) or 0 if there hasn't been one
+    """
+
+    myDB = db.DBConnection()
+    sqlResults = myDB.select("SELECT last_tvdb FROM info")
+
+    if not sqlResults or not sqlResults[0]["last_tvdb"]:
+        return 0
+
+    return int(sqlResults[0]["last_tvdb"])
+
+def setLastUpdate(when):
+
+    myDB = db.DBConnection()
+    sqlResults = myDB.select("SELECT * FROM info")
+
+    if len(sqlResults) == 0:
+        myDB.action("INSERT INTO info (last_backlog, last_tvdb) VALUES (?,?)", [1, int(when)])
+    else:
+        myDB.action("UPDATE info SET last_tvdb = ?", [int(when)])
+
+def rewindLastUpdate(when):
+    """
+    Moves the time of the last TVDB update back to when (if it's later than that) so the next update
+    gets the changes since then again, eg. because a show's update didn't happen
+    """
+
+    if getLastUpdate() > when:
+        logger.log(u"Moving the last TVDB update back to " + time.ctime(when) + " so the missed changes are picked up next time", logger.DEBUG)
+        setLastUpdate(when)
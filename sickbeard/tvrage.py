@@ -20,6 +20,7 @@
 
 import urllib, urllib2
 import datetime
+import time
 import traceback
 
 import sickbeard
@@ -337,8 +338,8 @@ class TVRage:
             raise exceptions.TVRageException("Show is already in database, not adding the TVRage info")
 
         # insert it
-        myDB.action("INSERT INTO tv_episodes (showid, tvdbid, name, season, episode, description, airdate, hasnfo, hastbn, status, location) VALUES (?,?,?,?,?,?,?,?,?,?,?)", \
-                    [self.show.tvdbid, -1, self.nextEpInfo['name'], self.nextEpInfo['season'], self.nextEpInfo['episode'], '', self.nextEpInfo['airdate'].toordinal(), 0, 0, UNAIRED, ''])
+        myDB.action("INSERT INTO tv_episodes (showid, tvdbid, name, season, episode, description, airdate, hasnfo, hastbn, status, location, last_modified) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", \
+                    [self.show.tvdbid, -1, self.nextEpInfo['name'], self.nextEpInfo['season'], self.nextEpInfo['episode'], '', self.nextEpInfo['airdate'].toordinal(), 0, 0, UNAIRED, '', int(time.time())])
 
         # once it's in the DB make an object and return it
         ep = None
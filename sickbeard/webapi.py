@@ -26,14 +26,18 @@ import datetime
 import threading
 import re
 import traceback
+import hashlib
 
 import cherrypy
+import cherrypy.lib.cptools
 import sickbeard
 import webserve
 from sickbeard import db, logger, exceptions, history, ui, helpers
 from sickbeard.exceptions import ex
 from sickbeard import encodingKludge as ek
 from sickbeard import search_queue
+from sickbeard import provider_health
+from sickbeard import instrumentation
 from sickbeard.common import SNATCHED, SNATCHED_PROPER, DOWNLOADED, SKIPPED, UNAIRED, IGNORED, ARCHIVED, WANTED, UNKNOWN
 from common import Quality, qualityPresetStrings, statusStrings
 from sickbeard import image_cache
@@ -64,6 +68,17 @@ result_type_map = {RESULT_SUCCESS: "success",
                   }
 # basically everything except RESULT_SUCCESS / success is bad
 
+# cmds whose output only depends on the database, the date and the request. Their ETags are made from
+# db.dataVersion() so a client polling them for data which hasn't changed gets a 304 without running them.
+# Everything else gets an ETag from a hash of its output (tools.etags in webserveInit)
+DATA_VERSION_CMDS = ("future", "history", "episodes")
+
+# the most episodes the episodes cmd will return in one page
+MAX_EPISODES_PAGE = 5000
+
+# how much of the json to build up before sending it when streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
 class Api:
     """ api class that returns json results """
@@ -76,6 +91,11 @@ class Api:
         self.apiKey = sickbeard.API_KEY
         access, accessMsg, args, kwargs = self._grand_access(self.apiKey, args, kwargs)
 
+        # compact=1 leaves the indenting and spaces out of the json
+        self.compact = str(kwargs.pop("compact", 0)) == "1"
+        # stream=1 sends the json as it's made instead of building it all first, for big results
+        self.stream = str(kwargs.pop("stream", 0)) == "1"
+
         # set the output callback
         # default json
         outputCallbackDict = {'default': self._out_as_json,
@@ -89,13 +109,15 @@ class Api:
             logger.log(accessMsg, logger.WARNING)
             return outputCallbackDict['default'](_responds(RESULT_DENIED, msg=accessMsg))
 
+        if 'debug' not in kwargs:
+            self._check_data_version(args, kwargs)
+
         # set the original call_dispatcher as the local _call_dispatcher
         _call_dispatcher = call_dispatcher
-        # if profile was set wrap "_call_dispatcher" in the profile function
-        if 'profile' in kwargs:
-            from lib.profilehooks import profile
-            _call_dispatcher = profile(_call_dispatcher, immediate=True)
-            del kwargs["profile"]
+        # profile=1 was asked for, see instrumentation.startRequest
+        profileName = getattr(cherrypy.request, "instrument_profile", None)
+        if profileName:
+            _call_dispatcher = instrumentation.profile(call_dispatcher, profileName)
 
         # if debug was set call the "_call_dispatcher"
         if 'debug' in kwargs:
@@ -125,16 +147,7 @@ class Api:
         """ expose the api-builder template """
         t = webserve.PageTemplate(file="apiBuilder.tmpl")
 
-        def titler(x):
-            if not x:
-                return x
-            if x.lower().startswith('a '):
-                x = x[2:]
-            elif x.lower().startswith('the '):
-                x = x[4:]
-            return x
-
-        t.sortedShowList = sorted(sickbeard.showList, lambda x, y: cmp(titler(x.name), titler(y.name)))
+        t.sortedShowList = helpers.sortedShowList()
 
         myDB = db.DBConnection(row_type="dict")
         seasonSQLResults = {}
@@ -157,14 +170,47 @@ class Api:
 
         return webserve._munge(t)
 
+    def _check_data_version(self, args, kwargs):
+        """ set the ETag of a request for DATA_VERSION_CMDS from the database version
+            and answer with a 304 (raises) if the client already has it
+        """
+        request = cherrypy.request
+        if request.method not in ('GET', 'HEAD'):
+            return
+
+        cmds = kwargs.get("cmd") or (args and args[0])
+        if not cmds:
+            return
+
+        for cmd in cmds.split("|"):
+            if cmd.split("_")[0] not in DATA_VERSION_CMDS:
+                return
+
+        tag = "|".join([db.dataVersion(), str(datetime.date.today().toordinal()), str(sickbeard.COMING_EPS_DISPLAY_PAUSED),
+                        request.path_info, request.query_string])
+        cherrypy.response.headers['ETag'] = '"' + hashlib.md5(tag).hexdigest() + '"'
+        cherrypy.lib.cptools.validate_etags()
+
     def _out_as_json(self, dict):
         """ set cherrypy response to json """
         response = cherrypy.response
         request = cherrypy.request
         response.headers['Content-Type'] = 'application/json;charset=UTF-8'
+        if getattr(self, "compact", False):
+            jsonArgs = {"separators": (',', ':'), "sort_keys": True}
+        else:
+            jsonArgs = {"indent": self.intent, "sort_keys": True}
+        callback = request.params.get('callback') or request.params.get('jsonp')
+
+        if getattr(self, "stream", False):
+            response.stream = True
+            # making an ETag from the body would need all of it first
+            if not hasattr(response, "ETag"):
+                response.ETag = None
+            return self._stream_json(json.JSONEncoder(**jsonArgs).iterencode(dict), callback)
+
         try:
-            out = json.dumps(dict, indent=self.intent, sort_keys=True)
-            callback = request.params.get('callback') or request.params.get('jsonp')
+            out = json.dumps(dict, **jsonArgs)
             if callback != None:
                 out = callback + '(' + out + ');' # wrap with JSONP call if requested
         except Exception, e: # if we fail to generate the output fake an error
@@ -172,6 +218,25 @@ class Api:
             out = '{"result":"' + result_type_map[RESULT_ERROR] + '", "message": "error while composing output: "' + ex(e) + '"}'
         return out
 
+    def _stream_json(self, chunks, callback):
+        """ yields the encoded json in STREAM_CHUNK_SIZE pieces """
+        if callback != None:
+            yield callback + '('
+
+        buf = []
+        bufSize = 0
+        for chunk in chunks:
+            buf.append(chunk)
+            bufSize += len(chunk)
+            if bufSize >= STREAM_CHUNK_SIZE:
+                yield ''.join(buf)
+                buf = []
+                bufSize = 0
+        yield ''.join(buf)
+
+        if callback != None:
+            yield ');'
+
     def _grand_access(self, realKey, args, kwargs):
         """ validate api key and log result """
         remoteIp = cherrypy.request.remote.ip
@@ -566,6 +631,23 @@ def _historyDate_to_dateTimeForm(timeString):
     return date.strftime(dateTimeFormat)
 
 
+def _timestamp_to_historyDate(timestamp):
+    return int(time.strftime(history.dateFormat, time.localtime(timestamp)))
+
+
+def _make_cursor(*values):
+    """ the cursor for paging on from a result, made from the values it's sorted on """
+    return ".".join([str(int(x)) for x in values])
+
+
+def _parse_cursor(cursor, length):
+    """ returns the values a cursor from _make_cursor was made from """
+    values = cursor.split(".")
+    if len(values) != length or not all([_is_int(x) for x in values]):
+        raise ApiError("Invalid cursor: '" + cursor + "'")
+    return [int(x) for x in values]
+
+
 def _replace_statusStrings_with_statusCodes(statusStrings):
     statusCodes = []
     if "snatched" in statusStrings:
@@ -839,6 +921,75 @@ class CMD_Episode(ApiCall):
         return _responds(RESULT_SUCCESS, episode)
 
 
+class CMD_Episodes(ApiCall):
+    _help = {"desc": "display the episodes of many shows at once, oldest change first, a page at a time",
+             "optionalParameters": {"tvdbid": {"desc": "one or more thetvdb.com show ids separated by |, all shows if omitted"},
+                                    "since": {"desc": "only episodes saved at or after this unix time"},
+                                    "limit": {"desc": "the most episodes to return, up to " + str(MAX_EPISODES_PAGE)},
+                                    "cursor": {"desc": "the next_cursor of the previous page"},
+                                  }
+             }
+
+    def __init__(self, args, kwargs):
+        # required
+        # optional
+        self.tvdbid, args = self.check_params(args, kwargs, "tvdbid", None, False, "list", [])
+        self.since, args = self.check_params(args, kwargs, "since", 0, False, "int", [])
+        self.limit, args = self.check_params(args, kwargs, "limit", 1000, False, "int", [])
+        self.cursor, args = self.check_params(args, kwargs, "cursor", None, False, "string", [])
+        # super, missing, help
+        ApiCall.__init__(self, args, kwargs)
+
+    def run(self):
+        """ display the episodes of many shows at once """
+        where = ["1"]
+        params = []
+
+        if self.since:
+            where.append("last_modified >= ?")
+            params.append(self.since)
+
+        if self.tvdbid:
+            if not all([_is_int(x) for x in self.tvdbid]):
+                raise ApiError("Invalid tvdbid: '" + "|".join(self.tvdbid) + "'")
+            where.append("showid IN (" + ",".join(["?"] * len(self.tvdbid)) + ")")
+            params += [int(x) for x in self.tvdbid]
+
+        if self.cursor:
+            lastModified, episodeID = _parse_cursor(self.cursor, 2)
+            # no IFNULLs so idx_tv_episodes_last_modified can be used, the upgrade gave every old episode a last_modified of 0
+            where.append("(last_modified > ? OR (last_modified = ? AND episode_id > ?))")
+            params += [lastModified, lastModified, episodeID]
+
+        limit = max(1, min(int(self.limit), MAX_EPISODES_PAGE))
+
+        myDB = db.DBConnection(row_type="dict")
+        # one more than the limit to know if there's another page
+        sqlResults = myDB.select("SELECT episode_id, showid, season, episode, name, airdate, status, location, file_size, release_name, last_modified FROM tv_episodes WHERE " + " AND ".join(where) + " ORDER BY last_modified, episode_id LIMIT ?", params + [limit + 1])
+        myDB.connection.close()
+
+        nextCursor = None
+        if len(sqlResults) > limit:
+            sqlResults = sqlResults[:limit]
+            nextCursor = _make_cursor(sqlResults[-1]["last_modified"] or 0, sqlResults[-1]["episode_id"])
+
+        episodes = []
+        for row in sqlResults:
+            status, quality = Quality.splitCompositeStatus(int(row["status"]))
+            row["status"] = _get_status_Strings(status)
+            row["quality"] = _get_quality_string(quality)
+            row["airdate"] = _ordinal_to_dateForm(row["airdate"])
+            if not row["file_size"]:
+                row["file_size"] = 0
+            if not row["last_modified"]:
+                row["last_modified"] = 0
+            del row["episode_id"]
+            _rename_element(row, "showid", "tvdbid")
+            episodes.append(row)
+
+        return _responds(RESULT_SUCCESS, {"episodes": episodes, "next_cursor": nextCursor})
+
+
 class CMD_EpisodeSearch(ApiCall):
     _help = {"desc": "search for an episode. the response might take some time",
              "requiredParameters": {"tvdbid": {"desc": "thetvdb.com unique id of a show"},
@@ -1024,6 +1175,8 @@ class CMD_History(ApiCall):
     _help = {"desc": "display sickbeard downloaded/snatched history",
              "optionalParameters": {"limit": {"desc": "limit returned results"},
                                     "type": {"desc": "only show a specific type of results"},
+                                    "since": {"desc": "only results from this unix time on"},
+                                    "cursor": {"desc": "only results older than the one with this cursor"},
                                    }
              }
 
@@ -1032,6 +1185,8 @@ class CMD_History(ApiCall):
         # optional
         self.limit, args = self.check_params(args, kwargs, "limit", 100, False, "int", [])
         self.type, args = self.check_params(args, kwargs, "type", None, False, "string", ["downloaded", "snatched"])
+        self.since, args = self.check_params(args, kwargs, "since", None, False, "int", [])
+        self.cursor, args = self.check_params(args, kwargs, "cursor", None, False, "string", [])
         # super, missing, help
         ApiCall.__init__(self, args, kwargs)
 
@@ -1048,16 +1203,31 @@ class CMD_History(ApiCall):
         else:
             typeCodes = Quality.SNATCHED + Quality.DOWNLOADED
 
+        where = "h.showid=s.tvdb_id AND action in (" + ','.join(['?'] * len(typeCodes)) + ")"
+        params = list(typeCodes)
+
+        if self.since:
+            where += " AND date >= ?"
+            params.append(_timestamp_to_historyDate(self.since))
+
+        if self.cursor:
+            cursorDate, cursorID = _parse_cursor(self.cursor, 2)
+            where += " AND (date < ? OR (date = ? AND h.rowid < ?))"
+            params += [cursorDate, cursorDate, cursorID]
+
         myDB = db.DBConnection(row_type="dict")
 
         ulimit = min(int(self.limit), 100)
         if ulimit == 0:
-            sqlResults = myDB.select("SELECT h.*, show_name FROM history h, tv_shows s WHERE h.showid=s.tvdb_id AND action in (" + ','.join(['?'] * len(typeCodes)) + ") ORDER BY date DESC", typeCodes)
+            sqlResults = myDB.select("SELECT h.rowid AS history_id, h.*, show_name FROM history h, tv_shows s WHERE " + where + " ORDER BY date DESC, h.rowid DESC", params)
         else:
-            sqlResults = myDB.select("SELECT h.*, show_name FROM history h, tv_shows s WHERE h.showid=s.tvdb_id AND action in (" + ','.join(['?'] * len(typeCodes)) + ") ORDER BY date DESC LIMIT ?", typeCodes + [ulimit])
+            sqlResults = myDB.select("SELECT h.rowid AS history_id, h.*, show_name FROM history h, tv_shows s WHERE " + where + " ORDER BY date DESC, h.rowid DESC LIMIT ?", params + [ulimit])
 
         results = []
         for row in sqlResults:
+            # page on from here by passing it back as the cursor
+            row["cursor"] = _make_cursor(row["date"], row["history_id"])
+            del row["history_id"]
             status, quality = Quality.splitCompositeStatus(int(row["action"]))
             status = _get_status_Strings(status)
             if self.type and not status == self.type:
@@ -1246,6 +1416,85 @@ class CMD_SickBeardAddRootDir(ApiCall):
         return _responds(RESULT_SUCCESS, _getRootDirs(), msg="Root directories updated")
 
 
+class CMD_SickBeardBacklogPlan(ApiCall):
+    _help = {"desc": "display the seasons the next backlog search would search for"}
+
+    def __init__(self, args, kwargs):
+        # required
+        # optional
+        # super, missing, help
+        ApiCall.__init__(self, args, kwargs)
+
+    def run(self):
+        """ display the seasons the next backlog search would search for """
+        plan = []
+        for curSegment in sickbeard.backlogSearchScheduler.action.currentPlan(): #@UndefinedVariable
+            plan.append({"tvdbid": curSegment.show.tvdbid,
+                         "show_name": curSegment.show.name,
+                         "segment": curSegment.segment,
+                         "wanted": curSegment.wanted,
+                         "upgrades": curSegment.upgrades,
+                         "last_airdate": _ordinal_to_dateForm(curSegment.last_airdate),
+                         "cost": curSegment.cost})
+
+        return _responds(RESULT_SUCCESS, plan)
+
+
+class CMD_SickBeardProviderHealth(ApiCall):
+    _help = {"desc": "display how well requests to each provider are going and which are being skipped"}
+
+    def __init__(self, args, kwargs):
+        # required
+        # optional
+        # super, missing, help
+        ApiCall.__init__(self, args, kwargs)
+
+    def run(self):
+        """ display how well requests to each provider are going and which are being skipped """
+        return _responds(RESULT_SUCCESS, [x.toDict() for x in provider_health.healthReport()])
+
+
+class CMD_SickBeardQueryStats(ApiCall):
+    _help = {"desc": "display how often each kind of database query runs and how long it takes, and the slow query log",
+             "optionalParameters": {"sort": {"desc": "what to sort the queries by, most first"},
+                                    "limit": {"desc": "the most queries to show, 0 for all"},
+                                   }
+             }
+
+    def __init__(self, args, kwargs):
+        # required
+        # optional
+        self.sort, args = self.check_params(args, kwargs, "sort", "total", False, "string", ["total", "count", "avg", "p95", "max", "rows"])
+        self.limit, args = self.check_params(args, kwargs, "limit", 50, False, "int", [])
+        # super, missing, help
+        ApiCall.__init__(self, args, kwargs)
+
+    def run(self):
+        """ display how often each kind of database query runs and how long it takes, and the slow query log """
+        queries = instrumentation.queryReport()
+        queries.sort(key=lambda x: x[self.sort], reverse=True)
+        if self.limit:
+            queries = queries[:int(self.limit)]
+
+        return _responds(RESULT_SUCCESS, {"queries": queries,
+                                          "slow_queries": instrumentation.slowQueries(),
+                                          "slow_query_ms": sickbeard.DB_SLOW_QUERY_MS})
+
+
+class CMD_SickBeardDiagnostics(ApiCall):
+    _help = {"desc": "display the timings of pages, api calls, queue items and scheduled jobs, and the database query stats"}
+
+    def __init__(self, args, kwargs):
+        # required
+        # optional
+        # super, missing, help
+        ApiCall.__init__(self, args, kwargs)
+
+    def run(self):
+        """ display the timings of pages, api calls, queue items and scheduled jobs, and the database query stats """
+        return _responds(RESULT_SUCCESS, instrumentation.fullReport())
+
+
 class CMD_SickBeardCheckScheduler(ApiCall):
     _help = {"desc": "query the scheduler"}
 
@@ -1266,8 +1515,10 @@ class CMD_SickBeardCheckScheduler(ApiCall):
         nextSearch = str(sickbeard.currentSearchScheduler.timeLeft()).split('.')[0]
         nextBacklog = sickbeard.backlogSearchScheduler.nextRun().strftime(dateFormat).decode(sickbeard.SYS_ENCODING)
 
+        backlogPending = sickbeard.backlogSearchScheduler.action.pendingSearches() #@UndefinedVariable
+
         myDB.connection.close()
-        data = {"backlog_is_paused": int(backlogPaused), "backlog_is_running": int(backlogRunning), "last_backlog": _ordinal_to_dateForm(sqlResults[0]["last_backlog"]), "search_is_running": int(searchStatus), "next_search": nextSearch, "next_backlog": nextBacklog}
+        data = {"backlog_is_paused": int(backlogPaused), "backlog_is_running": int(backlogRunning), "backlog_pending": backlogPending, "last_backlog": _ordinal_to_dateForm(sqlResults[0]["last_backlog"]), "search_is_running": int(searchStatus), "next_search": nextSearch, "next_backlog": nextBacklog}
         return _responds(RESULT_SUCCESS, data)
 
 
@@ -2409,6 +2660,7 @@ class CMD_ShowsStats(ApiCall):
 _functionMaper = {"help": CMD_Help,
                   "future": CMD_ComingEpisodes,
                   "episode": CMD_Episode,
+                  "episodes": CMD_Episodes,
                   "episode.search": CMD_EpisodeSearch,
                   "episode.setstatus": CMD_EpisodeSetStatus,
                   "exceptions": CMD_Exceptions,
@@ -2418,14 +2670,18 @@ _functionMaper = {"help": CMD_Help,
                   "logs": CMD_Logs,
                   "sb": CMD_SickBeard,
                   "sb.addrootdir": CMD_SickBeardAddRootDir,
+                  "sb.backlogplan": CMD_SickBeardBacklogPlan,
                   "sb.checkscheduler": CMD_SickBeardCheckScheduler,
                   "sb.deleterootdir": CMD_SickBeardDeleteRootDir,
+                  "sb.diagnostics": CMD_SickBeardDiagnostics,
                   "sb.forcesearch": CMD_SickBeardForceSearch,
                   "sb.getdefaults": CMD_SickBeardGetDefaults,
                   "sb.getmessages": CMD_SickBeardGetMessages,
                   "sb.getrootdirs": CMD_SickBeardGetRootDirs,
                   "sb.pausebacklog": CMD_SickBeardPauseBacklog,
                   "sb.ping": CMD_SickBeardPing,
+                  "sb.providerhealth": CMD_SickBeardProviderHealth,
+                  "sb.querystats": CMD_SickBeardQueryStats,
                   "sb.restart": CMD_SickBeardRestart,
                   "sb.searchtvdb": CMD_SickBeardSearchTVDB,
                   "sb.setdefaults": CMD_SickBeardSetDefaults,
@@ -27,6 +27,7 @@ import threading
 import datetime
 import random
 import pprint
+import cgi
 
 
 from Cheetah.Template import Template
@@ -40,7 +41,11 @@ from sickbeard import ui
 from sickbeard import logger, helpers, exceptions, classes, db
 from sickbeard import encodingKludge as ek
 from sickbeard import search_queue
+from sickbeard import provider_health
+from sickbeard import query_cache
 from sickbeard import image_cache
+from sickbeard import episode_cache
+from sickbeard import instrumentation
 from sickbeard import naming
 from sickbeard import downloader
 
@@ -69,18 +74,65 @@ except ImportError:
 from sickbeard import browser
 
 
+# compiled template classes by (file, base class), see getTemplateClass
+_template_classes = {}
+_template_classes_lock = threading.Lock()
+
+_ipv6_host_re = re.compile("^\[.*\]", re.X|re.M|re.S)
+_host_re = re.compile("^[^:]+", re.X|re.M|re.S)
+
+def getTemplateClass(file, baseclass=Template):
+    """
+    Returns the compiled class for a template in data/interfaces/default (or at the given full path).
+    It's only compiled the first time it's needed, or again if the file was changed since.
+    """
+
+    file = os.path.join(sickbeard.PROG_DIR, "data/interfaces/default/", file)
+    mtime = os.path.getmtime(file)
+    key = (file, baseclass)
+
+    with _template_classes_lock:
+        if key in _template_classes and _template_classes[key][0] == mtime:
+            return _template_classes[key][1]
+
+        logger.log(u"Compiling template " + file, logger.DEBUG)
+        templateClass = Template.compile(file=file, baseclass=baseclass, cacheCompilationResults=False, keepRefToGeneratedCode=False)
+        _template_classes[key] = (mtime, templateClass)
+
+        return templateClass
+
+class _IncludeCompiler:
+    """
+    Compiles the templates pulled in by #include through the same cache as the pages
+    """
+
+    @staticmethod
+    def compile(source=None, file=None):
+        if file is None:
+            return Template.compile(source=source)
+
+        return getTemplateClass(file)
+
 class PageTemplate (Template):
+
+    def __new__(cls, *args, **KWs):
+        # PageTemplate(file="home.tmpl") makes an instance of that template's compiled class
+        if cls is PageTemplate:
+            cls = getTemplateClass(KWs['file'], PageTemplate)
+        return super(PageTemplate, cls).__new__(cls)
+
     def __init__(self, *args, **KWs):
-        KWs['file'] = os.path.join(sickbeard.PROG_DIR, "data/interfaces/default/", KWs['file'])
+        # the template is already compiled, it doesn't need the file again
+        KWs.pop('file', None)
         super(PageTemplate, self).__init__(*args, **KWs)
         self.sbRoot = sickbeard.WEB_ROOT
         self.sbHttpPort = sickbeard.WEB_PORT
         self.sbHttpsPort = sickbeard.WEB_PORT
         self.sbHttpsEnabled = sickbeard.ENABLE_HTTPS
         if cherrypy.request.headers['Host'][0] == '[':
-            self.sbHost = re.match("^\[.*\]", cherrypy.request.headers['Host'], re.X|re.M|re.S).group(0)
+            self.sbHost = _ipv6_host_re.match(cherrypy.request.headers['Host']).group(0)
         else:
-            self.sbHost = re.match("^[^:]+", cherrypy.request.headers['Host'], re.X|re.M|re.S).group(0)
+            self.sbHost = _host_re.match(cherrypy.request.headers['Host']).group(0)
         self.projectHomePage = "http://code.google.com/p/sickbeard/"
 
         if sickbeard.NZBS and sickbeard.NZBS_UID and sickbeard.NZBS_HASH:
@@ -119,6 +171,9 @@ class PageTemplate (Template):
         if sickbeard.USE_LIBTORRENT:
             self.menu.insert(2, {'title': downloadPageTitle, 'key': 'downloads' })
 
+    def _getTemplateAPIClassForIncludeDirectiveCompilation(self, source, file):
+        return _IncludeCompiler
+
 def redirect(abspath, *args, **KWs):
     assert abspath[0] == '/'
     raise cherrypy.HTTPRedirect(sickbeard.WEB_ROOT + abspath, *args, **KWs)
@@ -167,6 +222,7 @@ ManageMenu = [
     { 'title': 'Backlog Overview',          'path': 'manage/backlogOverview' },
     { 'title': 'Manage Searches',           'path': 'manage/manageSearches'  },
     { 'title': 'Episode Status Management', 'path': 'manage/episodeStatuses' },
+    { 'title': 'Diagnostics',               'path': 'manage/diagnostics'     },
 ]
 
 class ManageSearches:
@@ -178,6 +234,10 @@ class ManageSearches:
         t.backlogPaused = sickbeard.searchQueueScheduler.action.is_backlog_paused() #@UndefinedVariable
         t.backlogRunning = sickbeard.searchQueueScheduler.action.is_backlog_in_progress() #@UndefinedVariable
         t.searchStatus = sickbeard.currentSearchScheduler.action.amActive #@UndefinedVariable
+        t.backlogPlan = sickbeard.backlogSearchScheduler.action.currentPlan() #@UndefinedVariable
+        t.backlogPending = sickbeard.backlogSearchScheduler.action.pendingSearches() #@UndefinedVariable
+        t.providerHealth = provider_health.healthReport()
+        t.episodeCache = episode_cache.cacheStats()
         t.submenu = ManageMenu
 
         return _munge(t)
@@ -214,9 +274,68 @@ class ManageSearches:
         redirect("/manage/manageSearches")
 
 
+# how many of the query shapes that take the most time are shown on the diagnostics page
+DIAGNOSTICS_QUERIES = 25
+
+def _formatTime(seconds):
+    if seconds is None:
+        return "-"
+    elif seconds < 1:
+        return "%dms" % (seconds * 1000)
+    else:
+        return "%.1fs" % seconds
+
+class Diagnostics:
+
+    @cherrypy.expose
+    def index(self):
+        t = PageTemplate(file="manage_diagnostics.tmpl")
+        t.report = instrumentation.report()
+        t.queries = instrumentation.queryReport()[:DIAGNOSTICS_QUERIES]
+        t.slowQueries = instrumentation.slowQueries()
+        for curQuery in t.queries:
+            curQuery["query"] = cgi.escape(curQuery["query"])
+        for curSlow in t.slowQueries:
+            for curKey in ("query", "args", "caller"):
+                curSlow[curKey] = cgi.escape(curSlow[curKey] or "")
+            curSlow["plan"] = [cgi.escape(x) for x in curSlow["plan"]]
+        t.profiles = instrumentation.profiles()
+        t.formatTime = _formatTime
+        t.submenu = ManageMenu
+
+        # each kind's timings, slowest in total first (the names come from urls so they need escaping)
+        t.timings = {}
+        for curKind, curTimings in t.report["timings"].items():
+            t.timings[curKind] = [(cgi.escape(x), y) for x, y in sorted(curTimings.items(), key=lambda x: x[1]["total"], reverse=True)]
+
+        buckets = t.report["buckets"]
+        t.bucketNames = ["&le; " + _formatTime(x) for x in buckets] + ["&gt; " + _formatTime(buckets[-1])]
+
+        return _munge(t)
+
+    @cherrypy.expose
+    def export(self):
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        cherrypy.response.headers['Content-Disposition'] = 'attachment; filename="sickbeard-diagnostics.json"'
+        return json.dumps(instrumentation.fullReport(), indent=4, sort_keys=True)
+
+    @cherrypy.expose
+    def clear(self):
+        instrumentation.clear()
+        redirect("/manage/diagnostics")
+
+    @cherrypy.expose
+    def getProfile(self, name=None):
+        if name not in [x[0] for x in instrumentation.profiles()]:
+            raise cherrypy.HTTPError(404)
+
+        return cherrypy.lib.static.serve_file(ek.ek(os.path.join, instrumentation.profileDir(), name), "application/octet-stream", "attachment", name)
+
+
 class Manage:
 
     manageSearches = ManageSearches()
+    diagnostics = Diagnostics()
 
     @cherrypy.expose
     def index(self):
@@ -1313,6 +1432,10 @@ class ConfigProviders:
 
         sickbeard.PROVIDER_ORDER = provider_list
 
+        # give any providers which were failing because of bad settings another chance
+        provider_health.resetHealth()
+        query_cache.clearCache()
+
         sickbeard.save_config()
 
         if len(results) > 0:
@@ -2556,16 +2679,17 @@ class Home:
 
         myDB = db.DBConnection()
 
-        seasonResults = myDB.select(
-            "SELECT DISTINCT season FROM tv_episodes WHERE showid = ? ORDER BY season desc",
-            [showObj.tvdbid]
-        )
-
         sqlResults = myDB.select(
             "SELECT * FROM tv_episodes WHERE showid = ? ORDER BY season DESC, episode DESC",
             [showObj.tvdbid]
         )
 
+        # the seasons come from the same rows, they're already in order
+        seasonResults = []
+        for curResult in sqlResults:
+            if not seasonResults or seasonResults[-1]["season"] != curResult["season"]:
+                seasonResults.append({"season": curResult["season"]})
+
         t = PageTemplate(file="displayShow.tmpl")
         t.submenu = [ { 'title': 'Edit', 'path': 'home/editShow?show=%d'%showObj.tvdbid } ]
 
@@ -2619,15 +2743,7 @@ class Home:
             epCats[str(curResult["season"])+"x"+str(curResult["episode"])] = curEpCat
             epCounts[curEpCat] += 1
 
-        def titler(x):
-            if not x:
-                return x
-            if x.lower().startswith('a '):
-                    x = x[2:]
-            elif x.lower().startswith('the '):
-                    x = x[4:]
-            return x
-        t.sortedShowList = sorted(sickbeard.showList, lambda x, y: cmp(titler(x.name), titler(y.name)))
+        t.sortedShowList = helpers.sortedShowList()
 
         t.epCounts = epCounts
         t.epCats = epCats
@@ -3032,11 +3148,11 @@ class Home:
 
             related_eps_result = myDB.select("SELECT * FROM tv_episodes WHERE location = ? AND episode != ?", [ep_result[0]["location"], epInfo[1]])
 
-            root_ep_obj = show_obj.getEpisode(int(epInfo[0]), int(epInfo[1]))
+            root_ep_obj = show_obj.getEpisode(int(epInfo[0]), int(epInfo[1]), dbResult=ep_result[0])
             root_ep_obj.relatedEps = []
 
             for cur_related_ep in related_eps_result:
-                related_ep_obj = show_obj.getEpisode(int(cur_related_ep["season"]), int(cur_related_ep["episode"]))
+                related_ep_obj = show_obj.getEpisode(int(cur_related_ep["season"]), int(cur_related_ep["episode"]), dbResult=cur_related_ep)
                 if related_ep_obj not in root_ep_obj.relatedEps:
                     root_ep_obj.relatedEps.append(related_ep_obj)
 
@@ -22,11 +22,20 @@ import os.path
 
 import sickbeard
 
+from sickbeard import instrumentation
 from sickbeard import logger
 from sickbeard.webserve import WebInterface
 
 from sickbeard.helpers import create_https_certificates
 
+# times every page and api call for the diagnostics page, and profiles them when asked to
+# (after auth_basic, which has priority 1, so it knows whether the request got past it)
+cherrypy.tools.instrument = cherrypy.Tool('before_handler', instrumentation.startRequest, priority=60)
+
+# the kinds of responses worth gzipping
+GZIP_MIME_TYPES = ['text/html', 'text/plain', 'text/css', 'text/javascript', 'text/xml',
+                   'application/json', 'application/javascript', 'application/x-javascript']
+
 def initWebServer(options = {}):
         options.setdefault('port',      8081)
         options.setdefault('host',      '0.0.0.0')
@@ -118,18 +127,31 @@ def initWebServer(options = {}):
                                 'tools.staticdir.root': options['data_root'],
                                 'tools.encode.on': True,
                                 'tools.encode.encoding': 'utf-8',
+                                # compress anything text based for clients that accept it
+                                'tools.gzip.on': True,
+                                'tools.gzip.mime_types': GZIP_MIME_TYPES,
+                                # ETags from a hash of the page so an unchanged page gets a 304 instead
+                                'tools.etags.on': True,
+                                'tools.etags.autotags': True,
+                                'tools.instrument.on': True,
                         },
                         '/images': {
                                 'tools.staticdir.on':  True,
-                                'tools.staticdir.dir': 'images'
+                                'tools.staticdir.dir': 'images',
+                                'tools.etags.on': False,
+                                'tools.instrument.on': False
                         },
                         '/js':     {
                                 'tools.staticdir.on':  True,
-                                'tools.staticdir.dir': 'js'
+                                'tools.staticdir.dir': 'js',
+                                'tools.etags.on': False,
+                                'tools.instrument.on': False
                         },
                         '/css':    {
                                 'tools.staticdir.on':  True,
-                                'tools.staticdir.dir': 'css'
+                                'tools.staticdir.dir': 'css',
+                                'tools.etags.on': False,
+                                'tools.instrument.on': False
                         },
         }
         app = cherrypy.tree.mount(WebInterface(), options['web_root'], conf)
@@ -0,0 +1,196 @@
+# coding=UTF-8
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import test_lib as test
+
+import datetime
+
+import sickbeard
+from sickbeard import db, request_budget, provider_health
+from sickbeard.searchBacklog import BacklogSearcher
+from sickbeard.tv import TVShow
+from sickbeard.common import WANTED, SKIPPED, DOWNLOADED, Quality
+
+
+class FakeProvider:
+    """
+    A provider which finds nothing but uses up some of its budget (one request unless it has to page) for every season search
+    """
+
+    def __init__(self, provider_id):
+        self.provider_id = provider_id
+        self.name = provider_id
+        self.searched = []
+        self.requests = 1
+
+    def getID(self):
+        return self.provider_id
+
+    def isActive(self):
+        return True
+
+    def findSeasonResults(self, show, season):
+        request_budget.recordRequest(self.provider_id, self.requests)
+        self.searched.append(season)
+        return {}
+
+
+class FakeSearchQueue:
+    def __init__(self):
+        self.items = []
+
+    def is_backlog_in_progress(self):
+        return False
+
+    def add_item(self, item):
+        self.items.append(item)
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.action = FakeSearchQueue()
+
+
+class BacklogTests(test.SickbeardTestDBCase):
+
+    def setUp(self):
+        super(BacklogTests, self).setUp()
+
+        self.old_settings = (sickbeard.providerList, sickbeard.newznabProviderList, sickbeard.anyRssProviderList,
+                             sickbeard.PROVIDER_BUDGETS, sickbeard.PROVIDER_REQUESTS_PER_HOUR, sickbeard.searchQueueScheduler)
+
+        self.a = FakeProvider("a")
+        self.b = FakeProvider("b")
+        sickbeard.providerList = [self.a, self.b]
+        sickbeard.newznabProviderList = []
+        sickbeard.anyRssProviderList = []
+        sickbeard.PROVIDER_REQUESTS_PER_HOUR = 0
+        self.setBudgets("a:1 b:100")
+        provider_health.resetHealth()
+
+        sickbeard.searchQueueScheduler = FakeScheduler()
+
+        show = TVShow(0001, "en")
+        show.name = "show name"
+        show.quality = Quality.combineQualities([Quality.SDTV], [])
+        show.saveToDB()
+        sickbeard.showList = [show]
+
+        # two seasons of wanted episodes that just aired
+        myDB = db.DBConnection()
+        for season in (1, 2):
+            for episode in (1, 2):
+                myDB.action("INSERT INTO tv_episodes (showid, tvdbid, name, season, episode, description, airdate, status, location) VALUES (?,?,?,?,?,?,?,?,?)",
+                            [show.tvdbid, season * 100 + episode, "ep name", season, episode, "", datetime.date.today().toordinal(), WANTED, ""])
+
+        self.searcher = BacklogSearcher()
+
+    def tearDown(self):
+        (sickbeard.providerList, sickbeard.newznabProviderList, sickbeard.anyRssProviderList,
+         sickbeard.PROVIDER_BUDGETS, sickbeard.PROVIDER_REQUESTS_PER_HOUR, sickbeard.searchQueueScheduler) = self.old_settings
+        request_budget.resetBudgets()
+        super(BacklogTests, self).tearDown()
+
+    def setBudgets(self, budgets):
+        sickbeard.PROVIDER_BUDGETS = budgets
+        request_budget.resetBudgets()
+
+    def planned(self):
+        myDB = db.DBConnection()
+        return [(int(x["segment"]), x["providers"]) for x in myDB.select("SELECT segment, providers FROM backlog_progress ORDER BY segment")]
+
+    def dispatch(self):
+        """
+        Dispatches the saved plan and runs the queued searches, returns the providers each one was sent to
+        """
+
+        sickbeard.searchQueueScheduler.action.items = []
+        self.searcher.dispatchBacklog()
+
+        dispatched = []
+        for item in sickbeard.searchQueueScheduler.action.items:
+            dispatched.append((item.segment, item.providerIDs))
+            item.execute()
+
+        return dispatched
+
+    def setStatus(self, season, status):
+        db.DBConnection().action("UPDATE tv_episodes SET status = ? WHERE season = ?", [status, season])
+
+    def test_budget_redispatch(self):
+        self.searcher.searchBacklog()
+        self.assertEqual(self.planned(), [(1, ""), (2, "")])
+
+        # a only has the budget for one segment, the other one waits for it
+        self.assertEqual(self.dispatch(), [(1, ["a", "b"]), (2, ["b"])])
+        self.assertEqual(self.a.searched, [1])
+        self.assertEqual(self.b.searched, [1, 2])
+
+        # the first one is done, the second still needs a
+        self.assertEqual(self.planned(), [(2, "a")])
+
+        # once its budget refills only a searches it
+        self.setBudgets("a:10 b:100")
+        self.assertEqual(self.dispatch(), [(2, ["a"])])
+        self.assertEqual(self.a.searched, [1, 2])
+        self.assertEqual(self.b.searched, [1, 2])
+        self.assertEqual(self.planned(), [])
+
+    def test_cut_off_provider_searches_again(self):
+        self.setBudgets("a:2 b:100")
+        self.a.requests = 3
+        self.searcher.searchBacklog()
+
+        # a's budget runs out paging through the first segment, it doesn't get to the second one
+        self.assertEqual(self.dispatch(), [(1, ["a", "b"]), (2, ["a", "b"])])
+        self.assertEqual(self.a.searched, [1])
+        self.assertEqual(self.planned(), [(1, "a"), (2, "a")])
+
+    def test_exhausted_provider_doesnt_stall(self):
+        request_budget.recordRequest("a")
+        self.searcher.searchBacklog()
+
+        # b doesn't wait for a
+        self.assertEqual(self.dispatch(), [(1, ["b"]), (2, ["b"])])
+        self.assertEqual(self.planned(), [(1, "a"), (2, "a")])
+
+    def test_stale_segments_not_dispatched(self):
+        self.searcher.searchBacklog()
+
+        self.setStatus(2, Quality.compositeStatus(DOWNLOADED, Quality.SDTV))
+        self.assertEqual(self.dispatch(), [(1, ["a", "b"])])
+        self.assertEqual(self.b.searched, [1])
+
+    def test_stale_segments_pruned(self):
+        self.searcher.searchBacklog()
+        self.assertEqual(self.planned(), [(1, ""), (2, "")])
+
+        # the next plan (a limited one, a full backlog was just done) takes out what isn't needed any more
+        self.setStatus(1, SKIPPED)
+        self.searcher.searchBacklog()
+        self.assertEqual(self.planned(), [(2, "")])
+
+
+if __name__ == '__main__':
+    print "=================="
+    print "STARTING - BACKLOG TESTS"
+    print "=================="
+    print "######################################################################"
+    suite = unittest.TestLoader().loadTestsFromTestCase(BacklogTests)
+    unittest.TextTestRunner(verbosity=2).run(suite)
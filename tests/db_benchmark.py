@@ -0,0 +1,182 @@
+# coding=UTF-8
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Times the episode, cache and scene lookups against a large test library, first without the
+lookup indexes and planner statistics and then after the database upgrade has added them.
+
+Run it from the tests dir: python db_benchmark.py [shows] [episodes per show] [lookups]
+"""
+
+import sys
+import time
+import random
+
+import test_lib as test
+
+import sickbeard
+from sickbeard import classes, db, tvcache, name_cache, scene_exceptions, scene_numbering, custom_exceptions, db_maintenance
+from sickbeard.databases import mainDB, cache_db
+from sickbeard.tv import TVShow
+from sickbeard.common import WANTED, SKIPPED, DOWNLOADED, Quality
+
+PROVIDER = "benchmark"
+
+# the indexes the upgrade adds, so they can be taken away again for the "before" numbers
+MAIN_INDEXES = ["idx_tv_episodes_showid_season_episode", "idx_custom_exceptions_tvdb_id", "idx_custom_exceptions_show_name"]
+CACHE_INDEXES = ["idx_scene_names_name", "idx_scene_names_tvdb_id", "idx_scene_exceptions_tvdb_id", "idx_scene_exceptions_show_name",
+                 "idx_" + PROVIDER + "_tvdbid_season"]
+
+
+class BenchmarkProvider:
+    def getID(self):
+        return PROVIDER
+
+    def getResult(self, episodes):
+        return classes.SearchResult(episodes)
+
+
+class BenchmarkEpisode:
+    def __init__(self, show, season, episode):
+        self.show = show
+        self.season = season
+        self.episode = episode
+
+
+def createLibrary(shows, episodes):
+    myDB = db.DBConnection()
+    cacheDB = db.DBConnection("cache.db")
+    tvcache.CacheDBConnection(PROVIDER)
+
+    # make sure the lazily created tables are there
+    scene_numbering._check_for_schema()
+    custom_exceptions._check_for_schema()
+
+    now = int(time.time())
+
+    for curShow in range(shows):
+        tvdb_id = 1000 + curShow
+        myDB.action("INSERT INTO tv_shows (tvdb_id, show_name, location, network, genre, runtime, quality, airs, status, flatten_folders, paused, startyear, tvr_id, tvr_name, air_by_date, lang) \
+                     VALUES (?,?,?,'Network','|Drama|',60,?,'Monday 9:00 PM','Continuing',0,0,2010,0,'',0,'en')",
+                    [tvdb_id, "Show Name %d" % curShow, test.SHOWDIR, Quality.combineQualities([Quality.SDTV], [])])
+
+        queries = []
+        cacheQueries = []
+        for curEp in range(episodes):
+            season, episode = curEp / 20 + 1, curEp % 20 + 1
+            status = (DOWNLOADED, WANTED, SKIPPED)[curEp % 3]
+            queries.append(["INSERT INTO tv_episodes (showid, tvdbid, name, season, episode, description, airdate, hasnfo, hastbn, status, location, file_size, release_name) \
+                             VALUES (?,?,?,?,?,'',?,0,0,?,'',0,'')",
+                            [tvdb_id, tvdb_id * 1000 + curEp, "Episode %d" % curEp, season, episode, 730000 + curEp, status]])
+            queries.append(["INSERT INTO scene_num (tvdb_id, season, episode, scene_season, scene_episode) VALUES (?,?,?,?,?)",
+                            [tvdb_id, season, episode, season, episode + 1]])
+            cacheQueries.append(["INSERT INTO xem_num (tvdb_id, season, episode, scene_season, scene_episode) VALUES (?,?,?,?,?)",
+                                 [tvdb_id, season, episode, season, episode + 1]])
+            cacheQueries.append(["INSERT INTO " + PROVIDER + " (name, season, episodes, tvrid, tvdbid, url, time, quality) VALUES (?,?,?,0,?,'',?,?)",
+                                 ["Show.Name.%d.S%02dE%02d.HDTV.XviD-GRP" % (curShow, season, episode), season, "|%d|" % episode, tvdb_id, now, Quality.SDTV]])
+            cacheQueries.append(["INSERT INTO scene_names (tvdb_id, name) VALUES (?,?)", [tvdb_id, "show name %d s%02de%02d" % (curShow, season, episode)]])
+
+        queries.append(["INSERT INTO custom_exceptions (tvdb_id, show_name) VALUES (?,?)", [tvdb_id, "Custom Name %d" % curShow]])
+        cacheQueries.append(["INSERT INTO scene_exceptions (tvdb_id, show_name) VALUES (?,?)", [tvdb_id, "Exception Name %d" % curShow]])
+        cacheQueries.append(["INSERT INTO xem_refresh (tvdb_id, last_refreshed) VALUES (?,?)", [tvdb_id, now]])
+
+        myDB.mass_action(queries)
+        cacheDB.mass_action(cacheQueries)
+
+def dropIndexes():
+    """
+    Puts the databases back the way they were before the upgrade: no lookup indexes and no statistics
+    """
+
+    myDB = db.DBConnection()
+    cacheDB = db.DBConnection("cache.db")
+
+    for curDB, curIndexes in ((myDB, MAIN_INDEXES), (cacheDB, CACHE_INDEXES)):
+        for curIndex in curIndexes:
+            curDB.action("DROP INDEX IF EXISTS " + curIndex)
+        if curDB.select("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"):
+            curDB.action("DELETE FROM sqlite_stat1")
+
+    myDB.action("UPDATE db_version SET db_version = ?", [15])
+
+def upgrade():
+    db.upgradeDatabase(db.DBConnection(), mainDB.InitialSchema)
+    db.upgradeDatabase(db.DBConnection("cache.db"), cache_db.InitialSchema)
+
+def timeLookups(shows, episodes, lookups):
+    random.seed(lookups)
+    picks = [(random.randrange(shows), random.randrange(episodes)) for x in range(lookups)]
+    cache = tvcache.TVCache(BenchmarkProvider())
+
+    def wantEpisode(curShow, curEp):
+        sickbeard.showList[curShow].wantEpisode(curEp / 20 + 1, curEp % 20 + 1, Quality.SDTV)
+
+    def searchCache(curShow, curEp):
+        cache.searchCache(BenchmarkEpisode(sickbeard.showList[curShow], curEp / 20 + 1, curEp % 20 + 1))
+
+    def retrieveNameFromCache(curShow, curEp):
+        name_cache.retrieveNameFromCache("show name %d s%02de%02d" % (curShow, curEp / 20 + 1, curEp % 20 + 1))
+
+    def get_scene_exception_by_name(curShow, curEp):
+        scene_exceptions.get_scene_exception_by_name(u"exception name %d" % curShow)
+
+    def get_tvdb_numbering(curShow, curEp):
+        scene_numbering.get_tvdb_numbering(1000 + curShow, curEp / 20 + 1, curEp % 20 + 2, fallback_to_xem=False)
+
+    def get_tvdb_numbering_for_xem(curShow, curEp):
+        scene_numbering.get_tvdb_numbering_for_xem(1000 + curShow, curEp / 20 + 1, curEp % 20 + 2)
+
+    results = []
+    for curName, curLookup in (("wantEpisode", wantEpisode), ("searchCache", searchCache), ("retrieveNameFromCache", retrieveNameFromCache),
+                               ("get_scene_exception_by_name", get_scene_exception_by_name), ("get_tvdb_numbering", get_tvdb_numbering), ("get_tvdb_numbering_for_xem", get_tvdb_numbering_for_xem)):
+        start = time.time()
+        for curShow, curEp in picks:
+            curLookup(curShow, curEp)
+        results.append((curName, (time.time() - start) * 1000 / lookups))
+
+    return results
+
+def main(shows=500, episodes=200, lookups=500):
+    test.setUp_test_db()
+    sickbeard.showList = []
+    createLibrary(shows, episodes)
+    sickbeard.showList = [TVShow(1000 + x) for x in range(shows)]
+
+    dropIndexes()
+    before = timeLookups(shows, episodes, lookups)
+
+    start = time.time()
+    upgrade()
+    upgradeTime = time.time() - start
+
+    after = timeLookups(shows, episodes, lookups)
+
+    start = time.time()
+    db_maintenance.DBMaintainer().run()
+    maintenanceTime = time.time() - start
+
+    print "%d shows with %d episodes each, %d lookups of each kind" % (shows, episodes, lookups)
+    print "upgrade took %.1fs, maintenance took %.1fs" % (upgradeTime, maintenanceTime)
+    for (curName, curBefore), (curName, curAfter) in zip(before, after):
+        print "%-28s before %8.3fms, after %8.3fms" % (curName, curBefore, curAfter)
+
+    test.tearDown_test_db()
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,123 @@
+# coding=UTF-8
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import test_lib as test
+
+import threading
+import time
+
+from sickbeard import provider_health
+
+
+def inThread(function):
+    """
+    Returns what function gives back when it's run in another thread
+    """
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()))
+    thread.start()
+    thread.join()
+
+    return result[0]
+
+
+class ProviderHealthTests(unittest.TestCase):
+
+    def setUp(self):
+        self.health = provider_health.ProviderHealth("test")
+
+    def failRequests(self, times=provider_health.FAILURE_THRESHOLD):
+        for x in range(times):
+            self.health.recordFailure("error")
+
+    def endCooldown(self):
+        self.health.open_until = time.time() - 1
+
+    def test_opens_after_failures(self):
+        self.failRequests(provider_health.FAILURE_THRESHOLD - 1)
+        self.assertEqual(self.health.state(), provider_health.CLOSED)
+        self.assertTrue(self.health.tryRequest())
+
+        self.failRequests(1)
+        self.assertEqual(self.health.state(), provider_health.OPEN)
+        self.assertFalse(self.health.canTry())
+        self.assertFalse(self.health.tryRequest())
+
+    def test_success_resets_failures(self):
+        self.failRequests(provider_health.FAILURE_THRESHOLD - 1)
+        self.health.recordSuccess(0.1)
+        self.failRequests(provider_health.FAILURE_THRESHOLD - 1)
+        self.assertEqual(self.health.state(), provider_health.CLOSED)
+
+    def test_one_probe_when_half_open(self):
+        self.failRequests()
+        self.endCooldown()
+        self.assertEqual(self.health.state(), provider_health.HALF_OPEN)
+
+        # checking doesn't take the retry
+        self.assertTrue(self.health.canTry())
+        self.assertTrue(inThread(self.health.canTry))
+
+        self.assertTrue(self.health.tryRequest())
+        # the same thread can keep using it, nobody else can
+        self.assertTrue(self.health.tryRequest())
+        self.assertFalse(inThread(self.health.tryRequest))
+        self.assertFalse(inThread(self.health.canTry))
+
+    def test_probe_success_closes(self):
+        self.failRequests()
+        self.endCooldown()
+        self.assertTrue(self.health.tryRequest())
+
+        self.health.recordSuccess(0.1)
+        self.assertEqual(self.health.state(), provider_health.CLOSED)
+        self.assertTrue(inThread(self.health.tryRequest))
+        self.assertEqual(self.health.cooldown, provider_health.COOLDOWN)
+
+    def test_probe_failure_reopens_for_longer(self):
+        self.failRequests()
+        self.endCooldown()
+        self.assertTrue(self.health.tryRequest())
+
+        self.failRequests(1)
+        self.assertEqual(self.health.state(), provider_health.OPEN)
+        self.assertEqual(self.health.cooldown, provider_health.COOLDOWN * 2)
+
+        # the next retry can go to anyone
+        self.endCooldown()
+        self.assertTrue(inThread(self.health.tryRequest))
+        self.assertFalse(self.health.tryRequest())
+
+    def test_stale_probe_handed_on(self):
+        self.failRequests()
+        self.endCooldown()
+        self.assertTrue(self.health.tryRequest())
+
+        self.health.probe_time -= provider_health.PROBE_TIMEOUT + 1
+        self.assertTrue(inThread(self.health.tryRequest))
+
+
+if __name__ == '__main__':
+    print "=================="
+    print "STARTING - PROVIDER HEALTH TESTS"
+    print "=================="
+    print "######################################################################"
+    suite = unittest.TestLoader().loadTestsFromTestCase(ProviderHealthTests)
+    unittest.TextTestRunner(verbosity=2).run(suite)
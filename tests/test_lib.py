@@ -119,9 +119,9 @@ class SickbeardTestDBCase(unittest.TestCase):
 
 class TestDBConnection(db.DBConnection, object):
 
-    def __init__(self, dbFileName=TESTDBNAME):
+    def __init__(self, dbFileName=TESTDBNAME, suffix=None, row_type=None):
         dbFileName = os.path.join(TESTDIR, dbFileName)
-        super(TestDBConnection, self).__init__(dbFileName)
+        super(TestDBConnection, self).__init__(dbFileName, suffix, row_type)
 
 
 class TestCacheDBConnection(TestDBConnection, object):
@@ -134,6 +134,7 @@ class TestCacheDBConnection(TestDBConnection, object):
             sql = "CREATE TABLE " + providerName + " (name TEXT, season NUMERIC, episodes TEXT, tvrid NUMERIC, tvdbid NUMERIC, url TEXT, time NUMERIC, quality TEXT);"
             self.connection.execute(sql)
             self.connection.commit()
+            cache_db.addProviderIndex(self, providerName)
         except sqlite3.OperationalError, e:
             if str(e) != "table " + providerName + " already exists":
                 raise
@@ -21,6 +21,7 @@ import unittest
 import test_lib as test
 
 import sickbeard
+from sickbeard import episode_cache
 from sickbeard.tv import TVEpisode, TVShow
 
 
@@ -76,6 +77,19 @@ class TVEpisodeTests(test.SickbeardTestDBCase):
         ep.loadFromDB(1, 1)
         self.assertEqual(ep.name, "asdasdasdajkaj")
 
+    def test_same_description_not_dirty(self):
+        show = TVShow(0001, "en")
+        ep = TVEpisode(show, 1, 1)
+        ep.description = "the description"
+        ep.saveToDB()
+
+        ep.loadFromDB(1, 1)
+        ep.description = "the description"
+        self.assertFalse(ep.dirty)
+
+        ep.description = "a new description"
+        self.assertTrue(ep.dirty)
+
 
 class TVTests(test.SickbeardTestDBCase):
 
@@ -97,6 +111,53 @@ class TVTests(test.SickbeardTestDBCase):
         sickbeard.showList = [show]
         #TODO: implement
 
+    def test_getAllEpisodes(self):
+        show = TVShow(0001, "en")
+        show.name = "show name"
+        show.saveToDB()
+        sickbeard.showList = [show]
+
+        myDB = test.db.DBConnection()
+        for season, episode, location in [(1, 1, "/show/s01e01e02.avi"), (1, 2, "/show/s01e01e02.avi"), (1, 3, "/show/s01e03.avi"), (2, 1, "")]:
+            myDB.action("INSERT INTO tv_episodes (showid, tvdbid, name, season, episode, description, airdate, status, location) VALUES (?,?,?,?,?,?,?,?,?)",
+                        [show.tvdbid, season * 100 + episode, "ep name", season, episode, "ep description", 1, 0, location])
+
+        ep_list = show.getAllEpisodes()
+        self.assertEqual([(x.season, x.episode) for x in ep_list], [(1, 1), (1, 2), (1, 3), (2, 1)])
+        # the description came with the row so it doesn't have to be loaded again
+        self.assertEqual(ep_list[0]._description, "ep description")
+        self.assertEqual([x.episode for x in ep_list[0].relatedEps], [2])
+        self.assertEqual([x.episode for x in ep_list[1].relatedEps], [1])
+        self.assertEqual(ep_list[2].relatedEps, [])
+
+        ep_list = show.getAllEpisodes(season=1, has_location=True)
+        self.assertEqual([(x.season, x.episode) for x in ep_list], [(1, 1), (1, 2), (1, 3)])
+
+    def test_saved_episodes_evicted(self):
+        show = TVShow(0001, "en")
+        show.saveToDB()
+        sickbeard.showList = [show]
+
+        oldCacheSize = sickbeard.EPISODE_CACHE_SIZE
+        sickbeard.EPISODE_CACHE_SIZE = 2
+        try:
+            ep = show.getEpisode(1, 1)
+            ep.name = "new name"
+            ep.saveToDB()
+            self.assertFalse(ep.dirty)
+
+            pinned = show.getEpisode(1, 2)
+            episode_cache.pinEpisode(pinned)
+            del ep
+
+            for episode in range(3, 6):
+                show.getEpisode(1, episode)
+
+            self.assertEqual(show.getEpisode(1, 1, noCreate=True), None)
+            self.assertTrue(show.getEpisode(1, 2, noCreate=True) is pinned)
+        finally:
+            sickbeard.EPISODE_CACHE_SIZE = oldCacheSize
+
 
 if __name__ == '__main__':
     print "=================="
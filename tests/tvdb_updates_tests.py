@@ -0,0 +1,164 @@
+# coding=UTF-8
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import test_lib as test
+
+import threading
+import BaseHTTPServer
+
+import sickbeard
+from sickbeard import tvdb_updates
+
+NOW = 1376920800
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# what the fixture server has in each updates file
+UPDATE_FILES = {'day': (NOW, [(80348, NOW - 2 * HOUR)], [(4587312, 80348, NOW - HOUR), (4587313, 80349, NOW - 5 * HOUR)]),
+                'week': (NOW, [(80348, NOW - 2 * HOUR), (75760, NOW - 3 * DAY)], [(4587312, 80348, NOW - HOUR), (3254641, 75760, NOW - 4 * DAY)]),
+                'month': (NOW, [(71663, NOW - 20 * DAY)], [])}
+
+
+def updatesXML(period):
+    data_time, series, episodes = UPDATE_FILES[period]
+
+    xml = '<?xml version="1.0" encoding="UTF-8" ?>\n<Data time="%d">\n' % data_time
+    for series_id, change_time in series:
+        xml += '<Series><id>%d</id><time>%d</time></Series>\n' % (series_id, change_time)
+    for episode_id, series_id, change_time in episodes:
+        xml += '<Episode><id>%d</id><Series>%d</Series><time>%d</time></Episode>\n' % (episode_id, series_id, change_time)
+    xml += '</Data>\n'
+
+    return xml
+
+
+class FixtureHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    requested = []
+
+    def do_GET(self):
+        period = self.path.rpartition('updates_')[2].replace('.xml', '')
+        FixtureHandler.requested.append(period)
+
+        if period not in UPDATE_FILES:
+            self.send_error(404)
+            return
+
+        data = updatesXML(period)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TVDBUpdatesTests(test.SickbeardTestDBCase):
+
+    def setUp(self):
+        super(TVDBUpdatesTests, self).setUp()
+
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), FixtureHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.old_base_url = sickbeard.TVDB_BASE_URL
+        sickbeard.TVDB_BASE_URL = 'http://127.0.0.1:%d/api/KEY' % self.server.server_address[1]
+        FixtureHandler.requested = []
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        sickbeard.TVDB_BASE_URL = self.old_base_url
+        super(TVDBUpdatesTests, self).tearDown()
+
+    def test_day(self):
+        updates = tvdb_updates.getUpdates(NOW - 6 * HOUR, NOW)
+
+        self.assertEqual(FixtureHandler.requested, ['day'])
+        self.assertEqual(updates.time, NOW)
+        self.assertEqual(updates.changedShows(), set([80348, 80349]))
+        self.assertEqual(updates.changedEpisodes(80348), set([4587312]))
+        self.assertEqual(updates.changedEpisodes(80349), set([4587313]))
+
+    def test_only_changes_since(self):
+        updates = tvdb_updates.getUpdates(NOW - 90 * 60, NOW)
+
+        self.assertEqual(updates.changedShows(), set([80348]))
+        self.assertEqual(updates.series, set())
+        self.assertFalse(updates.isChanged(80349))
+        self.assertEqual(updates.changedEpisodes(80349), set())
+
+    def test_week(self):
+        updates = tvdb_updates.getUpdates(NOW - 5 * DAY, NOW)
+
+        self.assertEqual(FixtureHandler.requested, ['week'])
+        self.assertEqual(updates.changedShows(), set([80348, 75760]))
+        self.assertEqual(updates.changedEpisodes(75760), set([3254641]))
+
+    def test_clock_skew(self):
+        # TVDB's clock is 4 hours ahead so its day file doesn't go back to 23 hours ago
+        UPDATE_FILES['day'] = (NOW + 4 * HOUR,) + UPDATE_FILES['day'][1:]
+        try:
+            updates = tvdb_updates.getUpdates(NOW - 23 * HOUR, NOW)
+        finally:
+            UPDATE_FILES['day'] = (NOW,) + UPDATE_FILES['day'][1:]
+
+        self.assertEqual(FixtureHandler.requested, ['day', 'week'])
+        self.assertTrue(updates.isChanged(80348))
+
+    def test_too_old(self):
+        self.assertEqual(tvdb_updates.getUpdates(0, NOW), None)
+        self.assertEqual(tvdb_updates.getUpdates(NOW - 60 * DAY, NOW), None)
+        self.assertEqual(FixtureHandler.requested, [])
+
+    def test_unavailable(self):
+        sickbeard.TVDB_BASE_URL = 'http://127.0.0.1:%d/missing/' % self.server.server_address[1]
+        day_file = UPDATE_FILES.pop('day')
+        try:
+            self.assertEqual(tvdb_updates.getUpdates(NOW - HOUR, NOW), None)
+        finally:
+            UPDATE_FILES['day'] = day_file
+
+    def test_last_update(self):
+        self.assertEqual(tvdb_updates.getLastUpdate(), 0)
+        tvdb_updates.setLastUpdate(NOW)
+        self.assertEqual(tvdb_updates.getLastUpdate(), NOW)
+        tvdb_updates.setLastUpdate(NOW + DAY)
+        self.assertEqual(tvdb_updates.getLastUpdate(), NOW + DAY)
+
+    def test_rewind_last_update(self):
+        tvdb_updates.setLastUpdate(NOW)
+        tvdb_updates.rewindLastUpdate(NOW - DAY)
+        self.assertEqual(tvdb_updates.getLastUpdate(), NOW - DAY)
+        # it only ever goes back
+        tvdb_updates.rewindLastUpdate(NOW)
+        self.assertEqual(tvdb_updates.getLastUpdate(), NOW - DAY)
+
+
+if __name__ == '__main__':
+    print "=================="
+    print "STARTING - TVDB UPDATES TESTS"
+    print "=================="
+    print "######################################################################"
+    suite = unittest.TestLoader().loadTestsFromTestCase(TVDBUpdatesTests)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,77 @@
+# coding=UTF-8
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import unittest
+import test_lib as test
+
+try:
+    import Cheetah
+    if Cheetah.Version[0] != '2':
+        raise ValueError
+except (ImportError, ValueError):
+    import Cheetah_local
+    sys.modules['Cheetah'] = Cheetah_local
+
+from sickbeard import db, webserve, webapi
+from sickbeard.common import WANTED
+
+
+class EpisodesPagingTests(test.SickbeardTestDBCase):
+
+    def setUp(self):
+        super(EpisodesPagingTests, self).setUp()
+
+        myDB = db.DBConnection()
+        for curEp in range(1, 6):
+            # episodes saved before last_modified was added, the upgrade gives them 0
+            myDB.action("INSERT INTO tv_episodes (showid, tvdbid, name, season, episode, description, airdate, hasnfo, hastbn, status, location, file_size, release_name, last_modified) \
+                         VALUES (1, ?, ?, 1, ?, '', 1, 0, 0, ?, '', 0, '', 0)", [100 + curEp, "Episode %d" % curEp, curEp, WANTED])
+        myDB.action("INSERT INTO tv_episodes (showid, tvdbid, name, season, episode, description, airdate, hasnfo, hastbn, status, location, file_size, release_name, last_modified) \
+                     VALUES (1, 106, 'Episode 6', 1, 6, '', 1, 0, 0, ?, '', 0, '', 1000)", [WANTED])
+
+    def _page(self, **kwargs):
+        return webapi.CMD_Episodes((), kwargs).run()["data"]
+
+    def test_pages_through_episodes_with_same_last_modified(self):
+        names = []
+        cursor = None
+        while True:
+            if cursor:
+                page = self._page(limit="2", cursor=cursor)
+            else:
+                page = self._page(limit="2")
+            names += [x["name"] for x in page["episodes"]]
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+
+        self.assertEqual(names, ["Episode %d" % x for x in range(1, 7)])
+
+    def test_since(self):
+        self.assertEqual(len(self._page(since="0")["episodes"]), 6)
+        self.assertEqual([x["name"] for x in self._page(since="500")["episodes"]], ["Episode 6"])
+
+
+if __name__ == '__main__':
+    print "=================="
+    print "STARTING - WEBAPI TESTS"
+    print "=================="
+    print "######################################################################"
+    suite = unittest.TestLoader().loadTestsFromTestCase(EpisodesPagingTests)
+    unittest.TextTestRunner(verbosity=2).run(suite)
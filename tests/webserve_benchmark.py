@@ -0,0 +1,107 @@
+# coding=UTF-8
+# URL: http://code.google.com/p/sickbeard/
+#
+# This file is part of Sick Beard.
+#
+# Sick Beard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Sick Beard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Sick Beard.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Times rendering the home, displayShow and comingEpisodes pages against a test database.
+
+Run it from the tests dir: python webserve_benchmark.py [shows] [episodes per show] [requests]
+"""
+
+import sys
+import time
+import datetime
+
+import test_lib as test
+
+try:
+    import Cheetah
+    if Cheetah.Version[0] != '2':
+        raise ValueError
+except (ImportError, ValueError):
+    import Cheetah_local
+    sys.modules['Cheetah'] = Cheetah_local
+
+import cherrypy
+
+import sickbeard
+from sickbeard import db, webserve, scheduler, show_queue, search_queue, searchCurrent, searchBacklog
+from sickbeard.tv import TVShow
+from sickbeard.common import WANTED, SKIPPED, DOWNLOADED, Quality
+
+
+def createShows(shows, episodes):
+    myDB = db.DBConnection()
+    today = datetime.date.today().toordinal()
+
+    for curShow in range(shows):
+        tvdb_id = 1000 + curShow
+        myDB.action("INSERT INTO tv_shows (tvdb_id, show_name, location, network, genre, runtime, quality, airs, status, flatten_folders, paused, startyear, tvr_id, tvr_name, air_by_date, lang) \
+                     VALUES (?,?,?,'Network','|Drama|',60,?,'Monday 9:00 PM','Continuing',0,0,2010,0,'',0,'en')",
+                    [tvdb_id, "Show Name %d" % curShow, test.SHOWDIR, Quality.combineQualities([Quality.SDTV], [])])
+
+        queries = []
+        for curEp in range(episodes):
+            season, episode = curEp / 20 + 1, curEp % 20 + 1
+            status = (DOWNLOADED, WANTED, SKIPPED)[curEp % 3]
+            queries.append(["INSERT INTO tv_episodes (showid, tvdbid, name, season, episode, description, airdate, hasnfo, hastbn, status, location, file_size, release_name) \
+                             VALUES (?,?,?,?,?,'',?,0,0,?,'',0,'')",
+                            [tvdb_id, tvdb_id * 1000 + curEp, "Episode %d" % curEp, season, episode, today - episodes + curEp + 3, status]])
+        myDB.mass_action(queries)
+
+        sickbeard.showList.append(TVShow(tvdb_id))
+
+def timePage(name, page, requests):
+    start = time.time()
+    page()
+    first = time.time() - start
+
+    start = time.time()
+    for x in range(requests):
+        page()
+    after = (time.time() - start) / requests
+
+    print "%-16s first request %7.1fms, after that %7.1fms" % (name, first * 1000, after * 1000)
+
+def main(shows=50, episodes=100, requests=20):
+    test.setUp_test_db()
+    sickbeard.showList = []
+    createShows(shows, episodes)
+
+    # the bits of config and state the pages use which initialize() would normally set up
+    cherrypy.request.headers = {'Host': 'localhost:8081'}
+    sickbeard.ANON_REDIRECT = ''
+    sickbeard.COMING_EPS_LAYOUT = 'banner'
+    sickbeard.COMING_EPS_SORT = 'date'
+    sickbeard.showQueueScheduler = scheduler.Scheduler(show_queue.ShowQueue())
+    sickbeard.searchQueueScheduler = scheduler.Scheduler(search_queue.SearchQueue())
+    sickbeard.currentSearchScheduler = scheduler.Scheduler(searchCurrent.CurrentSearcher())
+    sickbeard.backlogSearchScheduler = searchBacklog.BacklogSearchScheduler(searchBacklog.BacklogSearcher())
+
+    home = webserve.Home()
+    interface = webserve.WebInterface()
+
+    print "%d shows with %d episodes each, %d requests per page" % (shows, episodes, requests)
+    timePage("home", home.index, requests)
+    timePage("displayShow", lambda: home.displayShow(show=str(sickbeard.showList[0].tvdbid)), requests)
+    timePage("comingEpisodes", interface.comingEpisodes, requests)
+
+    test.tearDown_test_db()
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])